@@ -32,6 +32,19 @@ class DefaultConfig:
     # ReCAR parameters
     RECAR_ENABLED = True  # Enable ReCAR
     NAVIGATOR_ENABLED = True  # Enable navigator echo for respiratory gating
+    NAVIGATOR_INTERVAL = 0  # k-space lines between navigators (0: one navigator at the start)
+    GATING_WINDOW = (0.0, 0.25)  # Accepted respiratory positions for conventional gating
+    RECAR_WINDOW = (0.0, 0.6)  # Accepted respiratory positions for ReCAR
+    
+    # Raw data labels
+    ADC_LABELS = True  # Label every ADC with LIN/PAR/PHS/SET/NAV
+    
+    # Block scheduling
+    BLOCK_FUSION = False  # Overlap the events of a TR in as few blocks as possible
+    
+    # Artifact cache of built sequences
+    CACHE_DIR = 'output/cache'  # Cache directory
+    CACHE_MAX_SIZE = 2 * 1024**3  # Maximum cache size [bytes]
     
     # Sequence name
     NAME = '4D_flow_CS_ReCAR'
\ No newline at end of file
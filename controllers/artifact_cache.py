@@ -0,0 +1,240 @@
+"""Content-addressed on-disk cache of built sequences."""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Packages whose source determines the built sequence
+_SOURCE_DIRS = ('config', 'controllers', 'models', 'utils')
+
+@lru_cache(maxsize=1)
+def code_version():
+    """
+    Hash the source code that the built sequence depends on
+
+    Returns:
+    --------
+    version : str
+        SHA-256 hex digest of the project sources and the pypulseq version
+    """
+    import pypulseq
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256(getattr(pypulseq, '__version__', '').encode())
+    for directory in _SOURCE_DIRS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, directory)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    path = os.path.join(dirpath, filename)
+                    digest.update(os.path.relpath(path, root).encode())
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+    return digest.hexdigest()
+
+def artifact_key(params, system, mask_seed=None):
+    """
+    Compute the cache key of a built sequence
+
+    Parameters:
+    -----------
+    params : SequenceParams
+        Sequence parameters
+    system : Opts
+        System limits
+    mask_seed : int, optional
+        Seed of the sampling mask, for randomized patterns
+
+    Returns:
+    --------
+    key : str
+        SHA-256 hex digest of the parameters, system limits, mask seed and
+        code version
+    """
+    limits = {name: value for name, value in sorted(vars(system).items())}
+    text = json.dumps({
+        'params': params.content_hash,
+        'system': limits,
+        'mask_seed': mask_seed,
+        'code': code_version(),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ArtifactCache:
+    """
+    Size-bounded LRU cache of exported sequences
+
+    Every entry is a directory named after its key holding the exported
+    sequence.seq, the sampling mask (mask.npy), the ReCAR order
+    (order.npy) and meta.json. The directory modification time records
+    the last use; the least recently used entries are removed once the
+    cache grows past max_size. Temporary directories left behind by an
+    interrupted put() count towards the size and are removed by evict()
+    once they are older than tmp_max_age.
+    """
+    def __init__(self, cache_dir, max_size=2 * 1024**3, tmp_max_age=3600):
+        """
+        Initialize the cache
+
+        Parameters:
+        -----------
+        cache_dir : str
+            Cache directory, created if missing
+        max_size : int
+            Maximum total size of the cache in bytes
+        tmp_max_age : float
+            Age in seconds after which an unfinished put() is assumed dead
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.tmp_max_age = tmp_max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Look up a cached sequence
+
+        Parameters:
+        -----------
+        key : str
+            Cache key from artifact_key
+
+        Returns:
+        --------
+        entry : dict or None
+            'seq' : path of the cached .seq file
+            'mask' : sampling mask
+            'order' : sampling order as an (n, 3) array
+            'meta' : metadata stored with the entry
+            None on a cache miss
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return None
+
+        # Mark as most recently used
+        os.utime(entry_dir)
+
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            meta = json.load(f)
+
+        return {
+            'seq': os.path.join(entry_dir, 'sequence.seq'),
+            'mask': np.load(os.path.join(entry_dir, 'mask.npy')),
+            'order': np.load(os.path.join(entry_dir, 'order.npy')),
+            'meta': meta,
+        }
+
+    def put(self, key, seq, mask, order, meta=None):
+        """
+        Store a built sequence
+
+        The entry is written to a temporary directory and renamed into
+        place, so concurrent readers never see a partial entry.
+
+        Parameters:
+        -----------
+        key : str
+            Cache key from artifact_key
+        seq : Sequence
+            Built sequence
+        mask : ndarray
+            Sampling mask
+        order : list or ndarray
+            Sampling order of (phase_idx, slice_idx, cardiac_phase)
+        meta : dict, optional
+            Additional JSON-serializable metadata
+
+        Returns:
+        --------
+        entry : dict
+            The stored entry, as returned by get
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = os.path.join(self.cache_dir, f'.tmp-{key}-{os.getpid()}')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        seq.write(os.path.join(tmp_dir, 'sequence.seq'))
+        np.save(os.path.join(tmp_dir, 'mask.npy'), np.asarray(mask))
+        np.save(os.path.join(tmp_dir, 'order.npy'), np.asarray(order, dtype=np.int32).reshape(-1, 3))
+
+        meta = dict(meta or {})
+        meta['created'] = time.time()
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=key)
+        return self.get(key)
+
+    def size(self):
+        """Return the total size of the cache in bytes"""
+        return sum(size for _, _, size in self._entries() + self._tmp_dirs())
+
+    def _listing(self, tmp):
+        """List (mtime, name, size) of the entry or temporary directories"""
+        listing = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.tmp-') != tmp or not os.path.isdir(path):
+                continue
+            if not tmp and name.startswith('.'):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                listing.append((os.stat(path).st_mtime, name, size))
+            except FileNotFoundError:
+                # Renamed or removed by another process meanwhile
+                continue
+        return listing
+
+    def _entries(self):
+        """List (mtime, key, size) of every cache entry"""
+        return self._listing(tmp=False)
+
+    def _tmp_dirs(self):
+        """List (mtime, name, size) of every temporary put() directory"""
+        return self._listing(tmp=True)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits max_size
+
+        Temporary directories older than tmp_max_age are removed first;
+        younger ones may belong to a put() in progress and are only counted.
+
+        Parameters:
+        -----------
+        keep : str, optional
+            Key that must not be evicted
+        """
+        total = 0
+        now = time.time()
+        for mtime, name, size in self._tmp_dirs():
+            if now - mtime > self.tmp_max_age:
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            else:
+                total += size
+
+        entries = sorted(self._entries())
+        total += sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
@@ -0,0 +1,139 @@
+"""Fuse the blocks of a TR into the fewest blocks allowed by channel and timing constraints."""
+
+import copy
+
+import numpy as np
+from pypulseq.calc_duration import calc_duration
+from pypulseq.make_delay import make_delay
+
+from utils.pulseq_utils import echo_time
+
+# Blocks whose events must keep their relative timing and that wait for
+# every earlier event to finish
+BARRIER_ROLES = ('excitation', 'readout')
+
+# Blocks played as late as possible, ending where the readout starts
+PREPHASE_ROLES = ('phase_encode',)
+
+# Blocks that only pad time; their timing is recomputed from TE and TR
+DELAY_ROLES = ('te_delay', 'tr_delay')
+
+def event_channels(event):
+    """
+    Return the hardware channels an event occupies
+
+    Parameters:
+    -----------
+    event : SimpleNamespace
+        Sequence event
+
+    Returns:
+    --------
+    channels : set
+        Subset of 'rf', 'x', 'y', 'z' and 'adc'; empty for delays
+    """
+    if event.type in ('trap', 'grad'):
+        return {event.channel}
+    if event.type in ('rf', 'adc'):
+        return {event.type}
+    return set()
+
+def _scheduling_units(blocks):
+    """Return the (role, events) units of the TR blocks, dropping delay blocks"""
+    return [(role, tuple(events)) for role, events in blocks if role not in DELAY_ROLES]
+
+def _to_raster(t, raster):
+    """Round a time up to the raster, ignoring floating point noise"""
+    return np.ceil(round(t / raster, 6)) * raster
+
+def _shift(event, offset):
+    """Return a copy of an event delayed by offset seconds"""
+    if offset == 0:
+        return event
+    event = copy.copy(event)
+    event.delay = event.delay + offset
+    return event
+
+def fuse_tr_blocks(blocks, system, te, tr):
+    """
+    Pack the events of one TR into the fewest sequence blocks
+
+    Events are scheduled as soon as possible in TR order: each unit starts
+    after the last earlier unit on any of its channels, after the last
+    barrier (excitation, readout), and barriers start after everything
+    before them. A unit joins the current block when none of its channels
+    is used there, otherwise a new block starts where the current one
+    ends. The readout is placed so that the centre of the ADC is no
+    earlier than TE from the start of the TR, the phase encoding block
+    ends no earlier than the readout starts, and the last block is padded
+    to TR. The TE and TR delay blocks are replaced by these constraints.
+
+    Parameters:
+    -----------
+    blocks : list
+        (role, events) tuples of one TR, in the order they would be played
+    system : Opts
+        System limits
+    te : float
+        Echo time in seconds, measured from the start of the TR
+    tr : float
+        Repetition time in seconds; the TR is lengthened if the events do
+        not fit
+
+    Returns:
+    --------
+    fused : list
+        (role, events) tuples of the fused blocks. role joins the roles of
+        the merged blocks with '+'.
+    """
+    raster = system.grad_raster_time
+    # Start of the readout that puts the centre of the ADC at TE
+    readout_start = max(te - echo_time([events]) for role, events in blocks if role == 'readout')
+
+    channel_end = {}   # End time of the last unit on each channel
+    barrier_end = 0    # End time of the last barrier
+    all_end = 0        # End time of every unit so far
+
+    fused = []         # [start, end, channels, roles, events]
+    for role, events in _scheduling_units(blocks):
+        channels = set().union(*(event_channels(event) for event in events))
+        duration = calc_duration(*events)
+
+        earliest = max([barrier_end] + [channel_end.get(channel, 0) for channel in channels])
+        if role in BARRIER_ROLES:
+            earliest = all_end
+        if role == 'readout':
+            earliest = max(earliest, readout_start)
+        elif role in PREPHASE_ROLES:
+            # Keep the prephaser and phase encodes next to the readout, so
+            # their first moment at the echo does not depend on how early
+            # the flow encoding finishes
+            earliest = max(earliest, readout_start - duration)
+
+        current = fused[-1] if fused else None
+        if current is None or current[2] & channels:
+            block_start = current[1] if current else 0
+            current = [block_start, block_start, set(), [], []]
+            fused.append(current)
+        # Gradient delays within the block must lie on the raster
+        start = current[0] + _to_raster(max(earliest - current[0], 0), raster)
+        end = start + duration
+
+        current[1] = max(current[1], end)
+        current[2] |= channels
+        if role not in current[3]:
+            current[3].append(role)
+        current[4].extend(_shift(event, start - current[0]) for event in events)
+
+        for channel in channels:
+            channel_end[channel] = end
+        all_end = max(all_end, end)
+        if role in BARRIER_ROLES:
+            barrier_end = end
+
+    # Pad the last block to the repetition time
+    last = fused[-1]
+    if tr > last[1]:
+        last[4].append(make_delay(_to_raster(tr - last[0], raster)))
+
+    return [('+'.join(roles), tuple(events)) for _, _, _, roles, events in fused]
@@ -0,0 +1,216 @@
+"""Dependency-tracked incremental sequence builds."""
+
+import numpy as np
+from pypulseq.Sequence.sequence import Sequence
+
+from controllers.sequence_builder import SequenceBuilder
+from utils.pulseq_utils import register_block_events, pypulseq_internals_supported
+
+# Parameters that change the block timing or count directly
+BLOCK_PARAMS = ('tr', 'te', 'navigator_enabled', 'navigator_interval', 'block_fusion', 'adc_labels')
+
+# Build stages in dependency order: (name, parameters read, input stages)
+STAGES = [
+    ('mask', ('matrix_size', 'acceleration_factor', 'center_fraction', 'calib_size'), ()),
+    ('order', ('n_cardiac_phases',), ('mask',)),
+    ('templates', ('fov', 'matrix_size', 't_rf', 't_readout', 'venc', 'vencs',
+                   'flow_directions', 'encoding_scheme', 'flip_angle'), ()),
+    ('blocks', BLOCK_PARAMS, ('order', 'templates')),
+    ('export', ('fov', 'matrix_size', 'venc', 'vencs'), ('blocks',)),
+]
+
+class BuildGraph:
+    """
+    Incremental builder: params -> mask -> order -> event templates ->
+    block table -> export
+
+    Every call to build() compares the new parameters with the previous
+    ones and recomputes only the invalidated stages. When only event
+    templates changed (e.g. venc or flip_angle) and the TR block layout
+    is unchanged, the block table is patched in place by swapping the
+    library IDs of the changed events instead of being rebuilt. The old
+    events remain in the sequence libraries. Patching writes to pypulseq's
+    private block table, so with any pypulseq other than the pinned
+    release the table is always rebuilt.
+    """
+    def __init__(self, system):
+        """
+        Initialize the build graph
+
+        Parameters:
+        -----------
+        system : Opts
+            System limits
+        """
+        self.system = system
+        self.params = None
+        self.builder = None
+        self.last_run = []  # Stages recomputed by the last build
+        self._layout = None
+        self._tr_starts = None
+        self._tr_encodings = None
+        self._exported = {}
+
+    def invalidated(self, params):
+        """
+        Find the stages invalidated by new parameters
+
+        Parameters:
+        -----------
+        params : SequenceParams
+            New sequence parameters
+
+        Returns:
+        --------
+        stages : list
+            Names of the stages to recompute, in dependency order
+        """
+        if self.params is None:
+            return [name for name, _, _ in STAGES]
+
+        changed = self._changed(params)
+        stale = []
+        for name, keys, inputs in STAGES:
+            if changed.intersection(keys) or any(stage in stale for stage in inputs):
+                stale.append(name)
+        return stale
+
+    def _changed(self, params):
+        """Return the names of the parameters that differ from the last build"""
+        return {key for key, value in params.as_dict().items()
+                if getattr(self.params, key) != value}
+
+    def build(self, params):
+        """
+        Bring the sequence up to date with the parameters
+
+        Parameters:
+        -----------
+        params : SequenceParams
+            Sequence parameters
+
+        Returns:
+        --------
+        seq : Sequence
+            Up-to-date sequence object
+        """
+        stale = self.invalidated(params)
+        changed = self._changed(params) if self.params is not None else set()
+        previous = self.params
+        self.last_run = list(stale)
+
+        if self.builder is None:
+            self.builder = SequenceBuilder(params, self.system)
+        elif stale:
+            self.builder.update_params(params, stale)
+        self.params = params
+
+        if 'blocks' in stale:
+            # Only template changes can be patched into the existing table
+            patched = False
+            if 'order' not in stale and not changed.intersection(BLOCK_PARAMS):
+                patched = self._patch_block_table(previous)
+            if patched:
+                self.last_run[self.last_run.index('blocks')] = 'blocks (patched)'
+            else:
+                self._build_block_table()
+
+        if 'export' in stale:
+            self.builder.set_definitions()
+            self._exported = {}
+
+        return self.builder.seq
+
+    def _build_block_table(self):
+        """Rebuild the block table from scratch and record its layout"""
+        self.builder.seq = Sequence(self.system)
+        self.builder.build_sequence()
+        self._record_layout()
+
+    def _layout_ids(self):
+        """Per flow encoding, the (role, duration, event IDs) of each TR block"""
+        layout = []
+        for blocks in self.builder.tr_layout():
+            layout.append([(role, duration, register_block_events(self.builder.seq, *events))
+                           for role, events, duration in blocks])
+        return layout
+
+    def _record_layout(self):
+        """Record the TR layout and the first block index of every TR"""
+        if not pypulseq_internals_supported():
+            self._layout = None
+            return
+        self._layout = self._layout_ids()
+
+        n_lines = len(self.builder.recar.get_sampling_order())
+        lengths = np.tile([len(blocks) for blocks in self._layout], n_lines)
+        self._tr_encodings = np.tile(np.arange(len(self._layout)), n_lines)
+        self._tr_starts = 1 + np.cumsum(lengths) - lengths
+
+        # Shift every TR by the navigator blocks played before its line
+        if self.params.navigator_enabled:
+            n_nav = len(self.builder.recar.navigator_blocks(self.system))
+            nav_lines = self.builder.recar.navigator_lines(self.params.navigator_interval)
+            n_before = np.searchsorted(nav_lines, np.arange(n_lines), side='right')
+            self._tr_starts += n_nav * np.repeat(n_before, len(self._layout))
+
+    def _patch_block_table(self, previous):
+        """
+        Patch changed template events into the existing block table
+
+        Parameters:
+        -----------
+        previous : SequenceParams
+            Parameters the block table was built with
+
+        Returns:
+        --------
+        patched : bool
+            False if the TR layout changed and the table must be rebuilt
+        """
+        if self._layout is None:
+            return False
+        # Phase encoding gradients are not templates
+        if previous.fov != self.params.fov or previous.matrix_size != self.params.matrix_size:
+            return False
+
+        layout = self._layout_ids()
+        if len(layout) != len(self._layout):
+            return False
+        for old_blocks, new_blocks in zip(self._layout, layout):
+            if [(role, round(duration, 9)) for role, duration, _ in old_blocks] != \
+                    [(role, round(duration, 9)) for role, duration, _ in new_blocks]:
+                return False
+
+        block_events = self.builder.seq.dict_block_events
+        for encoding, (old_blocks, new_blocks) in enumerate(zip(self._layout, layout)):
+            tr_starts = self._tr_starts[self._tr_encodings == encoding]
+            for position, ((_, _, old_ids), (_, _, new_ids)) in enumerate(zip(old_blocks, new_blocks)):
+                columns = np.nonzero(old_ids != new_ids)[0]
+                if len(columns) == 0:
+                    continue
+                for block_index in (tr_starts + position).tolist():
+                    block_events[block_index][columns] = new_ids[columns]
+
+        self._layout = layout
+        return True
+
+    def export(self, filename):
+        """
+        Export the sequence, skipping the write if it is already up to date
+
+        Parameters:
+        -----------
+        filename : str
+            Filename for the output sequence file
+
+        Returns:
+        --------
+        written : bool
+            True if the file was written
+        """
+        if self._exported.get(filename):
+            return False
+        self.builder.seq.write(filename)
+        self._exported[filename] = True
+        return True
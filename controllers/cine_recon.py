@@ -0,0 +1,256 @@
+"""Warm-started, checkpointed compressed sensing reconstruction of cine flow data."""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from models.parallel_imaging import sense_cs_recon
+
+WARM_STARTS = (None, 'phase', 'encoding')
+
+def recon_fingerprint(kspace, maps, mask, settings):
+    """
+    Identify a reconstruction by its data and settings
+
+    Parameters:
+    -----------
+    kspace : ndarray
+        k-space being reconstructed
+    maps : ndarray
+        Coil sensitivities
+    mask : ndarray
+        Sampling mask
+    settings : dict
+        JSON-serializable reconstruction settings
+
+    Returns:
+    --------
+    fingerprint : str
+        SHA-256 hex digest
+    """
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for array in (kspace, maps, mask):
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+class ReconCheckpoint:
+    """
+    On-disk checkpoint of a cine reconstruction
+
+    Every finished frame (flow encoding, cardiac phase) is stored in its
+    own file, and the iterate of the frame in progress is stored every few
+    iterations. Files are written under a temporary name and renamed into
+    place, so an interrupted write never leaves a partial checkpoint. The
+    fingerprint of the data and settings is kept in meta.json; a
+    checkpoint of another reconstruction is never resumed.
+
+    Only the iterate is stored, not the FISTA momentum (the step size t
+    and the previous iterate), so a resumed frame restarts the momentum
+    from the stored image. It converges to the same solution, but can
+    take a few more iterations than an uninterrupted run.
+    """
+    def __init__(self, directory, fingerprint):
+        """
+        Open or create a checkpoint
+
+        Parameters:
+        -----------
+        directory : str
+            Checkpoint directory
+        fingerprint : str
+            Fingerprint of the reconstruction, see recon_fingerprint
+
+        Raises:
+        -------
+        ValueError
+            If the directory holds the checkpoint of another reconstruction
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_file = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                stored = json.load(f).get('fingerprint')
+            if stored != fingerprint:
+                raise ValueError(f"Checkpoint directory '{directory}' belongs to another reconstruction")
+        else:
+            self._write('meta.json', lambda f: f.write(json.dumps({'fingerprint': fingerprint}).encode()))
+
+    def _write(self, name, write):
+        """Write a file through a temporary name"""
+        path = os.path.join(self.directory, name)
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _load(self, name):
+        """Load an npz file, None if missing"""
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as stored:
+            return stored['image'], int(stored['iterations'])
+
+    def frame(self, encoding, phase):
+        """
+        Load a finished frame
+
+        Returns:
+        --------
+        frame : tuple or None
+            (image, iterations), None if the frame is not finished
+        """
+        return self._load(f'frame-{encoding}-{phase}.npz')
+
+    def save_frame(self, encoding, phase, image, iterations):
+        """Store a finished frame and drop its iterate"""
+        self._write(f'frame-{encoding}-{phase}.npz', lambda f: np.savez(f, image=image, iterations=iterations))
+        iterate_file = os.path.join(self.directory, f'iterate-{encoding}-{phase}.npz')
+        if os.path.exists(iterate_file):
+            os.remove(iterate_file)
+
+    def iterate(self, encoding, phase):
+        """
+        Load the iterate of an unfinished frame
+
+        Returns:
+        --------
+        iterate : tuple or None
+            (image, iterations run), None if the frame was not started
+        """
+        return self._load(f'iterate-{encoding}-{phase}.npz')
+
+    def save_iterate(self, encoding, phase, image, iterations):
+        """Store the iterate of the frame in progress"""
+        self._write(f'iterate-{encoding}-{phase}.npz', lambda f: np.savez(f, image=image, iterations=iterations))
+
+def _checkpoint_callback(checkpoint, encoding, phase, done, every):
+    """sense_cs_recon callback saving the iterate of a frame every few iterations"""
+    def callback(iteration, image):
+        if (iteration + 1) % every == 0:
+            checkpoint.save_iterate(encoding, phase, image, done + iteration + 1)
+    return callback
+
+def reconstruct_cine(kspace, maps, mask, lam=0.01, n_iter=100, tol=3e-3, residual_tol=0.0,
+                     warm_start='encoding', reference_encoding=0, checkpoint_dir=None, checkpoint_every=10,
+                     transform=None, workers=-1):
+    """
+    Reconstruct every flow encoding and cardiac phase with early-stopping SENSE-CS
+
+    Frames are reconstructed one at a time with sense_cs_recon, which
+    stops once the relative change falls below tol (or the data residual
+    below residual_tol) instead of running n_iter iterations. Neighbouring
+    frames differ little, so each frame starts from one already
+    reconstructed:
+    'phase': the previous cardiac phase of the same encoding
+    'encoding': the same phase of the reference encoding; the reference
+    encoding itself starts from its previous phase
+    None: the zero-filled image (cold start)
+
+    With a checkpoint_dir, finished frames and the running iterate are
+    saved to disk, and a reconstruction interrupted for any reason
+    resumes where it stopped when called again with the same data, coil
+    sensitivities and settings. An unfinished frame continues from its
+    last stored iterate with the FISTA momentum restarted. A custom
+    transform cannot be identified on disk, so it cannot be combined with
+    a checkpoint.
+
+    Parameters:
+    -----------
+    kspace : ndarray
+        Zero-filled k-space (n_encodings, n_phases, n_coils, n_kz, n_ky,
+        n_kx)
+    maps : ndarray
+        Coil sensitivities (n_coils, n_z, n_y, n_x)
+    mask : ndarray
+        Sampling mask (n_kz, n_ky), e.g. from generate_phyllotaxis_sampling
+        transposed, or one per cardiac phase (n_phases, n_kz, n_ky)
+    lam : float
+        Regularization weight, see sense_cs_recon
+    n_iter : int
+        Largest number of iterations per frame
+    tol : float
+        Relative change at which a frame has converged
+    residual_tol : float
+        Relative data residual at which a frame has converged, 0 to disable
+    warm_start : str or None
+        'phase', 'encoding' or None
+    reference_encoding : int
+        Encoding reconstructed first, e.g. the reference (velocity
+        compensated) encoding
+    checkpoint_dir : str, optional
+        Checkpoint directory; nothing is saved if None
+    checkpoint_every : int
+        Iterations between iterate checkpoints
+    transform : tuple of callable, optional
+        (forward, inverse) sparsifying transform, see sense_cs_recon
+    workers : int
+        FFT worker threads, -1 for all CPUs
+
+    Returns:
+    --------
+    images : ndarray
+        complex64 images (n_encodings, n_phases, n_z, n_y, n_x)
+    info : dict
+        'iterations' : (n_encodings, n_phases) iterations per frame
+        'resumed' : (n_encodings, n_phases) True for frames loaded from
+        the checkpoint
+
+    Raises:
+    -------
+    ValueError
+        If warm_start is unknown, or a checkpoint_dir is given with a
+        custom transform
+    """
+    if warm_start not in WARM_STARTS:
+        raise ValueError(f"Unknown warm start '{warm_start}', expected one of {WARM_STARTS}")
+    if checkpoint_dir is not None and transform is not None:
+        raise ValueError("Cannot checkpoint a reconstruction with a custom transform")
+    n_encodings, n_phases = kspace.shape[:2]
+    mask = np.asarray(mask, dtype=bool)
+
+    checkpoint = None
+    if checkpoint_dir is not None:
+        settings = {'lam': lam, 'n_iter': n_iter, 'tol': tol, 'residual_tol': residual_tol,
+                    'warm_start': warm_start, 'reference_encoding': reference_encoding}
+        checkpoint = ReconCheckpoint(checkpoint_dir, recon_fingerprint(kspace, maps, mask, settings))
+
+    images = np.zeros((n_encodings, n_phases) + tuple(maps.shape[1:]), dtype=np.complex64)
+    iterations = np.zeros((n_encodings, n_phases), dtype=int)
+    resumed = np.zeros((n_encodings, n_phases), dtype=bool)
+    encodings = [reference_encoding] + [e for e in range(n_encodings) if e != reference_encoding]
+    for encoding in encodings:
+        for phase in range(n_phases):
+            stored = checkpoint.frame(encoding, phase) if checkpoint is not None else None
+            if stored is not None:
+                images[encoding, phase], iterations[encoding, phase] = stored
+                resumed[encoding, phase] = True
+                continue
+
+            x0 = None
+            if warm_start == 'encoding' and encoding != reference_encoding:
+                x0 = images[reference_encoding, phase]
+            elif warm_start is not None and phase > 0:
+                x0 = images[encoding, phase - 1]
+
+            done, callback = 0, None
+            if checkpoint is not None:
+                iterate = checkpoint.iterate(encoding, phase)
+                if iterate is not None:
+                    x0, done = iterate
+                callback = _checkpoint_callback(checkpoint, encoding, phase, done, checkpoint_every)
+
+            frame_mask = mask[phase] if mask.ndim == 3 else mask
+            image, frame_info = sense_cs_recon(kspace[encoding, phase], maps, frame_mask, lam, n_iter - done,
+                                               transform, workers, x0=x0, tol=tol, residual_tol=residual_tol,
+                                               callback=callback, return_info=True)
+            images[encoding, phase] = image
+            iterations[encoding, phase] = done + frame_info['iterations']
+            if checkpoint is not None:
+                checkpoint.save_frame(encoding, phase, image, iterations[encoding, phase])
+    return images, {'iterations': iterations, 'resumed': resumed}
@@ -1,5 +1,9 @@
 """Export functionality for the 4D flow MRI sequence."""
 
+import filecmp
+import os
+import shutil
+
 from pypulseq.Sequence.sequence import Sequence
 
 def export_sequence(seq, filename):
@@ -14,4 +18,24 @@ def export_sequence(seq, filename):
         Filename for the output sequence file
     """
     seq.write(filename)
-    print(f"Sequence successfully exported to {filename}")
\ No newline at end of file
+    print(f"Sequence successfully exported to {filename}")
+
+def export_cached_sequence(cached_filename, filename):
+    """
+    Export a sequence file from the artifact cache.
+    
+    The file is only copied when the existing output differs, so an
+    unchanged protocol does not rewrite the output.
+    
+    Parameters:
+    -----------
+    cached_filename : str
+        Path of the cached sequence file
+    filename : str
+        Filename for the output sequence file
+    """
+    if os.path.exists(filename) and filecmp.cmp(cached_filename, filename, shallow=False):
+        print(f"Sequence {filename} is up to date")
+        return
+    shutil.copyfile(cached_filename, filename)
+    print(f"Sequence successfully exported to {filename} (cached)")
\ No newline at end of file
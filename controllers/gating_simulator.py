@@ -0,0 +1,195 @@
+"""Respiratory gating efficiency of conventional gating and ReCAR on recorded or synthetic breathing."""
+
+import numpy as np
+from pypulseq.calc_duration import calc_duration
+
+STRATEGIES = ('gating', 'recar')
+
+def protocol_timing(builder):
+    """
+    Time the acquisition units of a protocol
+
+    Parameters:
+    -----------
+    builder : SequenceBuilder
+        Sequence builder of the protocol
+
+    Returns:
+    --------
+    line_duration : float
+        Duration of one k-space line (the TRs of all flow encodings) in seconds
+    nav_duration : float
+        Duration of one navigator echo in seconds, 0 without navigators
+    """
+    line_duration = sum(builder.plan()['tr_durations'].values())
+    nav_duration = 0
+    if builder.params.navigator_enabled:
+        nav_duration = sum(calc_duration(*events) for events in builder.recar.navigator_blocks(builder.system))
+    return line_duration, nav_duration
+
+def acquisition_slots(n_slots, line_duration, nav_duration=0, navigator_interval=0, start=0):
+    """
+    Compute the timing of consecutive k-space line slots
+
+    Parameters:
+    -----------
+    n_slots : int
+        Number of line slots
+    line_duration : float
+        Duration of one k-space line in seconds
+    nav_duration : float
+        Duration of one navigator echo in seconds
+    navigator_interval : int
+        Line slots between navigators; 0 for a single navigator at the start
+    start : float
+        Start time of the acquisition in seconds
+
+    Returns:
+    --------
+    slot_times : ndarray
+        Start time of every slot
+    nav_times : ndarray
+        Start time of the navigator that precedes every slot
+    """
+    slots = np.arange(n_slots)
+    if navigator_interval > 0:
+        nav_index = slots // navigator_interval
+    else:
+        nav_index = np.zeros(n_slots, dtype=int)
+    nav_times = start + nav_index * (navigator_interval * line_duration + nav_duration)
+    slot_times = start + slots * line_duration + (nav_index + 1) * nav_duration
+    return slot_times, nav_times
+
+def simulate_gating(times, positions, recar, line_duration, window, strategy='gating', n_bins=4,
+                    nav_duration=0, navigator_interval=0, learning_time=30.0):
+    """
+    Replay a respiratory trace through an acquisition and measure its efficiency
+
+    The scanner plays one k-space line per slot without pause; the
+    decision to keep a line is taken from the respiratory position at the
+    preceding navigator (or at the line itself when there is only one
+    navigator, i.e. ideal real-time tracking). Positions inside the
+    acceptance window are split into n_bins respiratory bins.
+
+    'gating' accepts a slot when the position lies in the window and
+    acquires the next line of the sampling order; rejected lines are
+    repeated. 'recar' first learns how the breathing is distributed over
+    the bins during learning_time seconds, then gives every bin a share of
+    the lines proportional to its occupancy, the k-space centre to the bin
+    closest to end-expiration (RecarController.respiratory_groups). A slot
+    acquires the next line of its bin and is wasted once that bin is
+    complete. Every step is vectorized over the slots, so hours of
+    breathing simulate in well under a second.
+
+    Parameters:
+    -----------
+    times : ndarray
+        Sample times of the respiratory trace in seconds
+    positions : ndarray
+        Respiratory position (0 = end-expiration, 1 = end-inspiration)
+    recar : RecarController
+        ReCAR controller holding the sampling order
+    line_duration : float
+        Duration of one k-space line in seconds
+    window : tuple
+        (low, high) accepted respiratory positions
+    strategy : str
+        'gating' or 'recar'
+    n_bins : int
+        Number of respiratory bins in the acceptance window
+    nav_duration : float
+        Duration of one navigator echo in seconds
+    navigator_interval : int
+        Line slots between navigators; 0 for a single navigator at the start
+    learning_time : float
+        Duration of the ReCAR learning phase in seconds, before the
+        acquisition starts
+
+    Returns:
+    --------
+    result : dict
+        'strategy' : simulated strategy
+        'complete' : True if the trace was long enough to acquire every line
+        'scan_time' : acquisition time in seconds (learning phase excluded)
+        'efficiency' : fraction of line slots that acquired a line
+        'n_lines' : number of lines in the sampling order
+        'n_slots' : number of line slots played
+        'line_bins' : respiratory bin every line was acquired in, -1 if not acquired
+        'bin_edges' : respiratory positions bounding the bins
+        'bin_lines' : number of lines acquired per bin
+        'bin_coverage' : fraction of the sampled k-space points acquired per bin
+        'bin_radius' : mean k-space radius of the lines acquired per bin, in lines
+
+    Raises:
+    -------
+    ValueError
+        If the strategy is unknown
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown gating strategy '{strategy}', expected one of {STRATEGIES}")
+
+    times = np.asarray(times, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    order = np.asarray(recar.get_sampling_order()).reshape(-1, 3)
+    n_lines = len(order)
+
+    # Line slots that fit in the trace
+    start = times[0] + (learning_time if strategy == 'recar' else 0)
+    per_slot = line_duration + (nav_duration / navigator_interval if navigator_interval > 0 else 0)
+    n_slots = max(int((times[-1] - start) / per_slot), 0)
+    slot_times, nav_times = acquisition_slots(n_slots, line_duration, nav_duration, navigator_interval, start)
+    slot_times, nav_times = slot_times[slot_times <= times[-1]], nav_times[slot_times <= times[-1]]
+    decision_times = nav_times if navigator_interval > 0 else slot_times
+    decision = np.interp(decision_times, times, positions)
+
+    bin_edges = np.linspace(window[0], window[1], n_bins + 1)
+    slot_bins = np.clip(np.searchsorted(bin_edges, decision, side='right') - 1, 0, n_bins - 1)
+    slot_bins[(decision < window[0]) | (decision > window[1])] = -1
+
+    # Slot that acquired every line, -1 if the trace ended first
+    line_slots = np.full(n_lines, -1)
+    if strategy == 'gating':
+        accepted = np.nonzero(slot_bins >= 0)[0][:n_lines]
+        line_slots[:len(accepted)] = accepted
+    else:
+        learning = positions[times < start]
+        weights = np.histogram(learning, bin_edges)[0] if len(learning) else np.ones(n_bins)
+        if weights.sum() == 0:
+            weights = np.ones(n_bins)
+        groups = recar.respiratory_groups(weights)
+        for b in range(n_bins):
+            lines = np.nonzero(groups == b)[0]
+            slots = np.nonzero(slot_bins == b)[0][:len(lines)]
+            line_slots[lines[:len(slots)]] = slots
+
+    acquired = line_slots >= 0
+    complete = bool(acquired.all())
+    last_slot = line_slots.max() if acquired.any() else -1
+    n_used = last_slot + 1 if complete else len(slot_times)
+    scan_time = (slot_times[last_slot] + line_duration - start) if complete else np.nan
+
+    line_bins = np.full(n_lines, -1)
+    line_bins[acquired] = slot_bins[line_slots[acquired]]
+
+    # k-space coverage per bin
+    point_ids = order[:, 0] * recar.n_slice + order[:, 1]
+    n_points = len(np.unique(point_ids))
+    radius = np.hypot(order[:, 0] - recar.n_phase/2, order[:, 1] - recar.n_slice/2)
+    bin_lines = np.bincount(line_bins[acquired], minlength=n_bins)
+    bin_coverage = np.array([len(np.unique(point_ids[line_bins == b])) / n_points for b in range(n_bins)])
+    radius_sum = np.bincount(line_bins[acquired], weights=radius[acquired], minlength=n_bins)
+    bin_radius = np.divide(radius_sum, bin_lines, out=np.full(n_bins, np.nan), where=bin_lines > 0)
+
+    return {
+        'strategy': strategy,
+        'complete': complete,
+        'scan_time': scan_time,
+        'efficiency': acquired.sum() / n_used if n_used else 0.0,
+        'n_lines': n_lines,
+        'n_slots': int(n_used),
+        'line_bins': line_bins,
+        'bin_edges': bin_edges,
+        'bin_lines': bin_lines,
+        'bin_coverage': bin_coverage,
+        'bin_radius': bin_radius,
+    }
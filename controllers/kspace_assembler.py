@@ -0,0 +1,173 @@
+"""Single-pass assembly of streamed readouts into a memory-mapped k-space array."""
+
+import numpy as np
+
+def readout_targets(encoding, phase, kz, ky, shape):
+    """
+    Compute the k-space row of every readout
+
+    Parameters:
+    -----------
+    encoding, phase, kz, ky : ndarray
+        k-space position of every readout in acquisition order; a negative
+        phase discards the readout
+    shape : tuple
+        k-space shape (n_encodings, n_phases, n_kz, n_ky, ...)
+
+    Returns:
+    --------
+    targets : ndarray
+        Flat (encoding, phase, kz, ky) row of every readout; discarded
+        readouts point to the row after the last one
+    """
+    n_rows = int(np.prod(shape[:4]))
+    index = [np.asarray(i, dtype=np.int64) for i in (encoding, phase, kz, ky)]
+    discard = index[1] < 0
+    index[1] = np.where(discard, 0, index[1])
+    targets = np.ravel_multi_index(index, shape[:4])
+    targets[discard] = n_rows
+    return targets
+
+class KSpaceAssembler:
+    """
+    Scatter readouts in acquisition order into a preallocated memmap
+
+    The target row of every readout is computed once from the sampling
+    order, so adding a batch of readouts is a single fancy-indexed
+    assignment straight from the input array into the memmap: no
+    per-readout Python loop and no intermediate copies. RAM use is bounded
+    by the batch size and the page cache. Discarded readouts (rejected
+    cardiac phases) are written to a scratch row after the k-space data.
+
+    The memmap is stored as a .npy file of shape (n_rows + 1, ..., n_kx);
+    open_kspace returns the k-space view of an assembled file.
+    """
+    def __init__(self, filename, shape, targets, dtype=np.complex64):
+        """
+        Allocate the k-space file
+
+        Parameters:
+        -----------
+        filename : str
+            .npy file for the memory-mapped k-space, overwritten
+        shape : tuple
+            k-space shape (n_encodings, n_phases, n_kz, n_ky, n_kx) or
+            (n_encodings, n_phases, n_kz, n_ky, n_coils, n_kx)
+        targets : ndarray
+            Target row of every readout, from readout_targets
+        dtype : dtype
+            Data type of the k-space samples
+        """
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.position = 0  # Readouts consumed so far
+
+        n_rows = int(np.prod(self.shape[:4]))
+        self._rows = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype,
+                                               shape=(n_rows + 1,) + self.shape[4:])
+        self.kspace = self._rows[:n_rows].reshape(self.shape)
+
+    @classmethod
+    def for_builder(cls, filename, builder, n_coils=None, phases=None, dtype=np.complex64):
+        """
+        Create an assembler for the image readouts of a sequence builder
+
+        Parameters:
+        -----------
+        filename : str
+            .npy file for the memory-mapped k-space, overwritten
+        builder : SequenceBuilder
+            Sequence builder of the protocol
+        n_coils : int, optional
+            Number of receive coils; no coil axis if None
+        phases : ndarray, optional
+            Cardiac phase of every image readout, e.g. from retrospective
+            ECG binning (-1 discards); the ReCAR order phases if None
+        dtype : dtype
+            Data type of the k-space samples
+
+        Returns:
+        --------
+        assembler : KSpaceAssembler
+            Assembler consuming the image readouts (navigators excluded)
+        """
+        readouts = builder.readout_order()
+        image = ~readouts['navigator']
+        phase = readouts['cardiac_phase'][image] if phases is None else phases
+
+        n_kx, n_ky, n_kz = builder.params.matrix_size
+        coils = () if n_coils is None else (n_coils,)
+        shape = (len(builder.flow_encodings), builder.params.n_cardiac_phases, n_kz, n_ky) + coils + (n_kx,)
+        targets = readout_targets(readouts['encoding'][image], phase, readouts['kz'][image],
+                                  readouts['ky'][image], shape)
+        return cls(filename, shape, targets, dtype)
+
+    @property
+    def complete(self):
+        """True once every readout has been consumed"""
+        return self.position == len(self.targets)
+
+    def add(self, readouts):
+        """
+        Scatter the next readouts of the acquisition into k-space
+
+        Parameters:
+        -----------
+        readouts : ndarray
+            Readouts (n_readouts, ..., n_kx) following the ones already added
+
+        Raises:
+        -------
+        ValueError
+            If there are more readouts than in the sampling order
+        """
+        end = self.position + len(readouts)
+        if end > len(self.targets):
+            raise ValueError(f"Got {end} readouts, the sampling order has {len(self.targets)}")
+        self._rows[self.targets[self.position:end]] = readouts
+        self.position = end
+
+    def consume(self, stream):
+        """
+        Assemble a stream of readout batches
+
+        Parameters:
+        -----------
+        stream : iterable of ndarray
+            Readout batches in acquisition order
+
+        Returns:
+        --------
+        kspace : memmap
+            Assembled k-space
+        """
+        for readouts in stream:
+            self.add(readouts)
+        self.flush()
+        return self.kspace
+
+    def flush(self):
+        """Write the memmap to disk"""
+        self._rows.flush()
+
+def open_kspace(filename, shape, mode='r'):
+    """
+    Open assembled k-space without loading it
+
+    Parameters:
+    -----------
+    filename : str
+        .npy file written by KSpaceAssembler
+    shape : tuple
+        k-space shape given to the assembler
+    mode : str
+        Memmap mode
+
+    Returns:
+    --------
+    kspace : memmap
+        Memory-mapped k-space of the given shape
+    """
+    rows = np.load(filename, mmap_mode=mode)
+    return rows[:int(np.prod(shape[:4]))].reshape(shape)
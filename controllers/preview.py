@@ -0,0 +1,157 @@
+"""Incremental zero-filled preview reconstruction of streamed k-space lines."""
+
+import time
+
+import numpy as np
+
+from models.phantom import fourier_basis, kspace_to_image
+
+class PreviewReconstructor:
+    """
+    Zero-filled 3D image per flow encoding, updated line by line
+
+    A ky/kz line changes the image by the outer product of its 1D inverse
+    FFT along kx with the ky and kz basis vectors. Lines received since the
+    last frame are grouped by (encoding, kz) plane: the kx transforms are
+    batched, the ky sum is a matrix product and every plane adds one
+    rank-one term along kz. This costs about one pass over the volume per
+    plane instead of a full 3D FFT per line. When more planes of an encoding
+    are pending than a full FFT costs, its image is recomputed from the
+    zero-filled k-space instead.
+
+    A line acquired again (another cardiac phase) replaces the previous
+    one, so the preview shows the latest data of every line.
+
+    Frames are throttled to fps: lines are only collected until a frame
+    is due.
+    """
+    def __init__(self, shape, fps=10.0, full_fft_planes=None, clock=time.perf_counter):
+        """
+        Initialize an empty preview
+
+        Parameters:
+        -----------
+        shape : tuple
+            (n_encodings, n_kz, n_ky, n_kx)
+        fps : float
+            Largest frame rate; inf updates on every call to frame
+        full_fft_planes : int, optional
+            Pending kz planes from which a full 3D FFT is used; defaults to
+            log2 of the volume size
+        clock : callable
+            Clock in seconds used for throttling
+        """
+        self.shape = tuple(shape)
+        n_encodings, n_kz, n_ky, n_kx = self.shape
+        self.fps = fps
+        self.full_fft_planes = (int(np.log2(n_kz * n_ky * n_kx)) if full_fft_planes is None
+                                else full_fft_planes)
+        self.clock = clock
+
+        self.kspace = np.zeros(self.shape, dtype=np.complex64)
+        self.image = np.zeros(self.shape, dtype=np.complex64)
+        self.sampled = np.zeros(self.shape[:3], dtype=bool)
+        self.n_frames = 0
+        self._last_frame = -np.inf
+        self._basis_y = fourier_basis(n_ky)
+        self._basis_z = fourier_basis(n_kz)
+        self._pending = []
+
+    @classmethod
+    def for_builder(cls, builder, **kwargs):
+        """
+        Create a preview for the protocol of a sequence builder
+
+        Parameters:
+        -----------
+        builder : SequenceBuilder
+            Sequence builder of the protocol
+        **kwargs
+            Passed to the constructor
+
+        Returns:
+        --------
+        preview : PreviewReconstructor
+            Empty preview
+        """
+        n_kx, n_ky, n_kz = builder.params.matrix_size
+        return cls((len(builder.flow_encodings), n_kz, n_ky, n_kx), **kwargs)
+
+    @property
+    def coverage(self):
+        """Fraction of the ky/kz lines acquired per encoding"""
+        return self.sampled.mean(axis=(1, 2))
+
+    def add(self, encoding, kz, ky, data):
+        """
+        Add acquired lines
+
+        Parameters:
+        -----------
+        encoding, kz, ky : int or array_like
+            k-space position of every line
+        data : ndarray
+            Lines (n_kx,) or (n_lines, n_kx)
+        """
+        index = np.broadcast_arrays(*(np.atleast_1d(np.asarray(i, dtype=np.int64))
+                                      for i in (encoding, kz, ky)))
+        data = np.asarray(data, dtype=np.complex64).reshape(len(index[0]), self.shape[3])
+        self._pending.append((index, data))
+
+    def frame(self, force=False):
+        """
+        Apply the pending lines if a frame is due
+
+        Parameters:
+        -----------
+        force : bool
+            Update even if the last frame is more recent than 1 / fps
+
+        Returns:
+        --------
+        image : ndarray or None
+            Complex images (n_encodings, n_z, n_y, n_x), None if no frame
+            is due; the array is updated in place by later frames
+        """
+        now = self.clock()
+        if not force and now - self._last_frame < 1 / self.fps:
+            return None
+        self._last_frame = now
+        self.n_frames += 1
+        if self._pending:
+            self._apply()
+        return self.image
+
+    def _apply(self):
+        """Add the pending lines to k-space and the image"""
+        encoding, kz, ky = (np.concatenate(i) for i in zip(*(index for index, _ in self._pending)))
+        data = np.concatenate([data for _, data in self._pending])
+        self._pending = []
+
+        # Keep the last readout of lines received twice
+        n_encodings, n_kz, n_ky, n_kx = self.shape
+        line = np.ravel_multi_index((encoding, kz, ky), self.shape[:3])
+        line, last = np.unique(line[::-1], return_index=True)
+        data = data[::-1][last]
+        encoding, kz, ky = np.unravel_index(line, self.shape[:3])
+
+        flat = self.kspace.reshape(-1, n_kx)
+        delta = data - flat[line]
+        flat[line] = data
+        self.sampled.reshape(-1)[line] = True
+
+        # Rank-one update per (encoding, kz) plane, or a full FFT of the
+        # encodings with too many pending planes
+        profiles = np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(delta, axes=-1), axis=-1, norm='ortho'),
+                                   axes=-1).astype(np.complex64)
+        plane = line // n_ky
+        starts = np.flatnonzero(np.append(True, plane[1:] != plane[:-1]))
+        ends = np.append(starts[1:], len(line))
+        n_planes = np.bincount(encoding[starts], minlength=n_encodings)
+        for e in np.flatnonzero(n_planes >= self.full_fft_planes):
+            self.image[e] = kspace_to_image(self.kspace[e])
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            e, z = encoding[start], kz[start]
+            if n_planes[e] < self.full_fft_planes:
+                plane_image = self._basis_y[:, ky[start:end]] @ profiles[start:end]
+                self.image[e] += self._basis_z[:, z, None, None] * plane_image
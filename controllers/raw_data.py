@@ -0,0 +1,259 @@
+"""Chunked, compressed HDF5 container for 4D flow raw data."""
+
+import json
+
+import h5py
+import numpy as np
+
+# Bytes of the HDF5 chunk cache; holds the chunks of every encoding of the
+# cardiac phase being acquired
+CHUNK_CACHE_BYTES = 64 * 1024**2
+
+class RawDataFile:
+    """
+    HDF5 raw-data container keyed by (encoding, cardiac phase, kz, ky)
+
+    The file holds:
+    - 'kspace': complex64 readouts of shape (n_encodings, n_phases, n_kz,
+      n_ky, n_coils, n_kx), chunked per (encoding, phase, kz) plane and
+      compressed, so unsampled lines cost almost nothing on disk and a
+      single encoding or phase is read without touching the others
+    - 'sampled': number of readouts written to every (encoding, phase,
+      kz, ky) line
+    - 'mask' and 'order': sampling mask and ReCAR sampling order
+    - attributes 'params' (SequenceParams as JSON), 'params_hash' and
+      'encodings' (flow encoding names)
+
+    Readouts are appended as they are acquired; a line written twice keeps
+    the last readout.
+
+    Example:
+    --------
+    with RawDataFile.create('scan.h5', params, n_encodings=4) as raw:
+        raw.append(encoding, phase, kz, ky, readout)
+    with RawDataFile('scan.h5') as raw:
+        velocity_x = raw.read(encoding=1)
+    """
+    def __init__(self, filename, mode='r', chunk_cache=CHUNK_CACHE_BYTES):
+        """
+        Open an existing raw-data file
+
+        Parameters:
+        -----------
+        filename : str
+            HDF5 filename
+        mode : str
+            'r' to read, 'a' to append readouts
+        chunk_cache : int
+            Size of the HDF5 chunk cache in bytes
+        """
+        self.filename = filename
+        self.file = h5py.File(filename, mode, rdcc_nbytes=chunk_cache, rdcc_w0=1.0)
+        self.kspace = self.file['kspace']
+        self._sampled = self.file['sampled']
+
+    @classmethod
+    def create(cls, filename, params, n_encodings, n_coils=1, sampling_mask=None, sampling_order=None,
+               encoding_names=None, compression='gzip', compression_opts=4,
+               chunk_cache=CHUNK_CACHE_BYTES):
+        """
+        Create an empty raw-data file for a protocol
+
+        Parameters:
+        -----------
+        filename : str
+            HDF5 filename, overwritten if it exists
+        params : SequenceParams
+            Sequence parameters; fix the matrix size and cardiac phases
+        n_encodings : int
+            Number of flow encodings
+        n_coils : int
+            Number of receive coils
+        sampling_mask : ndarray, optional
+            Sampling mask (n_ky x n_kz)
+        sampling_order : list or ndarray, optional
+            ReCAR sampling order of (phase_idx, slice_idx, cardiac_phase)
+        encoding_names : list of str, optional
+            Names of the flow encodings
+        compression : str
+            HDF5 compression filter
+        compression_opts : int
+            Compression level
+        chunk_cache : int
+            Size of the HDF5 chunk cache in bytes
+
+        Returns:
+        --------
+        raw : RawDataFile
+            File opened for appending
+        """
+        n_kx, n_ky, n_kz = params.matrix_size
+        n_phases = params.n_cardiac_phases
+        with h5py.File(filename, 'w') as f:
+            f.create_dataset('kspace', shape=(n_encodings, n_phases, n_kz, n_ky, n_coils, n_kx),
+                             dtype=np.complex64, chunks=(1, 1, 1, n_ky, n_coils, n_kx),
+                             compression=compression, compression_opts=compression_opts, shuffle=True)
+            f.create_dataset('sampled', shape=(n_encodings, n_phases, n_kz, n_ky), dtype=np.uint16,
+                             chunks=(1, 1, n_kz, n_ky), compression=compression)
+            if sampling_mask is not None:
+                f.create_dataset('mask', data=np.asarray(sampling_mask, dtype=np.uint8), compression=compression)
+            if sampling_order is not None:
+                f.create_dataset('order', data=np.asarray(sampling_order, dtype=np.int32).reshape(-1, 3),
+                                 compression=compression)
+            f.attrs['params'] = json.dumps(params.as_dict())
+            f.attrs['params_hash'] = params.content_hash
+            f.attrs['encodings'] = json.dumps(list(encoding_names or []))
+        return cls(filename, 'a', chunk_cache)
+
+    @classmethod
+    def for_builder(cls, filename, builder, n_coils=1, **kwargs):
+        """
+        Create an empty raw-data file for the protocol of a sequence builder
+
+        Parameters:
+        -----------
+        filename : str
+            HDF5 filename, overwritten if it exists
+        builder : SequenceBuilder
+            Sequence builder of the protocol
+        n_coils : int
+            Number of receive coils
+        **kwargs
+            Passed to create
+
+        Returns:
+        --------
+        raw : RawDataFile
+            File opened for appending
+        """
+        return cls.create(filename, builder.params, len(builder.flow_encodings), n_coils,
+                          builder.sampling_mask, builder.recar.get_sampling_order(),
+                          [encoding['name'] for encoding in builder.flow_encodings], **kwargs)
+
+    @property
+    def shape(self):
+        """Shape of the k-space dataset (n_encodings, n_phases, n_kz, n_ky, n_coils, n_kx)"""
+        return self.kspace.shape
+
+    @property
+    def params(self):
+        """Sequence parameters the data was acquired with"""
+        from models.sequence_params import SequenceParams
+
+        return SequenceParams(**json.loads(self.file.attrs['params']))
+
+    @property
+    def encodings(self):
+        """Names of the flow encodings"""
+        return json.loads(self.file.attrs['encodings'])
+
+    @property
+    def mask(self):
+        """Sampling mask, None if not stored"""
+        return self.file['mask'][()] if 'mask' in self.file else None
+
+    @property
+    def order(self):
+        """ReCAR sampling order as an (n, 3) array, None if not stored"""
+        return self.file['order'][()] if 'order' in self.file else None
+
+    def append(self, encoding, phase, kz, ky, data):
+        """
+        Write acquired readouts
+
+        Readouts are grouped by (encoding, phase, kz) plane, so every chunk
+        is written once per call however the readouts are ordered.
+
+        Parameters:
+        -----------
+        encoding, phase, kz, ky : int or array_like
+            k-space position of every readout
+        data : ndarray
+            Readouts (n_kx,), (n_coils, n_kx) or (n_readouts, n_coils, n_kx)
+        """
+        n_encodings, n_phases, n_kz, n_ky, n_coils, n_kx = self.shape
+        index = np.broadcast_arrays(*(np.atleast_1d(np.asarray(i, dtype=np.int64))
+                                      for i in (encoding, phase, kz, ky)))
+        data = np.asarray(data, dtype=np.complex64).reshape(len(index[0]), n_coils, n_kx)
+
+        # Sort by plane then ky; the last readout of a repeated line wins
+        line = np.ravel_multi_index(index, (n_encodings, n_phases, n_kz, n_ky))
+        order = np.argsort(line, kind='stable')
+        line, data = line[order], data[order]
+        last = np.append(line[1:] != line[:-1], True)
+        counts = np.bincount(np.unique(line, return_inverse=True)[1])
+        line, data = line[last], data[last]
+
+        plane, ky = np.divmod(line, n_ky)
+        starts = np.flatnonzero(np.append(True, plane[1:] != plane[:-1]))
+        ends = np.append(starts[1:], len(plane))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            e, p, z = np.unravel_index(plane[start], (n_encodings, n_phases, n_kz))
+            rows = ky[start:end]
+            if end - start == 1:
+                self.kspace[e, p, z, rows[0]] = data[start]
+            else:
+                self.kspace[e, p, z, rows] = data[start:end]
+
+        # Update the line counters per (encoding, phase) chunk
+        sampled = np.zeros(n_encodings * n_phases * n_kz * n_ky, dtype=np.uint16)
+        sampled[line] = counts
+        sampled = sampled.reshape(n_encodings, n_phases, n_kz, n_ky)
+        for e, p in set(zip(*np.unravel_index(plane // n_kz, (n_encodings, n_phases)))):
+            self._sampled[e, p] += sampled[e, p]
+
+    def read(self, encoding=None, phase=None):
+        """
+        Read k-space, loading only the requested encoding and phase
+
+        Parameters:
+        -----------
+        encoding : int or slice, optional
+            Flow encoding index; all encodings if None
+        phase : int or slice, optional
+            Cardiac phase index; all phases if None
+
+        Returns:
+        --------
+        kspace : ndarray
+            complex64 k-space with the (encoding, phase) axes that were not
+            given as ints, then (n_kz, n_ky, n_coils, n_kx)
+        """
+        return self.kspace[self._selection(encoding, phase)]
+
+    def sampled(self, encoding=None, phase=None):
+        """
+        Count the readouts written per line
+
+        Parameters:
+        -----------
+        encoding : int or slice, optional
+            Flow encoding index; all encodings if None
+        phase : int or slice, optional
+            Cardiac phase index; all phases if None
+
+        Returns:
+        --------
+        counts : ndarray
+            Readouts per (encoding, phase, kz, ky) line
+        """
+        return self._sampled[self._selection(encoding, phase)]
+
+    @staticmethod
+    def _selection(encoding, phase):
+        return (slice(None) if encoding is None else encoding,
+                slice(None) if phase is None else phase)
+
+    def flush(self):
+        """Write buffered chunks to disk"""
+        self.file.flush()
+
+    def close(self):
+        """Close the file"""
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
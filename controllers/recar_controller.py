@@ -82,27 +82,54 @@ class RecarController:
         # Here we just return the basic ordering
         return self.sampling_order
     
-    def add_navigator_echo(self, seq, system):
+    def respiratory_groups(self, bin_weights):
         """
-        Add a navigator echo for respiratory motion tracking
+        Assign the sampling order to respiratory bins, k-space centre first
+        
+        Lines are ranked by their k-space radius. The most central lines go
+        to the first bin (closest to end-expiration) and every bin receives
+        a share of the lines proportional to its weight, e.g. the fraction
+        of time the breathing spends in it.
+        
+        Parameters:
+        -----------
+        bin_weights : array_like
+            Relative weight of every respiratory bin
+            
+        Returns:
+        --------
+        groups : ndarray
+            Respiratory bin of every entry of the sampling order
+        """
+        order = np.asarray(self.sampling_order).reshape(-1, 3)
+        radius = np.hypot(order[:, 0] - self.n_phase/2, order[:, 1] - self.n_slice/2)
+        rank = np.empty(len(order), dtype=int)
+        rank[np.argsort(radius, kind='stable')] = np.arange(len(order))
+        
+        weights = np.asarray(bin_weights, dtype=float)
+        bounds = np.round(np.cumsum(weights) / weights.sum() * len(order))
+        return np.searchsorted(bounds, rank, side='right')
+    
+    def navigator_blocks(self, system):
+        """
+        Create the blocks of a navigator echo for respiratory motion tracking
         
         Parameters:
         -----------
-        seq : Sequence
-            Sequence object
         system : Opts
             System limits
             
         Returns:
         --------
-        None
+        blocks : list
+            Tuples of events, one tuple per sequence block
         """
         from pypulseq.make_sinc_pulse import make_sinc_pulse
         from pypulseq.make_trap_pulse import make_trapezoid
         from pypulseq.make_adc import make_adc
         
         # Create a pencil-beam excitation
-        rf_nav, gz_nav = make_sinc_pulse(flip_angle=10, duration=1e-3, 
+        rf_nav, gz_nav, _ = make_sinc_pulse(flip_angle=10, duration=1e-3, 
                                        slice_thickness=30e-3, 
                                        apodization=0.5, time_bw_product=4,
                                        system=system, return_gz=True)
@@ -116,8 +143,45 @@ class RecarController:
         adc_nav = make_adc(num_samples=64, duration=2e-3, 
                           delay=0.5e-3, system=system)
         
+        return [(rf_nav, gz_nav), (gz_nav_readout, adc_nav)]
+    
+    def navigator_lines(self, interval=0):
+        """
+        Find the k-space lines that are preceded by a navigator echo
+        
+        Parameters:
+        -----------
+        interval : int
+            Number of k-space lines between navigators; 0 for a single
+            navigator at the start of the scan
+            
+        Returns:
+        --------
+        lines : ndarray
+            Indices into the sampling order, in increasing order
+        """
+        n_lines = len(self.sampling_order)
+        if interval <= 0:
+            return np.zeros(min(n_lines, 1), dtype=int)
+        return np.arange(0, n_lines, interval)
+    
+    def add_navigator_echo(self, seq, system):
+        """
+        Add a navigator echo for respiratory motion tracking
+        
+        Parameters:
+        -----------
+        seq : Sequence
+            Sequence object
+        system : Opts
+            System limits
+            
+        Returns:
+        --------
+        None
+        """
         # Add navigator blocks to sequence
-        seq.add_block(rf_nav, gz_nav)
-        seq.add_block(gz_nav_readout, adc_nav)
+        for events in self.navigator_blocks(system):
+            seq.add_block(*events)
         
         return seq
\ No newline at end of file
@@ -0,0 +1,353 @@
+"""Protocol reports rendered in a process pool."""
+
+import base64
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config.default_config import DefaultConfig
+
+# Per-worker state, set once by _init_report_worker in every pool process
+_worker_system = None
+_worker_cache = None
+_worker_dpi = None
+
+# Figures of a report: (kind, filenames)
+FIGURES = [
+    ('waveforms', ('waveforms_tr.png', 'waveforms_scan.png')),
+    ('mask', ('sampling_pattern.png',)),
+    ('order', ('acquisition_order.png',)),
+]
+
+def flow_moments(builder):
+    """
+    Calculate the gradient moments of every flow encoding at the echo
+
+    All gradients of the TR (slice rephaser, bipolars, phase encodes and
+    readout) are integrated from the centre of the RF pulse to the centre
+    of the ADC, so gradients that move with the bipolar duration count.
+
+    Parameters:
+    -----------
+    builder : SequenceBuilder
+        Sequence builder with its flow encodings
+
+    Returns:
+    --------
+    moments : dict
+        Per flow encoding name, {axis: (m0, m1)} at the echo, with times
+        measured from the centre of the RF pulse
+    """
+    from utils.pulseq_utils import echo_moments
+
+    moments = {}
+    for flow_encoding, blocks in zip(builder.flow_encodings, builder.tr_layout()):
+        moments[flow_encoding['name']] = echo_moments([events for _, events, _ in blocks])
+    return moments
+
+def effective_venc(moments):
+    """
+    Calculate the effective VENC of every encoding relative to the first one
+
+    Parameters:
+    -----------
+    moments : dict
+        Flow moments from flow_moments
+
+    Returns:
+    --------
+    venc : dict
+        Per flow encoding name, {axis: VENC in m/s}, inf where the first
+        moment does not differ from the first encoding
+    """
+    reference = next(iter(moments.values()))
+    venc = {}
+    for name, axes in moments.items():
+        venc[name] = {}
+        for axis, (_, m1) in axes.items():
+            # Ignore rounding differences of the integration
+            delta_m1 = abs(m1 - reference[axis][1])
+            venc[name][axis] = 1 / (2 * delta_m1) if delta_m1 > 1e-9 else np.inf
+    return venc
+
+def _init_report_worker(system, cache_dir, cache_max_size, dpi):
+    """
+    Initialize a report worker process
+
+    Parameters:
+    -----------
+    system : Opts
+        System limits
+    cache_dir : str
+        Artifact cache directory
+    cache_max_size : int
+        Maximum cache size in bytes
+    dpi : int
+        Resolution of the rendered figures
+    """
+    global _worker_system, _worker_cache, _worker_dpi
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from controllers.artifact_cache import ArtifactCache
+
+    _worker_system = system
+    _worker_cache = ArtifactCache(cache_dir, cache_max_size)
+    _worker_dpi = dpi
+
+def _prepare_protocol(params):
+    """
+    Build (or fetch from the cache) a protocol and collect its report data
+
+    Parameters:
+    -----------
+    params : SequenceParams
+        Sequence parameters
+
+    Returns:
+    --------
+    summary : dict
+        JSON-serializable report data, None if the timing check failed
+    """
+    from controllers.artifact_cache import artifact_key
+    from controllers.sequence_builder import SequenceBuilder
+    from utils.pulseq_utils import check_sequence_timing, calculate_sequence_duration
+
+    builder = SequenceBuilder(params, _worker_system)
+    key = artifact_key(params, _worker_system)
+    entry = _worker_cache.get(key)
+    if entry is None:
+        seq = builder.build_sequence()
+        ok, _ = check_sequence_timing(seq)
+        if not ok:
+            return None
+        entry = _worker_cache.put(key, seq, builder.sampling_mask, builder.recar.get_sampling_order(),
+                                  meta={'duration': calculate_sequence_duration(seq)})
+
+    plan = builder.plan()
+    moments = flow_moments(builder)
+
+    nav_duration = 0
+    if params.navigator_enabled:
+        from pypulseq.calc_duration import calc_duration
+        nav_duration = sum(calc_duration(*events) for events in builder.recar.navigator_blocks(_worker_system))
+
+    return {
+        'params': {name: value for name, value in params.as_dict().items()},
+        'key': key,
+        'entry_dir': os.path.dirname(entry['seq']),
+        'duration': entry['meta']['duration'],
+        'n_trs': plan['n_trs'],
+        'n_blocks': plan['n_blocks'],
+        'n_samples': int(np.count_nonzero(builder.sampling_mask == 1)),
+        'tr_durations': plan['tr_durations'],
+        'first_trs_end': nav_duration + sum(plan['tr_durations'].values()),
+        'moments': moments,
+        'venc': effective_venc(moments),
+    }
+
+def _render_figure(kind, summary, filenames):
+    """
+    Render one figure of a report
+
+    Parameters:
+    -----------
+    kind : str
+        Figure kind from FIGURES
+    summary : dict
+        Report data from _prepare_protocol
+    filenames : tuple
+        Output PNG filenames
+
+    Returns:
+    --------
+    filenames : tuple
+        The written filenames
+    """
+    entry_dir = summary['entry_dir']
+    if kind == 'waveforms':
+        from pypulseq.Sequence.sequence import Sequence
+        from views.sequence_plot import plot_sequence
+
+        seq = Sequence(_worker_system)
+        seq.read(os.path.join(entry_dir, 'sequence.seq'))
+        plot_sequence(seq, filenames[0], time_range=(0, summary['first_trs_end']), dpi=_worker_dpi)
+        plot_sequence(seq, filenames[1], dpi=_worker_dpi)
+    elif kind == 'mask':
+        from views.k_space_viewer import plot_sampling_pattern
+
+        plot_sampling_pattern(np.load(os.path.join(entry_dir, 'mask.npy')), filenames[0], dpi=_worker_dpi)
+    elif kind == 'order':
+        from views.k_space_viewer import plot_acquisition_order
+
+        mask = np.load(os.path.join(entry_dir, 'mask.npy'))
+        order = np.load(os.path.join(entry_dir, 'order.npy'))
+        plot_acquisition_order(order, mask.shape, filenames[0], dpi=_worker_dpi)
+    else:
+        raise ValueError(f"Unknown figure kind '{kind}'")
+    return filenames
+
+def _format_table(rows):
+    """Format (label, value) rows as an HTML table"""
+    cells = ''.join(f'<tr><th>{html.escape(str(label))}</th><td>{html.escape(str(value))}</td></tr>'
+                    for label, value in rows)
+    return f'<table>{cells}</table>'
+
+def _embed_png(filename):
+    """Return an <img> tag with the PNG embedded as a data URI"""
+    with open(filename, 'rb') as f:
+        data = base64.b64encode(f.read()).decode('ascii')
+    name = html.escape(os.path.basename(filename))
+    return f'<figure><img alt="{name}" src="data:image/png;base64,{data}"><figcaption>{name}</figcaption></figure>'
+
+def write_report_html(summary, figures, filename, title):
+    """
+    Write a self-contained HTML report
+
+    Parameters:
+    -----------
+    summary : dict
+        Report data from _prepare_protocol
+    figures : list
+        PNG filenames to embed
+    filename : str
+        Output HTML filename
+    title : str
+        Report title
+    """
+    duration = summary['duration']
+    timing = [
+        ('Scan time', f'{duration:.2f} s ({duration/60:.2f} min)'),
+        ('TRs', summary['n_trs']),
+        ('Blocks', summary['n_blocks']),
+        ('Sampled k-space points', summary['n_samples']),
+    ]
+    timing += [(f'TR {name}', f'{tr*1e3:.3f} ms') for name, tr in summary['tr_durations'].items()]
+
+    moments = []
+    for name, axes in summary['moments'].items():
+        for axis, (m0, m1) in axes.items():
+            venc = summary['venc'][name][axis]
+            moments.append((f'{name} {axis}', f'M0 = {m0:.4g} Hz/m*s, M1 = {m1:.4g} Hz/m*s^2, '
+                                              f'VENC = {venc:.4g} m/s'))
+
+    body = [
+        f'<h1>{html.escape(title)}</h1>',
+        '<h2>Protocol</h2>', _format_table(summary['params'].items()),
+        '<h2>Timing</h2>', _format_table(timing),
+        '<h2>Flow encoding moments</h2>', _format_table(moments),
+        '<h2>Figures</h2>', *[_embed_png(figure) for figure in figures],
+    ]
+    style = ('body{font-family:sans-serif;max-width:1100px;margin:auto}'
+             'th{text-align:left;padding-right:1em}img{max-width:100%}')
+
+    with open(filename, 'w') as f:
+        f.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+                f'<style>{style}</style></head><body>{"".join(body)}</body></html>')
+
+def generate_reports(params_list, system, output_dir, n_workers=None, dpi=150,
+                     cache_dir=DefaultConfig.CACHE_DIR, cache_max_size=DefaultConfig.CACHE_MAX_SIZE):
+    """
+    Generate protocol reports for a list of protocol variants
+
+    Protocols are built (or fetched from the artifact cache) and their
+    figures rendered with the Agg backend across a process pool, one task
+    per figure, so the run time is bounded by the number of cores rather
+    than by serial rendering. Each report directory holds the PNGs, a
+    self-contained report.html and summary.json; output_dir/index.html
+    links all reports.
+
+    Parameters:
+    -----------
+    params_list : list
+        SequenceParams of every protocol variant
+    system : Opts
+        System limits
+    output_dir : str
+        Output directory
+    n_workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs; 1 runs
+        in the current process.
+    dpi : int, optional
+        Resolution of the figures
+    cache_dir : str, optional
+        Artifact cache directory
+    cache_max_size : int, optional
+        Maximum cache size in bytes
+
+    Returns:
+    --------
+    reports : list
+        Path of every report.html, None for protocols that failed the
+        timing check
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    initargs = (system, cache_dir, cache_max_size, dpi)
+
+    if n_workers == 1:
+        _init_report_worker(*initargs)
+        summaries = [_prepare_protocol(params) for params in params_list]
+        tasks = _figure_tasks(summaries, output_dir)
+        for kind, summary, filenames in tasks:
+            _render_figure(kind, summary, filenames)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_report_worker,
+                                 initargs=initargs) as pool:
+            summaries = list(pool.map(_prepare_protocol, params_list))
+            tasks = _figure_tasks(summaries, output_dir)
+            futures = [pool.submit(_render_figure, *task) for task in tasks]
+            for future in futures:
+                future.result()
+
+    reports = []
+    for i, summary in enumerate(summaries):
+        if summary is None:
+            reports.append(None)
+            continue
+        report_dir = _report_dir(output_dir, i, summary)
+        figures = [os.path.join(report_dir, name) for _, names in FIGURES for name in names]
+        with open(os.path.join(report_dir, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+        filename = os.path.join(report_dir, 'report.html')
+        write_report_html(summary, figures, filename, f'Protocol {i}')
+        reports.append(filename)
+
+    _write_index(reports, summaries, output_dir)
+    return reports
+
+def _report_dir(output_dir, index, summary):
+    """Return the report directory of a protocol"""
+    return os.path.join(output_dir, f"protocol_{index:03d}_{summary['key'][:8]}")
+
+def _figure_tasks(summaries, output_dir):
+    """List the (kind, summary, filenames) figure tasks of all reports"""
+    tasks = []
+    for i, summary in enumerate(summaries):
+        if summary is None:
+            continue
+        report_dir = _report_dir(output_dir, i, summary)
+        os.makedirs(report_dir, exist_ok=True)
+        for kind, names in FIGURES:
+            tasks.append((kind, summary, tuple(os.path.join(report_dir, name) for name in names)))
+    return tasks
+
+def _write_index(reports, summaries, output_dir):
+    """Write an index page linking every report"""
+    rows = []
+    for i, (report, summary) in enumerate(zip(reports, summaries)):
+        if report is None:
+            rows.append(f'<li>Protocol {i}: timing check failed</li>')
+            continue
+        link = html.escape(os.path.relpath(report, output_dir))
+        params = summary['params']
+        rows.append(f'<li><a href="{link}">Protocol {i}</a>: VENC {params["venc"]} m/s, '
+                    f'R = {params["acceleration_factor"]}, {summary["duration"]:.1f} s</li>')
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Protocol reports</title></head>'
+                f'<body><h1>Protocol reports</h1><ul>{"".join(rows)}</ul></body></html>')
@@ -0,0 +1,376 @@
+"""Local asyncio stand-in for a scanner that streams synthesized ADC readouts."""
+
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+from models.phantom import cardiac_waveform, encoding_phases, flow_phantom, image_to_kspace, navigator_kspace
+from utils.pulseq_utils import adc_times
+
+# Readout header: index, scan time [s], wall-clock acquisition time [s],
+# encoding, cardiac phase, kz, ky, navigator flag, number of samples.
+# The complex64 samples follow the header.
+HEADER = struct.Struct('<IddiiiiBI')
+
+# Index of the header that ends the scan
+END_OF_SCAN = 0xFFFFFFFF
+
+# Bytes buffered by the server before it waits for the client to catch up
+HIGH_WATER = 256 * 1024
+
+class ScanSource:
+    """
+    Synthesize the ADC readouts of a protocol from a flow phantom
+
+    Image readouts sample the k-space of the phantom for their flow
+    encoding and cardiac phase; the flow follows a systolic waveform over
+    the cardiac phases. Navigator readouts sample a diaphragm edge moved
+    by a respiratory trace. The k-space of all encodings is computed once
+    per cardiac phase, which the ReCAR order visits one after the other.
+    """
+    def __init__(self, builder, seq=None, peak_velocity=1.0, respiration=None,
+                 navigator_amplitude=8.0, noise=0.0, seed=None):
+        """
+        Prepare the readouts of a protocol
+
+        Parameters:
+        -----------
+        builder : SequenceBuilder
+            Sequence builder of the protocol
+        seq : Sequence, optional
+            Built sequence giving the ADC times; built when not given
+        peak_velocity : float
+            Peak systolic velocity of the phantom in m/s
+        respiration : tuple, optional
+            (times, positions) respiratory trace; synthetic when not given
+        navigator_amplitude : float
+            Diaphragm displacement at end-inspiration in navigator samples
+        noise : float
+            Standard deviation of complex Gaussian noise per sample
+        seed : int, optional
+            Random seed of the noise and synthetic respiratory trace
+        """
+        from models.respiratory import synthetic_respiratory_trace
+
+        self.readouts = builder.readout_order()
+        self.times = adc_times(builder.build_sequence() if seq is None else seq)
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+
+        self._magnitude, velocity = flow_phantom(builder.params.matrix_size, builder.params.fov, peak_velocity)
+        self._phases = encoding_phases(builder.flow_encodings, velocity)
+        self._waveform = cardiac_waveform(builder.params.n_cardiac_phases)
+        self._kspace_phase = None
+        self._kspace = None
+
+        # Navigator readouts for the whole scan in one batch
+        navigator = self.readouts['navigator']
+        nav_times = self.times[navigator]
+        if respiration is None:
+            respiration = synthetic_respiratory_trace(self.times[-1] + 1 if len(self.times) else 1, seed=seed)
+        self.displacement = navigator_amplitude * np.interp(nav_times, *respiration)
+        self._navigators = navigator_kspace(self.displacement).astype(np.complex64)
+        self._nav_index = np.cumsum(navigator) - 1
+
+    def __len__(self):
+        return len(self.times)
+
+    def _phase_kspace(self, phase):
+        """Return the k-space of every encoding for a cardiac phase"""
+        if phase != self._kspace_phase:
+            image = self._magnitude * np.exp(1j * self._waveform[phase] * self._phases)
+            self._kspace = image_to_kspace(image).astype(np.complex64)
+            self._kspace_phase = phase
+        return self._kspace
+
+    def readout(self, index):
+        """
+        Synthesize one readout
+
+        Parameters:
+        -----------
+        index : int
+            ADC index in acquisition order
+
+        Returns:
+        --------
+        header : tuple
+            (encoding, cardiac phase, kz, ky, navigator) of the readout
+        data : ndarray
+            complex64 samples
+        """
+        r = self.readouts
+        if r['navigator'][index]:
+            data = self._navigators[self._nav_index[index]]
+        else:
+            kspace = self._phase_kspace(r['cardiac_phase'][index])
+            data = kspace[r['encoding'][index], r['kz'][index], r['ky'][index]]
+        if self.noise:
+            data = data + (self.noise * (self._rng.standard_normal(data.shape) +
+                                         1j * self._rng.standard_normal(data.shape))).astype(np.complex64)
+        header = (int(r['encoding'][index]), int(r['cardiac_phase'][index]), int(r['kz'][index]),
+                  int(r['ky'][index]), bool(r['navigator'][index]))
+        return header, data
+
+class ScannerEmulator:
+    """
+    asyncio server streaming the readouts of a ScanSource
+
+    Every client connection receives the whole scan. Readouts are sent at
+    their ADC time divided by speed (speed=inf streams as fast as
+    possible); the server waits for the client whenever more than
+    HIGH_WATER bytes are buffered, so a slow client slows the scan down
+    instead of filling memory. 'max_lag' records how far the stream fell
+    behind real time.
+    """
+    def __init__(self, source, speed=1.0, high_water=HIGH_WATER):
+        """
+        Initialize the emulator
+
+        Parameters:
+        -----------
+        source : ScanSource
+            Readouts to stream
+        speed : float
+            Time acceleration; 1 is real time
+        high_water : int
+            Write buffer limit in bytes
+        """
+        self.source = source
+        self.speed = speed
+        self.high_water = high_water
+        self.server = None
+        self.address = None
+        self.max_lag = 0.0
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """
+        Start listening on a TCP port or a Unix socket
+
+        Parameters:
+        -----------
+        host : str
+            TCP host
+        port : int
+            TCP port; 0 picks a free port
+        path : str, optional
+            Unix socket path, used instead of TCP when given
+
+        Returns:
+        --------
+        address : tuple or str
+            (host, port) or the Unix socket path
+        """
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path)
+            self.address = path
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+            self.address = self.server.sockets[0].getsockname()[:2]
+        return self.address
+
+    async def close(self):
+        """Stop listening"""
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+        try:
+            await self.stream(writer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, writer):
+        """
+        Stream the scan to one client
+
+        Parameters:
+        -----------
+        writer : StreamWriter
+            Connection to the client
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        paced = np.isfinite(self.speed)
+        for index, scan_time in enumerate(self.source.times.tolist()):
+            if paced:
+                delay = start + scan_time / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+
+            (encoding, phase, kz, ky, navigator), data = self.source.readout(index)
+            writer.write(HEADER.pack(index, scan_time, time.time(), encoding, phase, kz, ky,
+                                     navigator, len(data)))
+            writer.write(data.tobytes())
+            await writer.drain()
+
+        writer.write(HEADER.pack(END_OF_SCAN, 0, time.time(), 0, 0, 0, 0, 0, 0))
+        await writer.drain()
+
+class ScannerClient:
+    """
+    Client receiving the readouts of a ScannerEmulator
+    """
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, address):
+        """
+        Connect to an emulator
+
+        Parameters:
+        -----------
+        address : tuple or str
+            (host, port) or Unix socket path
+        """
+        if isinstance(address, str):
+            self.reader, self.writer = await asyncio.open_unix_connection(address)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(*address)
+
+    async def readouts(self):
+        """
+        Receive readouts until the end of the scan
+
+        Yields:
+        -------
+        header : dict
+            'index', 'scan_time', 'acquired' (wall clock), 'encoding',
+            'phase', 'kz', 'ky', 'navigator'
+        data : ndarray
+            complex64 samples
+        """
+        while True:
+            fields = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+            index, scan_time, acquired, encoding, phase, kz, ky, navigator, n_samples = fields
+            if index == END_OF_SCAN:
+                return
+            data = np.frombuffer(await self.reader.readexactly(8 * n_samples), dtype=np.complex64)
+            yield {'index': index, 'scan_time': scan_time, 'acquired': acquired, 'encoding': encoding,
+                   'phase': phase, 'kz': kz, 'ky': ky, 'navigator': bool(navigator)}, data
+
+    async def close(self):
+        """Close the connection"""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def run_pipeline(client, assembler=None, batch_size=64, on_batch=None):
+    """
+    Feed streamed readouts into k-space assembly and navigator processing
+
+    Image readouts are assembled in batches; every navigator is turned
+    into a profile and its displacement from the first navigator is
+    estimated as soon as it arrives. Latency is measured from acquisition
+    to the end of processing of every readout.
+
+    Parameters:
+    -----------
+    client : ScannerClient
+        Connected client
+    assembler : KSpaceAssembler, optional
+        Assembler of the image readouts
+    batch_size : int
+        Image readouts per assembly batch
+    on_batch : callable, optional
+        Called with the list of (header, data) of every assembled batch,
+        e.g. to update a live preview
+
+    Returns:
+    --------
+    stats : dict
+        'n_readouts', 'n_navigators', 'bytes', 'elapsed' (s),
+        'readouts_per_s', 'mb_per_s', 'latency_mean', 'latency_p95',
+        'latency_max' (s) and 'displacement' (samples, per navigator)
+    """
+    from models.navigator import estimate_displacement, navigator_profiles
+
+    batch = []
+    latencies = []
+    displacement = []
+    reference = None
+    n_readouts = n_bytes = 0
+    t_start = time.perf_counter()
+
+    def process(batch):
+        if assembler is not None:
+            assembler.add(np.stack([data for _, data in batch]))
+        if on_batch is not None:
+            on_batch(batch)
+        done = time.time()
+        latencies.extend(done - header['acquired'] for header, _ in batch)
+
+    async for header, data in client.readouts():
+        n_readouts += 1
+        n_bytes += data.nbytes
+        if header['navigator']:
+            profile = navigator_profiles(data)
+            if reference is None:
+                reference = profile
+            displacement.append(estimate_displacement(profile, reference)[0])
+            latencies.append(time.time() - header['acquired'])
+            continue
+        batch.append((header, data))
+        if len(batch) >= batch_size:
+            process(batch)
+            batch = []
+    if batch:
+        process(batch)
+
+    elapsed = time.perf_counter() - t_start
+    latencies = np.asarray(latencies)
+    return {
+        'n_readouts': n_readouts,
+        'n_navigators': len(displacement),
+        'bytes': n_bytes,
+        'elapsed': elapsed,
+        'readouts_per_s': n_readouts / elapsed,
+        'mb_per_s': n_bytes / elapsed / 1e6,
+        'latency_mean': float(latencies.mean()) if len(latencies) else 0.0,
+        'latency_p95': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        'latency_max': float(latencies.max()) if len(latencies) else 0.0,
+        'displacement': np.asarray(displacement),
+    }
+
+async def simulate_scan(source, assembler=None, speed=1.0, path=None, batch_size=64, on_batch=None):
+    """
+    Run an emulator and a client pipeline in one event loop
+
+    Parameters:
+    -----------
+    source : ScanSource
+        Readouts to stream
+    assembler : KSpaceAssembler, optional
+        Assembler of the image readouts
+    speed : float
+        Time acceleration; 1 is real time
+    path : str, optional
+        Unix socket path; local TCP when not given
+    batch_size : int
+        Image readouts per assembly batch
+    on_batch : callable, optional
+        Called with every assembled batch
+
+    Returns:
+    --------
+    stats : dict
+        Pipeline statistics from run_pipeline plus the emulator 'max_lag'
+    """
+    emulator = ScannerEmulator(source, speed)
+    address = await emulator.start(path=path)
+    client = ScannerClient()
+    await client.connect(address)
+    try:
+        stats = await run_pipeline(client, assembler, batch_size, on_batch)
+    finally:
+        await client.close()
+        await emulator.close()
+    stats['max_lag'] = emulator.max_lag
+    return stats
@@ -3,15 +3,25 @@ from pypulseq.Sequence.sequence import Sequence
 from pypulseq.calc_duration import calc_duration
 from pypulseq.make_adc import make_adc
 from pypulseq.make_delay import make_delay
+from pypulseq.make_label import make_label
 from pypulseq.make_sinc_pulse import make_sinc_pulse
 from pypulseq.make_trap_pulse import make_trapezoid
 from pypulseq.opts import Opts
 
+from controllers.block_scheduler import fuse_tr_blocks
+from utils.pulseq_utils import estimate_seq_file_size, estimate_build_memory, echo_time, TIMING_TOLERANCE
+from utils.pulseq_utils import event_signature, register_block_events, register_label_extensions
+from utils.pulseq_utils import pypulseq_internals_supported
+
+# Labels set on every image readout: ky line, kz partition, cardiac phase
+# and flow encoding; NAV flags navigator readouts
+ADC_LABELS = ('LIN', 'PAR', 'PHS', 'SET')
+
 class SequenceBuilder:
     """
     Main controller for building the 4D flow MRI sequence
     """
-    def __init__(self, params, system):
+    def __init__(self, params, system, sampling_mask=None):
         """
         Initialize sequence builder
         
@@ -21,62 +31,90 @@ class SequenceBuilder:
             Sequence parameters
         system : Opts
             System limits
+        sampling_mask : ndarray, optional
+            Precomputed 2D sampling mask (n_phase x n_slice). Generated from
+            the parameters when not given.
         """
         self.params = params
         self.system = system
         self.seq = Sequence(system)
         
-        # Import required modules
-        from models.velocity_encoding import create_flow_encoding_gradients
+        # Create sampling mask, ReCAR order, flow encodings and the events
+        # shared by every TR
+        self.sampling_mask = sampling_mask
+        if sampling_mask is None:
+            self.update_params(params, ('mask', 'order', 'templates'))
+        else:
+            self.update_params(params, ('order', 'templates'))
+        
+    def update_params(self, params, stages):
+        """
+        Switch to new parameters and recompute the given build stages
+        
+        Parameters:
+        -----------
+        params : SequenceParams
+            Sequence parameters
+        stages : iterable of str
+            Stages to recompute: 'mask' (sampling mask), 'order' (ReCAR
+            controller) and 'templates' (flow encodings and TR events)
+        """
+        from models.velocity_encoding import compile_encodings
         from models.compressed_sensing import generate_phyllotaxis_sampling
         from controllers.recar_controller import RecarController
         
-        # Create flow encoding gradients
-        self.flow_encodings = create_flow_encoding_gradients(
-            self.params.venc, 
-            self.system, 
-            self.params.flow_directions
-        )
+        self.params = params
         
         # Create sampling mask for compressed sensing
-        self.sampling_mask = generate_phyllotaxis_sampling(
-            self.params.matrix_size[1],  # phase
-            self.params.matrix_size[2],  # slice
-            self.params.acceleration_factor,
-            self.params.center_fraction
-        )
+        if 'mask' in stages:
+            self.sampling_mask = generate_phyllotaxis_sampling(
+                self.params.matrix_size[1],  # phase
+                self.params.matrix_size[2],  # slice
+                self.params.acceleration_factor,
+                self.params.center_fraction,
+                self.params.calib_size
+            )
         
         # Create ReCAR controller
-        self.recar = RecarController(
-            self.sampling_mask,
-            self.params.n_cardiac_phases
-        )
+        if 'order' in stages:
+            self.recar = RecarController(
+                self.sampling_mask,
+                self.params.n_cardiac_phases
+            )
         
-    def make_gre_module(self, phase_index, slice_index, flow_encoding):
-        """
-        Create a gradient echo module with flow encoding
+        if 'templates' in stages:
+            # Create flow encoding gradients for every VENC
+            self.flow_encodings = compile_encodings(
+                self.params.encoding_scheme,
+                (self.params.venc,) + self.params.vencs,
+                self.system, 
+                self.params.flow_directions
+            )
+            
+            # Events shared by every TR are created once and reused
+            self.templates = self._make_event_templates()
+            self._phase_encodes = {}
+            self._slice_encodes = {}
+            self._block_rows = {}
+            self._block_rows_seq = None
+            self._label_cache = {}
         
-        Parameters:
-        -----------
-        phase_index : int
-            Phase encoding index
-        slice_index : int
-            Slice encoding index
-        flow_encoding : dict
-            Flow encoding gradients
+    def _make_event_templates(self):
+        """
+        Create the events that are identical for every TR
             
         Returns:
         --------
-        None
+        templates : dict
+            RF pulse, slice-select and refocusing gradients, readout
+            prephaser, readout gradient and ADC
         """
-        # Calculate derived parameters
         delta_k_phase = 1 / self.params.fov[1]
-        delta_k_slice = 1 / self.params.fov[2]
         
-        # Create RF pulse (sinc with 3 lobes)
-        rf, gz = make_sinc_pulse(flip_angle=self.params.flip_angle, 
+        # Create RF pulse (sinc with 3 lobes) exciting the whole 3D slab
+        rf, gz, _ = make_sinc_pulse(flip_angle=np.deg2rad(self.params.flip_angle),
                                duration=self.params.t_rf,
-                               slice_thickness=self.params.resolution[2],
+                                  slice_thickness=self.params.fov[2],
                                apodization=0.5, 
                                time_bw_product=4,
                                system=self.system, 
@@ -88,64 +126,363 @@ class SequenceBuilder:
                                area=-gz.area/2, 
                                duration=0.5e-3)
         
-        # Phase encoding gradient
-        phase_area = (phase_index - self.params.matrix_size[1]/2) * delta_k_phase
-        gy_phase = make_trapezoid(channel='y', 
-                                system=self.system,
-                                area=phase_area, 
-                                duration=0.5e-3)
-        
-        # Slice encoding gradient (for 3D)
-        slice_area = (slice_index - self.params.matrix_size[2]/2) * delta_k_slice
-        gz_phase = make_trapezoid(channel='z', 
-                                system=self.system,
-                                area=slice_area, 
-                                duration=0.5e-3)
-        
-        # Readout gradient
-        gx_pre = make_trapezoid(channel='x', 
-                              system=self.system,
-                              area=-self.params.matrix_size[0]/2 * delta_k_phase, 
-                              duration=0.5e-3)
-        
+        # Readout gradient, with the k-space width on the flat top. The
+        # prephaser cancels half the readout area including the ramp, so the
+        # echo falls at the centre of the ADC.
         gx_readout = make_trapezoid(channel='x', 
                                   system=self.system,
-                                  area=self.params.matrix_size[0] * delta_k_phase, 
-                                  duration=self.params.t_readout + 0.6e-3,
+                                  flat_area=self.params.matrix_size[0] * delta_k_phase, 
                                   flat_time=self.params.t_readout)
         
-        # ADC
+        gx_pre = make_trapezoid(channel='x', 
+                              system=self.system,
+                              area=-gx_readout.area/2)
+        
+        # ADC on the flat top of the readout
         adc = make_adc(num_samples=self.params.matrix_size[0], 
                       duration=self.params.t_readout,
-                      delay=0.3e-3, 
+                      delay=gx_readout.rise_time, 
                       system=self.system)
         
-        # Add blocks to sequence
-        self.seq.add_block(rf, gz)
-        self.seq.add_block(gz_reph)
-        
-        # Add flow encoding if needed
-        if flow_encoding['name'] != 'reference':
-            for direction, bipolar_pair in flow_encoding['gradients'].items():
-                bipolar_pos, bipolar_neg = bipolar_pair
-                self.seq.add_block(bipolar_pos)
-                self.seq.add_block(bipolar_neg)
+        return {'rf': rf, 'gz': gz, 'gz_reph': gz_reph, 'gx_pre': gx_pre,
+                'gx_readout': gx_readout, 'adc': adc}
+
+    def _get_phase_encodes(self, phase_index, slice_index):
+        """
+        Get the phase and slice encoding gradients for a k-space point
+
+        Gradients are cached per index, so each distinct line is only
+        designed once per build.
+
+        Parameters:
+        -----------
+        phase_index : int
+            Phase encoding index
+        slice_index : int
+            Slice encoding index
+
+        Returns:
+        --------
+        gy_phase, gz_phase : tuple
+            Phase and slice encoding gradients
+        """
+        gy_phase = self._phase_encodes.get(phase_index)
+        if gy_phase is None:
+            # Phase encoding gradient
+            phase_area = (phase_index - self.params.matrix_size[1]/2) / self.params.fov[1]
+            gy_phase = make_trapezoid(channel='y',
+                                    system=self.system,
+                                    area=phase_area,
+                                    duration=0.5e-3)
+            self._phase_encodes[phase_index] = gy_phase
+
+        gz_phase = self._slice_encodes.get(slice_index)
+        if gz_phase is None:
+            # Slice encoding gradient (for 3D)
+            slice_area = (slice_index - self.params.matrix_size[2]/2) / self.params.fov[2]
+            gz_phase = make_trapezoid(channel='z',
+                                    system=self.system,
+                                    area=slice_area,
+                                    duration=0.5e-3)
+            self._slice_encodes[slice_index] = gz_phase
+
+        return gy_phase, gz_phase
+
+    def _tr_blocks(self, gy_phase, gz_phase, flow_encoding):
+        """
+        List the blocks of one TR
+
+        Parameters:
+        -----------
+        gy_phase, gz_phase : SimpleNamespace
+            Phase and slice encoding gradients
+        flow_encoding : dict
+            Flow encoding gradients
+
+        Returns:
+        --------
+        blocks : list
+            (role, events) tuples, one per sequence block. role names the
+            purpose of the block, e.g. 'excitation' or 'bipolar_lobe_1'.
+        """
+        t = self.templates
+        blocks = [('excitation', (t['rf'], t['gz'])), ('rephase', (t['gz_reph'],))]
         
-        # Continue with phase encoding and readout
-        self.seq.add_block(gy_phase, gz_phase, gx_pre)
+        # Add flow encoding if needed, playing the bipolars of all encoded
+        # axes at the same time
+        if flow_encoding['gradients']:
+            lobes = list(zip(*flow_encoding['gradients'].values()))
+            blocks.append(('bipolar_lobe_1', lobes[0]))
+            blocks.append(('bipolar_lobe_2', lobes[1]))
         
-        # Calculate timing for TE
-        delay_te = self.params.te - calc_duration(rf) - calc_duration(gz_reph) - calc_duration(gx_pre) - calc_duration(gx_readout)/2
+        # Calculate timing for TE, from the start of the TR to the centre of
+        # the ADC, including any flow encoding blocks. The delay goes before
+        # the phase encode, where every gradient moment is refocused, so it
+        # does not change the first moment at the echo.
+        phase_encode = (gy_phase, gz_phase, t['gx_pre'])
+        readout = (t['gx_readout'], t['adc'])
+        delay_te = (self.params.te - sum(calc_duration(*events) for _, events in blocks)
+                    - calc_duration(*phase_encode) - echo_time([readout]))
         if delay_te > 0:
-            self.seq.add_block(make_delay(delay_te))
+            blocks.append(('te_delay', (make_delay(delay_te),)))
         
-        self.seq.add_block(gx_readout, adc)
+        # Continue with phase encoding and readout
+        blocks.append(('phase_encode', phase_encode))
+        blocks.append(('readout', readout))
         
         # Calculate timing for TR
-        delay_tr = self.params.tr - calc_duration(rf) - calc_duration(gz_reph) - calc_duration(gx_pre) - calc_duration(gx_readout) - delay_te
+        delay_tr = self.params.tr - sum(calc_duration(*events) for _, events in blocks)
         if delay_tr > 0:
-            self.seq.add_block(make_delay(delay_tr))
-    
+            blocks.append(('tr_delay', (make_delay(delay_tr),)))
+
+        # Overlap events on different channels in fewer blocks
+        if self.params.block_fusion:
+            blocks = fuse_tr_blocks(blocks, self.system, self.params.te, self.params.tr)
+
+        return blocks
+
+    def tr_layout(self):
+        """
+        Describe the blocks of one TR for every flow encoding
+
+        Block durations do not depend on the phase encoding index, so the
+        layout is computed at the k-space centre.
+
+        Returns:
+        --------
+        layout : list
+            Per flow encoding, a list of (role, events, duration) tuples
+        """
+        gy_phase, gz_phase = self._get_phase_encodes(self.params.matrix_size[1] // 2,
+                                                     self.params.matrix_size[2] // 2)
+        layout = []
+        for flow_encoding in self.flow_encodings:
+            blocks = self._tr_blocks(gy_phase, gz_phase, flow_encoding)
+            layout.append([(role, events, calc_duration(*events)) for role, events in blocks])
+        return layout
+
+    def make_gre_module(self, phase_index, slice_index, flow_encoding, labels=()):
+        """
+        Create a gradient echo module with flow encoding
+
+        Parameters:
+        -----------
+        phase_index : int
+            Phase encoding index
+        slice_index : int
+            Slice encoding index
+        flow_encoding : dict
+            Flow encoding gradients
+        labels : tuple, optional
+            Label events added to the readout block
+
+        Returns:
+        --------
+        None
+        """
+        gy_phase, gz_phase = self._get_phase_encodes(phase_index, slice_index)
+
+        # Add blocks to sequence
+        for role, events in self._tr_blocks(gy_phase, gz_phase, flow_encoding):
+            if labels and 'readout' in role.split('+'):
+                events = tuple(events) + tuple(labels)
+            self._add_block(events)
+
+    def _add_block(self, events):
+        """
+        Add a block, reusing the library IDs of identical earlier blocks
+
+        The events of a block are registered in the sequence libraries the
+        first time they occur; repeated blocks only append their cached row
+        of event IDs, so the cost per TR does not grow with the number of
+        distinct encodings. The rows are written to pypulseq's private
+        block table, so other pypulseq releases than the pinned one always
+        go through Sequence.add_block.
+
+        Parameters:
+        -----------
+        events : tuple
+            Events of the block
+        """
+        signatures = tuple(event_signature(event) for event in events)
+        if None in signatures or not pypulseq_internals_supported():
+            self.seq.add_block(*events)
+            return
+
+        # Labels only change the extension column of the row
+        is_label = [event.type in ('labelset', 'labelinc') for event in events]
+        labels = tuple(event for event, label in zip(events, is_label) if label)
+        if labels:
+            signatures = tuple(signature for signature, label in zip(signatures, is_label) if not label)
+            events = tuple(event for event, label in zip(events, is_label) if not label)
+
+        # Cached rows refer to the libraries of one sequence object
+        if self._block_rows_seq is not self.seq:
+            self._block_rows = {}
+            self._label_cache = {}
+            self._block_rows_seq = self.seq
+
+        cached = self._block_rows.get(signatures)
+        if cached is None:
+            # Keep the events alive, signatures refer to their waveforms
+            cached = (register_block_events(self.seq, *events), calc_duration(*events), events)
+            self._block_rows[signatures] = cached
+        row, duration, _ = cached
+        row = row.copy()
+        if labels:
+            row[6] = register_label_extensions(self.seq, labels, self._label_cache)
+
+        self.seq.dict_block_events[len(self.seq.dict_block_events) + 1] = row
+        self.seq.arr_block_durations.append(duration)
+
+    def plan(self):
+        """
+        Dry run: compute scan statistics without building the sequence
+
+        Block durations do not depend on the phase encoding index, so the
+        blocks of one TR per flow encoding are timed once and scaled by the
+        number of sampled points in the mask. Nothing is added to the
+        sequence.
+
+        Returns:
+        --------
+        plan : dict
+            'duration' : total scan time in seconds
+            'n_trs' : number of TRs
+            'n_blocks' : number of sequence blocks
+            'tr_durations' : duration of one TR per flow encoding in seconds
+            'echo_times' : echo time per flow encoding in seconds
+            'seq_file_size' : estimated size of the exported .seq file in bytes
+            'peak_memory' : estimated peak memory of the build in bytes
+            'warnings' : TR and TE that the protocol cannot reach, as text
+        """
+        n_points = int(np.count_nonzero(self.sampling_mask == 1))
+        n_lines = n_points * self.params.n_cardiac_phases
+
+        # Time one TR per flow encoding
+        tr_durations = {}
+        echo_times = {}
+        warnings = []
+        duration = 0
+        n_blocks = 0
+        for flow_encoding, blocks in zip(self.flow_encodings, self.tr_layout()):
+            name = flow_encoding['name']
+            tr_duration = sum(block_duration for _, _, block_duration in blocks)
+            tr_durations[name] = tr_duration
+            echo_times[name] = echo_time([events for _, events, _ in blocks])
+            duration += n_lines * tr_duration
+            n_blocks += n_lines * len(blocks)
+            
+            # The delays cannot be negative: flag a TR or TE that is too short
+            if tr_duration > self.params.tr + TIMING_TOLERANCE:
+                warnings.append(f"TR of '{name}' is {tr_duration*1e3:.2f} ms, "
+                                f"longer than the requested {self.params.tr*1e3:.2f} ms")
+            if abs(echo_times[name] - self.params.te) > TIMING_TOLERANCE:
+                warnings.append(f"TE of '{name}' is {echo_times[name]*1e3:.2f} ms, "
+                                f"not the requested {self.params.te*1e3:.2f} ms")
+
+        # Navigator echoes are played before every navigator_interval-th line
+        n_adcs = n_lines * len(self.flow_encodings)
+        if self.params.navigator_enabled:
+            nav_blocks = self.recar.navigator_blocks(self.system)
+            n_navigators = len(self.recar.navigator_lines(self.params.navigator_interval))
+            duration += n_navigators * sum(calc_duration(*events) for events in nav_blocks)
+            n_blocks += n_navigators * len(nav_blocks)
+            n_adcs += n_navigators * sum(any(event.type == 'adc' for event in events) for events in nav_blocks)
+
+        n_phase_lines = len(np.unique(np.nonzero(self.sampling_mask == 1)[0]))
+        n_slice_lines = len(np.unique(np.nonzero(self.sampling_mask == 1)[1]))
+        n_gradients = n_phase_lines + n_slice_lines + 2 * len(self.flow_encodings) + 4
+
+        return {
+            'duration': duration,
+            'n_trs': n_lines * len(self.flow_encodings),
+            'n_blocks': n_blocks,
+            'tr_durations': tr_durations,
+            'echo_times': echo_times,
+            'seq_file_size': estimate_seq_file_size(n_blocks, n_gradients,
+                                                    n_adcs if self.params.adc_labels else 0),
+            'peak_memory': estimate_build_memory(n_blocks, n_lines) + self.sampling_mask.nbytes,
+            'warnings': warnings,
+        }
+
+    def readout_order(self):
+        """
+        Describe every ADC of the built sequence, in acquisition order
+
+        Every TR holds one readout and every navigator echo one navigator
+        readout, so the ADC order follows from the sampling order and the
+        navigator positions without building the sequence.
+
+        Returns:
+        --------
+        readouts : dict
+            Arrays with one entry per ADC event:
+            'navigator' : True for navigator readouts
+            'line' : index into the sampling order
+            'encoding' : index into flow_encodings, -1 for navigators
+            'ky', 'kz' : phase and slice encoding indices
+            'cardiac_phase' : cardiac phase assigned by the ReCAR order
+        """
+        order = np.asarray(self.recar.get_sampling_order(), dtype=int).reshape(-1, 3)
+        n_lines = len(order)
+        n_encodings = len(self.flow_encodings)
+
+        nav_lines = np.zeros(0, dtype=int)
+        if self.params.navigator_enabled:
+            nav_lines = self.recar.navigator_lines(self.params.navigator_interval)
+        has_nav = np.zeros(n_lines, dtype=int)
+        has_nav[nav_lines] = 1
+
+        # Per line: an optional navigator readout followed by one readout per encoding
+        counts = n_encodings + has_nav
+        line = np.repeat(np.arange(n_lines), counts)
+        position = np.arange(len(line)) - np.repeat(np.cumsum(counts) - counts, counts)
+        navigator = position < has_nav[line]
+        encoding = np.where(navigator, -1, position - has_nav[line])
+
+        return {
+            'navigator': navigator,
+            'line': line,
+            'encoding': encoding,
+            'ky': order[line, 0],
+            'kz': order[line, 1],
+            'cardiac_phase': order[line, 2],
+        }
+
+    def adc_label_events(self):
+        """
+        Create the label events of every ADC, in acquisition order
+
+        Image readouts set LIN (ky), PAR (kz), PHS (cardiac phase), SET
+        (flow encoding) and NAV=False; navigator readouts set NAV=True, so
+        raw data can be sorted without knowing the sampling order. The
+        values come from readout_order and readouts with the same value
+        share one label event.
+
+        Returns:
+        --------
+        labels : list
+            Tuple of label events for every ADC
+        """
+        readouts = self.readout_order()
+        columns = {'LIN': readouts['ky'], 'PAR': readouts['kz'],
+                   'PHS': readouts['cardiac_phase'], 'SET': readouts['encoding']}
+        # make_label only accepts Python ints and bools
+        values = np.stack([columns[name] for name in ADC_LABELS], axis=1).tolist()
+
+        events = {}
+        def label(name, value):
+            if (name, value) not in events:
+                events[name, value] = make_label(type='SET', label=name, value=value)
+            return events[name, value]
+
+        navigator = (label('NAV', True),)
+        image = label('NAV', False)
+        return [navigator if is_navigator else
+                tuple(label(name, value) for name, value in zip(ADC_LABELS, row)) + (image,)
+                for is_navigator, row in zip(readouts['navigator'].tolist(), values)]
+
     def build_sequence(self):
         """
         Build the complete 4D flow sequence
@@ -158,20 +495,39 @@ class SequenceBuilder:
         # Get sampling order from ReCAR
         sampling_order = self.recar.get_sampling_order()
         
-        # Add navigator echo if enabled
+        # Navigator echoes precede every navigator_interval-th k-space line,
+        # so all flow encodings of a line stay together
+        nav_blocks = []
+        nav_lines = set()
         if self.params.navigator_enabled:
-            self.recar.add_navigator_echo(self.seq, self.system)
+            nav_blocks = self.recar.navigator_blocks(self.system)
+            nav_lines = set(self.recar.navigator_lines(self.params.navigator_interval).tolist())
+        
+        # Label events of every ADC, in acquisition order
+        labels = iter(self.adc_label_events()) if self.params.adc_labels else None
         
         # Add sequence blocks for each point in the sampling order
-        for p_idx, s_idx, c_phase in sampling_order:
+        for line, (p_idx, s_idx, c_phase) in enumerate(sampling_order):
+            if line in nav_lines:
+                for events in nav_blocks:
+                    if labels is not None and any(event.type == 'adc' for event in events):
+                        events = tuple(events) + next(labels)
+                    self._add_block(events)
             # For each k-space point, we need multiple acquisitions (reference + flow encodings)
             for flow_encoding in self.flow_encodings:
-                self.make_gre_module(p_idx, s_idx, flow_encoding)
+                self.make_gre_module(p_idx, s_idx, flow_encoding, next(labels) if labels is not None else ())
+        
+        self.set_definitions()
         
-        # Set sequence parameters
+        return self.seq
+    
+    def set_definitions(self):
+        """
+        Set the sequence definitions from the parameters
+        """
         self.seq.set_definition('FOV', self.params.fov)
         self.seq.set_definition('Name', '4D_flow_CS_ReCAR')
         self.seq.set_definition('VoxelSize', self.params.resolution)
         self.seq.set_definition('VENC', self.params.venc)
-        
-        return self.seq
\ No newline at end of file
+        if self.params.vencs:
+            self.seq.set_definition('VENCs', (self.params.venc,) + self.params.vencs)
@@ -0,0 +1,208 @@
+"""Parameter sweeps over SequenceParams using a process pool."""
+
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+# Per-worker state, set once by _init_worker in every pool process
+_worker_params = None
+_worker_system = None
+
+# Result columns and their dtypes, in table order
+RESULT_FIELDS = [
+    ('n_samples', np.int64),
+    ('n_trs', np.int64),
+    ('n_blocks', np.int64),
+    ('duration', np.float64),
+    ('seq_file_size', np.int64),
+    ('peak_memory', np.int64),
+    ('build_time', np.float64),
+]
+
+def _init_worker(base_params, system):
+    """
+    Initialize a sweep worker process
+
+    Parameters:
+    -----------
+    base_params : SequenceParams
+        Parameters shared by every sweep point
+    system : Opts
+        System limits
+    """
+    global _worker_params, _worker_system
+    _worker_params = base_params
+    _worker_system = system
+
+@lru_cache(maxsize=256)
+def _cached_mask(n_phase, n_slice, acceleration_factor, center_fraction, calib_size):
+    """
+    Generate a phyllotaxis sampling mask, cached per worker process
+
+    Sweep points that only differ in VENC, timing or cardiac phases share
+    the same mask, so each worker designs it once.
+    """
+    from models.compressed_sensing import generate_phyllotaxis_sampling
+
+    mask = generate_phyllotaxis_sampling(n_phase, n_slice, acceleration_factor, center_fraction, calib_size)
+    mask.setflags(write=False)
+    return mask
+
+def _run_sweep_point(point, build=False):
+    """
+    Plan (and optionally build) the sequence for one sweep point
+
+    Parameters:
+    -----------
+    point : dict
+        Parameter values overriding the worker's base parameters
+    build : bool
+        Also build the full sequence and record the build time
+
+    Returns:
+    --------
+    row : dict
+        Result values keyed by RESULT_FIELDS names
+    """
+    from controllers.sequence_builder import SequenceBuilder
+
+    params = _worker_params.replace(**point)
+
+    mask = _cached_mask(int(params.matrix_size[1]), int(params.matrix_size[2]),
+                        params.acceleration_factor, params.center_fraction, params.calib_size)
+
+    builder = SequenceBuilder(params, _worker_system, sampling_mask=mask)
+    plan = builder.plan()
+
+    build_time = np.nan
+    if build:
+        t_start = time.perf_counter()
+        seq = builder.build_sequence()
+        build_time = time.perf_counter() - t_start
+        plan['duration'] = seq.duration()[0]
+
+    return {
+        'n_samples': int(np.count_nonzero(mask == 1)),
+        'n_trs': plan['n_trs'],
+        'n_blocks': plan['n_blocks'],
+        'duration': plan['duration'],
+        'seq_file_size': plan['seq_file_size'],
+        'peak_memory': plan['peak_memory'],
+        'build_time': build_time,
+    }
+
+def expand_grid(grid):
+    """
+    Expand a parameter grid into the list of sweep points
+
+    Parameters:
+    -----------
+    grid : dict
+        Mapping of SequenceParams attribute name to a list of values
+
+    Returns:
+    --------
+    points : list
+        One dict per combination, last key varying fastest
+    """
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+def _grid_dtype(grid):
+    """Build the structured dtype of the parameter columns of a grid."""
+    dtype = []
+    for name, values in grid.items():
+        values = np.asarray(values)
+        if values.ndim > 1:
+            dtype.append((name, values.dtype, values.shape[1:]))
+        else:
+            dtype.append((name, values.dtype))
+    return dtype
+
+def run_parameter_sweep(grid, base_params, system, build=False, n_workers=None, chunksize=None):
+    """
+    Run a parameter sweep across a process pool
+
+    Parameters:
+    -----------
+    grid : dict
+        Mapping of SequenceParams attribute name to a list of values,
+        e.g. {'venc': [1.0, 1.5], 'acceleration_factor': [4, 6, 8]}
+    base_params : SequenceParams
+        Parameters shared by every sweep point
+    system : Opts
+        System limits
+    build : bool, optional
+        Also build every sequence (slow). By default only the dry-run plan
+        is computed.
+    n_workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs; 1 runs
+        the sweep in the current process.
+    chunksize : int, optional
+        Sweep points sent to a worker at a time
+
+    Returns:
+    --------
+    results : ndarray
+        Structured array with one row per sweep point, holding the grid
+        parameters followed by the RESULT_FIELDS columns
+    """
+    points = expand_grid(grid)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers == 1:
+        _init_worker(base_params, system)
+        rows = [_run_sweep_point(point, build) for point in points]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(points) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(base_params, system)) as pool:
+            rows = list(pool.map(_run_sweep_point, points, [build] * len(points),
+                                 chunksize=chunksize))
+
+    results = np.zeros(len(points), dtype=_grid_dtype(grid) + RESULT_FIELDS)
+    for name in grid:
+        results[name] = [point[name] for point in points]
+    for name, _ in RESULT_FIELDS:
+        results[name] = [row[name] for row in rows]
+
+    return results
+
+def save_sweep_csv(results, filename):
+    """
+    Save sweep results to a CSV file
+
+    Array-valued columns such as matrix_size are written as one column
+    per element (matrix_size_0, matrix_size_1, ...).
+
+    Parameters:
+    -----------
+    results : ndarray
+        Structured array returned by run_parameter_sweep
+    filename : str
+        Output CSV filename
+    """
+    header = []
+    columns = []
+    for name in results.dtype.names:
+        column = results[name]
+        if column.ndim > 1:
+            for i in range(column.shape[1]):
+                header.append(f'{name}_{i}')
+                columns.append(column[:, i])
+        else:
+            header.append(name)
+            columns.append(column)
+
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in zip(*columns):
+            writer.writerow([value.item() for value in row])
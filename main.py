@@ -1,161 +1,97 @@
-# def main():
-#     # System limits
-#     system = Opts(max_grad=40, grad_unit='mT/m', max_slew=130, slew_unit='T/m/s', 
-#                   rf_ringdown_time=30e-6, rf_dead_time=100e-6)
-    
-#     # Create a new sequence object
-#     seq = Sequence(system)
-    
-#     # Define sequence parameters
-#     fov = 280e-3                # Field of view in meters
-#     n_readout = 192             # Number of readout points
-#     n_phase = 128               # Number of phase encoding steps
-#     n_slice = 32                # Number of slices
-#     n_cardiac_phases = 20       # Number of cardiac phases
-#     slice_thickness = 2.5e-3    # Slice thickness in meters
-#     tr = 5.0e-3                 # Repetition time in seconds
-#     te = 2.5e-3                 # Echo time in seconds
-#     flip_angle = 8              # Flip angle in degrees
-#     venc = 150e-2               # Velocity encoding value in m/s (150 cm/s)
-#     acceleration_factor = 6     # Acceleration factor for compressed sensing
-    
-#     # Create the 4D flow sequence
-#     seq = create_4d_flow_sequence(seq, system, fov, n_readout, n_phase, n_slice, 
-#                                  n_cardiac_phases, slice_thickness, tr, te, 
-#                                  flip_angle, venc, acceleration_factor)
-    
-#     # Check sequence timing
-#     ok, error_report = seq.check_timing()
-#     if not ok:
-#         print("Timing check failed!")
-#         print(error_report)
-#         return
-    
-#     # Export the sequence
-#     seq.write('4d_flow_cs_recar.seq')
-#     print("Sequence successfully exported to 4d_flow_cs_recar.seq")
-    
-#     # Calculate sequence duration
-#     duration = seq.duration()[0]
-#     print(f"Sequence duration: {duration:.2f} s ({duration/60:.2f} min)")
-
-# if __name__ == "__main__":
-#     main() 
-
-# import os
-# import numpy as np
-# import matplotlib.pyplot as plt
-# from pypulseq.Sequence.sequence import Sequence
-# from pypulseq.opts import Opts
-
-# from models.sequence_params import SequenceParams
-# from controllers.sequence_builder import SequenceBuilder
-# from views.sequence_plot import plot_sequence
-# from views.k_space_viewer import plot_sampling_pattern
-
-# def main():
-#     """
-#     Main function to build and export the 4D flow sequence
-#     """
-#     # Create output directory if it doesn't exist
-#     os.makedirs('output', exist_ok=True)
-    
-#     # Define system limits
-#     system = Opts(max_grad=40, grad_unit='mT/m', 
-#                   max_slew=130, slew_unit='T/m/s',
-#                   rf_ringdown_time=30e-6, 
-#                   rf_dead_time=100e-6)
-    
-#     # Create sequence parameters
-#     params = SequenceParams()
-    
-#     # Optionally update parameters
-#     params.update(
-#         fov=[280e-3, 280e-3, 140e-3],
-#         matrix_size=[192, 128, 32],
-#         venc=150e-2,  # 150 cm/s
-#         acceleration_factor=6,
-#         n_cardiac_phases=20
-#     )
-    
-#     # Create sequence builder
-#     builder = SequenceBuilder(params, system)
-    
-#     # Build the sequence
-#     seq = builder.build_sequence()
-    
-#     # Check sequence timing
-#     ok, error_report = seq.check_timing()
-#     if not ok:
-#         print("Timing check failed!")
-#         print(error_report)
-#         return
-    
-#     # Export the sequence
-#     seq.write('output/4d_flow_cs_recar.seq')
-#     print("Sequence successfully exported to output/4d_flow_cs_recar.seq")
-    
-#     # Calculate sequence duration
-#     duration = seq.duration()[0]
-#     print(f"Sequence duration: {duration:.2f} s ({duration/60:.2f} min)")
-    
-#     # Plot sequence diagram
-#     plot_sequence(seq, 'output/sequence_diagram.png')
-    
-#     # Plot sampling pattern
-#     from models.compressed_sensing import generate_phyllotaxis_sampling
-#     mask = generate_phyllotaxis_sampling(
-#         params.matrix_size[1], 
-#         params.matrix_size[2], 
-#         params.acceleration_factor
-#     )
-#     plot_sampling_pattern(mask, 'output/sampling_pattern.png')
-
-# if __name__ == "__main__":
-#     main()
+"""Command line interface for building, planning and exporting 4D flow sequences.
 
+Heavy dependencies (pypulseq, matplotlib) are imported inside the
+subcommands that need them, so starting the CLI stays cheap.
+
+Usage:
+    python main.py plan --venc 1.0
+    python main.py build
+    python main.py export -o output/4d_flow_cs_recar.seq
+    python main.py plot --output-dir output
+    python main.py report --vary venc=1.0,1.5 --vary acceleration_factor=4,6
+    python main.py bench
+"""
+
+import argparse
 import os
-import numpy as np
-import matplotlib.pyplot as plt
-from pypulseq.Sequence.sequence import Sequence
+import subprocess
+import sys
+import time
 
 from config.default_config import DefaultConfig
-from config.system_config import SystemConfig
-from models.sequence_params import SequenceParams
-from controllers.sequence_builder import SequenceBuilder
-from controllers.export_controller import export_sequence
-from views.sequence_plot import plot_sequence
-from views.k_space_viewer import plot_sampling_pattern
-from utils.pulseq_utils import check_sequence_timing, calculate_sequence_duration
-
-def main():
-    """Main function to build and export the 4D flow sequence."""
-    # Create output directory if it doesn't exist
-    os.makedirs('output', exist_ok=True)
-    
-    # Load default configuration
-    default_config = DefaultConfig()
-    
-    # Create system configuration
-    system_config = SystemConfig()
-    system = system_config.get_opts()
-    
-    # Create sequence parameters
-    params = SequenceParams()
-    
-    # Update parameters from default configuration
-    params.update(
-        fov=default_config.FOV,
-        matrix_size=default_config.MATRIX_SIZE,
-        venc=default_config.VENC,
-        acceleration_factor=default_config.ACCELERATION_FACTOR,
-        n_cardiac_phases=default_config.N_CARDIAC_PHASES
+
+# Target wall time for starting the CLI in a fresh interpreter [s]
+COLD_START_TARGET = 0.2
+
+DEFAULT_OUTPUT = 'output/4d_flow_cs_recar.seq'
+
+def make_params(args):
+    """Create SequenceParams from the default configuration and CLI options."""
+    from models.sequence_params import SequenceParams
+    
+    return SequenceParams(
+        fov=args.fov,
+        matrix_size=args.matrix_size,
+        tr=args.tr,
+        te=args.te,
+        venc=args.venc,
+        vencs=args.vencs,
+        encoding_scheme=args.encoding_scheme,
+        flip_angle=args.flip_angle,
+        acceleration_factor=args.acceleration_factor,
+        n_cardiac_phases=args.n_cardiac_phases,
+        navigator_enabled=not args.no_navigator,
+        navigator_interval=args.navigator_interval,
+        adc_labels=not args.no_adc_labels,
+        block_fusion=args.block_fusion
     )
+
+def protocol_argv(args):
+    """Convert parsed protocol options back to command line arguments."""
+    argv = ['--fov', *map(str, args.fov), '--matrix-size', *map(str, args.matrix_size),
+            '--tr', str(args.tr), '--te', str(args.te), '--venc', str(args.venc),
+            '--vencs', *map(str, args.vencs), '--encoding-scheme', args.encoding_scheme,
+            '--flip-angle', str(args.flip_angle),
+            '--acceleration-factor', str(args.acceleration_factor),
+            '--n-cardiac-phases', str(args.n_cardiac_phases),
+            '--navigator-interval', str(args.navigator_interval)]
+    if args.no_navigator:
+        argv.append('--no-navigator')
+    if args.block_fusion:
+        argv.append('--block-fusion')
+    if args.no_adc_labels:
+        argv.append('--no-adc-labels')
+    return argv
+
+def make_system():
+    """Create the pypulseq system limits."""
+    from config.system_config import SystemConfig
     
-    # Create sequence builder
-    builder = SequenceBuilder(params, system)
+    return SystemConfig().get_opts()
+
+def get_artifact(params, system, use_cache=True):
+    """
+    Get the built sequence for a protocol, from the cache if possible.
+    
+    Returns:
+    --------
+    entry : dict or None
+        Cache entry (see ArtifactCache.get), None if the timing check failed
+    seq : Sequence or None
+        Built sequence, None on a cache hit
+    """
+    from controllers.artifact_cache import ArtifactCache, artifact_key
+    from controllers.sequence_builder import SequenceBuilder
+    from utils.pulseq_utils import check_sequence_timing, calculate_sequence_duration
+    
+    cache = ArtifactCache(DefaultConfig.CACHE_DIR, DefaultConfig.CACHE_MAX_SIZE)
+    key = artifact_key(params, system)
+    if use_cache:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, None
     
-    # Build the sequence
+    builder = SequenceBuilder(params, system)
     seq = builder.build_sequence()
     
     # Check sequence timing
@@ -163,26 +99,314 @@ def main():
     if not ok:
         print("Timing check failed!")
         print(error_report)
-        return
-    
-    # Export the sequence
-    export_sequence(seq, 'output/4d_flow_cs_recar.seq')
+        return None, seq
     
-    # Calculate sequence duration
     duration = calculate_sequence_duration(seq)
+    entry = cache.put(key, seq, builder.sampling_mask, builder.recar.get_sampling_order(),
+                      meta={'duration': duration})
+    return entry, seq
+
+def cmd_plan(args):
+    """Print the dry-run plan of a protocol."""
+    from controllers.sequence_builder import SequenceBuilder
+    
+    plan = SequenceBuilder(make_params(args), make_system()).plan()
+    duration = plan['duration']
+    print(f"Sequence duration: {duration:.2f} s ({duration/60:.2f} min)")
+    print(f"TRs: {plan['n_trs']}, blocks: {plan['n_blocks']}")
+    for name, tr_duration in plan['tr_durations'].items():
+        print(f"  TR {name}: {tr_duration*1e3:.2f} ms, TE {plan['echo_times'][name]*1e3:.2f} ms")
+    for warning in plan['warnings']:
+        print(f"Warning: {warning}")
+    print(f"Estimated .seq size: {plan['seq_file_size']/1e6:.1f} MB")
+    print(f"Estimated build memory: {plan['peak_memory']/1e6:.1f} MB")
+    return 0
+
+def cmd_build(args):
+    """Build a protocol and store it in the artifact cache."""
+    entry, _ = get_artifact(make_params(args), make_system(), use_cache=not args.force)
+    if entry is None:
+        return 1
+    duration = entry['meta']['duration']
     print(f"Sequence duration: {duration:.2f} s ({duration/60:.2f} min)")
+    print(f"Cached sequence: {entry['seq']}")
+    return 0
+
+def cmd_export(args):
+    """Export a protocol to a .seq file, building it if not cached."""
+    from controllers.export_controller import export_cached_sequence
     
-    # Plot sequence diagram
-    plot_sequence(seq, 'output/sequence_diagram.png')
+    entry, _ = get_artifact(make_params(args), make_system())
+    if entry is None:
+        return 1
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    export_cached_sequence(entry['seq'], args.output)
+    return 0
+
+def cmd_plot(args):
+    """Plot the sequence diagram and sampling pattern of a protocol."""
+    if not args.show:
+        import matplotlib
+        matplotlib.use('Agg')
+    from views.sequence_plot import plot_sequence
+    from views.k_space_viewer import plot_sampling_pattern
     
-    # Plot sampling pattern
-    from models.compressed_sensing import generate_phyllotaxis_sampling
-    mask = generate_phyllotaxis_sampling(
-        params.matrix_size[1], 
-        params.matrix_size[2], 
-        params.acceleration_factor
-    )
-    plot_sampling_pattern(mask, 'output/sampling_pattern.png')
+    entry, seq = get_artifact(make_params(args), make_system())
+    if entry is None:
+        return 1
+    if seq is None:
+        from pypulseq.Sequence.sequence import Sequence
+        seq = Sequence(make_system())
+        seq.read(entry['seq'])
+    
+    if args.show:
+        plot_sequence(seq, time_range=args.time_range)
+        plot_sampling_pattern(entry['mask'])
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        plot_sequence(seq, os.path.join(args.output_dir, 'sequence_diagram.png'), time_range=args.time_range)
+        plot_sampling_pattern(entry['mask'], os.path.join(args.output_dir, 'sampling_pattern.png'))
+    return 0
+
+def parse_vary(values):
+    """Parse --vary NAME=V1,V2,... options into a parameter grid."""
+    grid = {}
+    for value in values:
+        name, _, options = value.partition('=')
+        if not options:
+            raise ValueError(f"Invalid --vary '{value}', expected NAME=V1,V2,...")
+        grid[name] = [float(option) if '.' in option or 'e' in option else int(option)
+                      for option in options.split(',')]
+    return grid
+
+def cmd_report(args):
+    """Render protocol reports for all combinations of the varied parameters."""
+    from controllers.report_controller import generate_reports
+    from controllers.sweep_controller import expand_grid
+    
+    params = make_params(args)
+    points = expand_grid(parse_vary(args.vary))
+    params_list = [params.replace(**point) for point in points]
+    
+    t_start = time.perf_counter()
+    reports = generate_reports(params_list, make_system(), args.output_dir,
+                               n_workers=args.workers, dpi=args.dpi)
+    print(f"{sum(report is not None for report in reports)} reports in "
+          f"{time.perf_counter() - t_start:.1f} s: {os.path.join(args.output_dir, 'index.html')}")
+    return 0 if all(reports) else 1
+
+def cmd_gating(args):
+    """Compare the scan time of conventional gating and ReCAR on a breathing trace."""
+    from controllers.gating_simulator import STRATEGIES, protocol_timing, simulate_gating
+    from controllers.sequence_builder import SequenceBuilder
+    from models.respiratory import load_respiratory_trace, synthetic_respiratory_trace
+    
+    params = make_params(args)
+    builder = SequenceBuilder(params, make_system())
+    line_duration, nav_duration = protocol_timing(builder)
+    if args.trace:
+        times, positions = load_respiratory_trace(args.trace, time_scale=args.time_scale)
+    else:
+        times, positions = synthetic_respiratory_trace(args.trace_duration, seed=args.seed)
+    
+    windows = {'gating': args.gating_window, 'recar': args.recar_window}
+    print(f"Trace: {times[-1]/60:.1f} min, line: {line_duration*1e3:.2f} ms, "
+          f"{len(builder.recar.get_sampling_order())} lines")
+    for strategy in STRATEGIES:
+        result = simulate_gating(times, positions, builder.recar, line_duration, windows[strategy],
+                                 strategy, args.bins, nav_duration, params.navigator_interval,
+                                 args.learning_time)
+        if not result['complete']:
+            print(f"{strategy}: trace too short, {int((result['line_bins'] >= 0).sum())} lines acquired")
+            continue
+        print(f"{strategy}: {result['scan_time']/60:.2f} min, efficiency {result['efficiency']*100:.1f}%")
+        for b in range(args.bins):
+            low, high = result['bin_edges'][b:b + 2]
+            print(f"  bin {low:.2f}-{high:.2f}: {result['bin_lines'][b]} lines, "
+                  f"coverage {result['bin_coverage'][b]*100:.0f}%, mean radius {result['bin_radius'][b]:.1f}")
+    return 0
+
+def cmd_simulate_scan(args):
+    """Stream a protocol from the scanner emulator into k-space assembly."""
+    import asyncio
+    import tempfile
+    from controllers.kspace_assembler import KSpaceAssembler
+    from controllers.preview import PreviewReconstructor
+    from controllers.scanner_emulator import ScanSource, simulate_scan
+    from controllers.sequence_builder import SequenceBuilder
+    
+    builder = SequenceBuilder(make_params(args), make_system())
+    source = ScanSource(builder, noise=args.noise, seed=args.seed)
+    print(f"Streaming {len(source)} readouts ({source.times[-1]:.1f} s scan) at speed {args.speed:g}")
+    
+    preview = PreviewReconstructor.for_builder(builder, fps=args.preview_fps) if args.preview_fps else None
+    
+    def update_preview(batch):
+        headers = [header for header, _ in batch]
+        preview.add([h['encoding'] for h in headers], [h['kz'] for h in headers],
+                    [h['ky'] for h in headers], [data for _, data in batch])
+        preview.frame()
+    
+    on_batch = update_preview if preview is not None else None
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assembler = KSpaceAssembler.for_builder(args.output or os.path.join(tmp_dir, 'kspace.npy'), builder)
+        stats = asyncio.run(simulate_scan(source, assembler, args.speed, args.socket, args.batch_size, on_batch))
+        assembler.flush()
+    
+    print(f"{stats['n_readouts']} readouts ({stats['n_navigators']} navigators) in {stats['elapsed']:.2f} s: "
+          f"{stats['readouts_per_s']:.0f} readouts/s, {stats['mb_per_s']:.1f} MB/s")
+    print(f"Latency: mean {stats['latency_mean']*1e3:.1f} ms, p95 {stats['latency_p95']*1e3:.1f} ms, "
+          f"max {stats['latency_max']*1e3:.1f} ms; emulator lag {stats['max_lag']*1e3:.1f} ms")
+    if preview is not None:
+        preview.frame(force=True)
+        coverage = ', '.join(f"{c*100:.0f}%" for c in preview.coverage)
+        print(f"Preview: {preview.n_frames} frames, line coverage per encoding {coverage}")
+    return 0 if assembler.complete else 1
+
+def _time_command(command, repeats):
+    """Run a command in fresh interpreters and return the best wall time."""
+    times = []
+    for _ in range(repeats):
+        t_start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t_start)
+    return min(times)
+
+def cmd_bench(args):
+    """Measure CLI cold start, planning and build times."""
+    script = os.path.abspath(__file__)
+    
+    cold_start = _time_command([sys.executable, script, '--help'], args.repeats)
+    status = 'OK' if cold_start <= COLD_START_TARGET else 'SLOW'
+    print(f"CLI cold start: {cold_start*1e3:.0f} ms (target {COLD_START_TARGET*1e3:.0f} ms) {status}")
+    
+    plan_cold = _time_command([sys.executable, script, 'plan'] + protocol_argv(args), args.repeats)
+    print(f"Cold 'plan': {plan_cold*1e3:.0f} ms")
+    
+    from controllers.sequence_builder import SequenceBuilder
+    params = make_params(args)
+    system = make_system()
+    
+    t_start = time.perf_counter()
+    builder = SequenceBuilder(params, system)
+    builder.plan()
+    print(f"Warm plan: {(time.perf_counter() - t_start)*1e3:.1f} ms")
+    
+    if args.build:
+        t_start = time.perf_counter()
+        builder.build_sequence()
+        print(f"Build: {time.perf_counter() - t_start:.2f} s")
+    
+    if args.wavelets:
+        from models.wavelets import WAVELETS, benchmark
+        n_kx, n_ky, n_kz = params.matrix_size
+        shape = (n_kz, n_ky, n_kx, params.n_cardiac_phases)
+        for name in WAVELETS:
+            result = benchmark(shape, name, repeats=args.repeats)
+            print(f"Wavelet {name} {shape}: lifting {result['lifting']*1e3:.0f} ms, "
+                  f"convolution {result['convolution']*1e3:.0f} ms ({result['speedup']:.1f}x), "
+                  f"max difference {result['max_error']:.1e}")
+    
+    return 0 if status == 'OK' else 1
+
+def make_parser():
+    """Create the command line parser."""
+    protocol = argparse.ArgumentParser(add_help=False)
+    group = protocol.add_argument_group('protocol')
+    group.add_argument('--fov', type=float, nargs=3, default=DefaultConfig.FOV,
+                       help='Field of view [x y z] in meters')
+    group.add_argument('--matrix-size', type=int, nargs=3, default=DefaultConfig.MATRIX_SIZE,
+                       help='Matrix size [x y z]')
+    group.add_argument('--tr', type=float, default=DefaultConfig.TR, help='Repetition time [s]')
+    group.add_argument('--te', type=float, default=DefaultConfig.TE, help='Echo time [s]')
+    group.add_argument('--venc', type=float, default=DefaultConfig.VENC,
+                       help='Velocity encoding value [m/s]')
+    group.add_argument('--vencs', type=float, nargs='*', default=[],
+                       help='Additional VENCs for multi-VENC encoding [m/s]')
+    group.add_argument('--encoding-scheme', choices=('simple', 'hadamard'), default=DefaultConfig.ENCODING_SCHEME,
+                       help='Flow encoding scheme')
+    group.add_argument('--flip-angle', type=float, default=DefaultConfig.FLIP_ANGLE,
+                       help='Flip angle [degrees]')
+    group.add_argument('--acceleration-factor', type=float, default=DefaultConfig.ACCELERATION_FACTOR,
+                       help='Compressed sensing acceleration factor')
+    group.add_argument('--n-cardiac-phases', type=int, default=DefaultConfig.N_CARDIAC_PHASES,
+                       help='Number of cardiac phases')
+    group.add_argument('--no-navigator', action='store_true', help='Disable the navigator echo')
+    group.add_argument('--navigator-interval', type=int, default=DefaultConfig.NAVIGATOR_INTERVAL,
+                       help='k-space lines between navigator echoes (0: one at the start)')
+    group.add_argument('--no-adc-labels', action='store_true', default=not DefaultConfig.ADC_LABELS,
+                       help='Do not label the ADC events with their k-space position')
+    group.add_argument('--block-fusion', action='store_true', default=DefaultConfig.BLOCK_FUSION,
+                       help='Overlap the events of a TR in as few blocks as possible')
+    
+    parser = argparse.ArgumentParser(description='4D flow MRI sequence tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    sub = subparsers.add_parser('plan', parents=[protocol], help='Print scan time and size without building')
+    sub.set_defaults(func=cmd_plan)
+    
+    sub = subparsers.add_parser('build', parents=[protocol], help='Build and cache a sequence')
+    sub.add_argument('--force', action='store_true', help='Rebuild even if cached')
+    sub.set_defaults(func=cmd_build)
+    
+    sub = subparsers.add_parser('export', parents=[protocol], help='Export a sequence to a .seq file')
+    sub.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='Output .seq filename')
+    sub.set_defaults(func=cmd_export)
+    
+    sub = subparsers.add_parser('plot', parents=[protocol], help='Plot sequence diagram and sampling pattern')
+    sub.add_argument('--output-dir', default='output', help='Directory for the figures')
+    sub.add_argument('--time-range', type=float, nargs=2, default=None, help='Time range to plot [s]')
+    sub.add_argument('--show', action='store_true', help='Show figures instead of saving them')
+    sub.set_defaults(func=cmd_plot)
+    
+    sub = subparsers.add_parser('report', parents=[protocol], help='Render HTML/PNG protocol reports')
+    sub.add_argument('--vary', action='append', default=[], metavar='NAME=V1,V2',
+                     help='Parameter values to combine, may be repeated')
+    sub.add_argument('--output-dir', default='output/reports', help='Directory for the reports')
+    sub.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    sub.add_argument('--dpi', type=int, default=150, help='Figure resolution')
+    sub.set_defaults(func=cmd_report)
+    
+    sub = subparsers.add_parser('gating', parents=[protocol], help='Simulate respiratory gating efficiency')
+    sub.add_argument('--trace', default=None, help='CSV respiratory trace (time, position); synthetic if omitted')
+    sub.add_argument('--time-scale', type=float, default=1.0, help='Factor converting trace times to seconds')
+    sub.add_argument('--trace-duration', type=float, default=3600, help='Synthetic trace duration [s]')
+    sub.add_argument('--seed', type=int, default=None, help='Seed of the synthetic trace')
+    sub.add_argument('--gating-window', type=float, nargs=2, default=DefaultConfig.GATING_WINDOW,
+                     help='Accepted respiratory positions for gating')
+    sub.add_argument('--recar-window', type=float, nargs=2, default=DefaultConfig.RECAR_WINDOW,
+                     help='Accepted respiratory positions for ReCAR')
+    sub.add_argument('--bins', type=int, default=4, help='Respiratory bins in the acceptance window')
+    sub.add_argument('--learning-time', type=float, default=30.0, help='ReCAR learning phase [s]')
+    sub.set_defaults(func=cmd_gating)
+    
+    sub = subparsers.add_parser('simulate-scan', parents=[protocol],
+                                help='Stream emulated scanner readouts into k-space assembly')
+    sub.add_argument('--speed', type=float, default=1.0, help='Time acceleration (inf: as fast as possible)')
+    sub.add_argument('--socket', default=None, help='Unix socket path (default: local TCP)')
+    sub.add_argument('--batch-size', type=int, default=64, help='Image readouts per assembly batch')
+    sub.add_argument('--noise', type=float, default=0.0, help='Noise standard deviation per sample')
+    sub.add_argument('--seed', type=int, default=None, help='Seed of the noise and breathing trace')
+    sub.add_argument('-o', '--output', default=None, help='Keep the assembled k-space in this .npy file')
+    sub.add_argument('--preview-fps', type=float, default=0, help='Live zero-filled preview frame rate (0: off)')
+    sub.set_defaults(func=cmd_simulate_scan)
+    
+    sub = subparsers.add_parser('bench', parents=[protocol], help='Measure cold start and build times')
+    sub.add_argument('--repeats', type=int, default=3, help='Runs per cold start measurement')
+    sub.add_argument('--build', action='store_true', help='Also time a full build')
+    sub.add_argument('--wavelets', action='store_true',
+                     help='Also time lifting against convolution wavelets on a (kz, ky, kx, t) volume')
+    sub.set_defaults(func=cmd_bench)
+    
+    return parser
+
+def main(argv=None):
+    """Main function to build, plan and export the 4D flow sequence."""
+    args = make_parser().parse_args(argv)
+    return args.func(args)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import numpy as np
+
+def synthetic_r_peaks(duration, rr=1.0, rr_jitter=0.05, ectopic_rate=0.0, seed=None):
+    """
+    Generate ECG R-peak times with heart rate variability and ectopic beats
+    
+    Parameters:
+    -----------
+    duration : float
+        Duration in seconds
+    rr : float
+        Mean RR interval in seconds
+    rr_jitter : float
+        Relative standard deviation of the RR interval
+    ectopic_rate : float
+        Fraction of premature beats; each one arrives after 60% of the RR
+        interval and is followed by a compensatory pause
+    seed : int, optional
+        Random seed
+    
+    Returns:
+    --------
+    r_peaks : ndarray
+        R-peak times in seconds
+    """
+    rng = np.random.default_rng(seed)
+    n_beats = int(np.ceil(duration / (0.5 * rr))) + 2
+    intervals = rr * np.clip(1 + rr_jitter * rng.standard_normal(n_beats), 0.5, None)
+    
+    # Premature beat and compensatory pause keep the total cycle length
+    ectopic = np.nonzero(rng.random(n_beats - 1) < ectopic_rate)[0]
+    shortening = 0.4 * intervals[ectopic]
+    intervals[ectopic] -= shortening
+    intervals[ectopic + 1] += shortening
+    
+    r_peaks = np.cumsum(intervals)
+    return r_peaks[r_peaks < duration]
+
+def accepted_beats(r_peaks, tolerance=0.2, window=9):
+    """
+    Reject arrhythmic heart beats by their RR interval
+    
+    A beat is accepted when its RR interval differs from the median of the
+    surrounding window RR intervals by at most tolerance, which follows
+    slow heart rate changes but rejects premature beats and compensatory
+    pauses.
+    
+    Parameters:
+    -----------
+    r_peaks : ndarray
+        R-peak times in seconds
+    tolerance : float
+        Largest relative deviation from the local median RR interval
+    window : int
+        Number of RR intervals of the running median (odd)
+    
+    Returns:
+    --------
+    rr : ndarray
+        RR interval of every beat (len(r_peaks) - 1)
+    accepted : ndarray
+        True for beats within the tolerance
+    """
+    rr = np.diff(np.asarray(r_peaks, dtype=float))
+    if len(rr) == 0:
+        return rr, np.zeros(0, dtype=bool)
+    
+    half = min(window, len(rr)) // 2
+    padded = np.pad(rr, half, mode='reflect') if half else rr
+    local = np.median(np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1), axis=-1)
+    return rr, np.abs(rr - local) <= tolerance * local
+
+def bin_readouts(times, r_peaks, n_phases, tolerance=0.2, window=9):
+    """
+    Assign readouts to cardiac phases retrospectively
+    
+    Every readout is located in its heart beat with one searchsorted and
+    assigned to a phase by its time since the R-peak relative to the RR
+    interval of that beat, so beats of different length are stretched to
+    the same cardiac cycle. Readouts before the first or after the last
+    R-peak and readouts in rejected beats get phase -1.
+    
+    Parameters:
+    -----------
+    times : ndarray
+        Readout times in seconds, e.g. from utils.pulseq_utils.adc_times
+    r_peaks : ndarray
+        R-peak times in seconds, on the same clock as times
+    n_phases : int
+        Number of cardiac phases
+    tolerance : float
+        Arrhythmia rejection tolerance, see accepted_beats
+    window : int
+        Running median window of the arrhythmia rejection
+    
+    Returns:
+    --------
+    binning : dict
+        'phase' : cardiac phase of every readout, -1 if rejected
+        'beat' : heart beat of every readout, -1 outside the ECG record
+        'rr' : RR interval of every beat
+        'accepted_beats' : True for beats kept by the arrhythmia rejection
+    """
+    times = np.asarray(times, dtype=float)
+    r_peaks = np.asarray(r_peaks, dtype=float)
+    rr, accepted = accepted_beats(r_peaks, tolerance, window)
+    
+    beat = np.searchsorted(r_peaks, times, side='right') - 1
+    inside = (beat >= 0) & (beat < len(rr))
+    beat[~inside] = -1
+    
+    phase = np.full(len(times), -1)
+    valid = inside.copy()
+    valid[inside] = accepted[beat[inside]]
+    fraction = (times[valid] - r_peaks[beat[valid]]) / rr[beat[valid]]
+    phase[valid] = np.minimum((fraction * n_phases).astype(int), n_phases - 1)
+    
+    return {
+        'phase': phase,
+        'beat': beat,
+        'rr': rr,
+        'accepted_beats': accepted,
+    }
+
+def assembly_indices(binning, readouts):
+    """
+    Build the k-space assembly indices of the binned image readouts
+    
+    Parameters:
+    -----------
+    binning : dict
+        Result of bin_readouts for every ADC of the sequence
+    readouts : dict
+        Result of SequenceBuilder.readout_order
+    
+    Returns:
+    --------
+    indices : dict
+        Arrays with one entry per accepted image readout:
+        'readout' : index of the ADC in acquisition order
+        'encoding', 'phase', 'kz', 'ky' : position in a k-space array of
+        shape (n_encodings, n_phases, n_kz, n_ky, n_kx)
+    """
+    keep = np.nonzero(~readouts['navigator'] & (binning['phase'] >= 0))[0]
+    return {
+        'readout': keep,
+        'encoding': readouts['encoding'][keep],
+        'phase': binning['phase'][keep],
+        'kz': readouts['kz'][keep],
+        'ky': readouts['ky'][keep],
+    }
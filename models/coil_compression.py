@@ -0,0 +1,174 @@
+import numpy as np
+
+from utils.math_utils import randomized_svd
+
+MODES = ('global', 'geometric')
+
+def _hybrid(kspace):
+    """Centred inverse FFT along kx"""
+    return np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(kspace, axes=-1), axis=-1, norm='ortho'), axes=-1)
+
+def _kspace(hybrid):
+    """Centred FFT along x"""
+    return np.fft.fftshift(np.fft.fft(np.fft.ifftshift(hybrid, axes=-1), axis=-1, norm='ortho'), axes=-1)
+
+def align_compression(matrices):
+    """
+    Align geometric compression matrices along x
+    
+    The virtual coils of neighbouring x positions are only defined up to
+    a unitary rotation. Every matrix is rotated to best match its
+    predecessor (orthogonal Procrustes), so the virtual coil
+    sensitivities vary smoothly along x.
+    
+    Parameters:
+    -----------
+    matrices : ndarray
+        Compression matrices (n_x, n_virtual, n_coils)
+    
+    Returns:
+    --------
+    aligned : ndarray
+        Aligned compression matrices
+    """
+    aligned = matrices.copy()
+    for x in range(1, len(aligned)):
+        u, _, vh = np.linalg.svd(aligned[x - 1] @ aligned[x].conj().T)
+        aligned[x] = (u @ vh) @ aligned[x]
+    return aligned
+
+class CoilCompressor:
+    """
+    Compress physical receive channels into fewer virtual coils
+    
+    'global' compression applies one n_virtual x n_coils matrix: the
+    dominant left singular vectors of the calibration data. 'geometric'
+    compression (GCC) inverse transforms the calibration data along the
+    fully sampled readout and computes one matrix per x position, aligned
+    along x, which keeps more signal for the same number of virtual coils
+    when the coil geometry changes along the readout.
+    
+    The matrices are computed with a randomized SVD, and readouts are
+    compressed one batch at a time as they arrive, so the full multi-coil
+    k-space is never held in memory.
+    
+    Example:
+    --------
+    compressor = CoilCompressor.from_calibration(calib, n_virtual=8)
+    assembler.consume(compressor.stream(readout_batches))
+    """
+    def __init__(self, matrices, mode='global'):
+        """
+        Initialize a compressor
+        
+        Parameters:
+        -----------
+        matrices : ndarray
+            Compression matrix (n_virtual, n_coils) for 'global' or
+            matrices (n_x, n_virtual, n_coils) for 'geometric'
+        mode : str
+            'global' or 'geometric'
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown coil compression mode '{mode}', expected one of {MODES}")
+        self.matrices = np.asarray(matrices, dtype=np.complex64)
+        self.mode = mode
+    
+    @classmethod
+    def from_calibration(cls, calib, n_virtual, mode='geometric', seed=None):
+        """
+        Compute the compression from calibration data
+        
+        Parameters:
+        -----------
+        calib : ndarray
+            Calibration k-space (n_coils, ..., n_kx) with the whole readout,
+            e.g. models.parallel_imaging.calibration_data(kspace,
+            calib_size, calib_width=n_kx)
+        n_virtual : int
+            Number of virtual coils
+        mode : str
+            'global' or 'geometric'
+        seed : int, optional
+            Seed of the randomized SVD
+        
+        Returns:
+        --------
+        compressor : CoilCompressor
+            Compressor for readouts of the same coils and readout length
+        """
+        n_coils, n_kx = calib.shape[0], calib.shape[-1]
+        if not 0 < n_virtual <= n_coils:
+            raise ValueError(f"Cannot compress {n_coils} coils into {n_virtual} virtual coils")
+        
+        if mode == 'global':
+            u, _, _ = randomized_svd(calib.reshape(n_coils, -1), n_virtual, seed=seed)
+            return cls(u.conj().T, mode)
+        
+        # One matrix per x position of the hybrid (x, ky, kz) calibration data
+        hybrid = _hybrid(calib).reshape(n_coils, -1, n_kx).transpose(2, 0, 1)
+        u, _, _ = randomized_svd(hybrid, n_virtual, seed=seed)
+        return cls(align_compression(u.conj().swapaxes(-1, -2)), mode)
+    
+    @property
+    def n_virtual(self):
+        """Number of virtual coils"""
+        return self.matrices.shape[-2]
+    
+    def apply(self, readouts):
+        """
+        Compress readouts
+        
+        Parameters:
+        -----------
+        readouts : ndarray
+            Readouts (..., n_coils, n_kx), e.g. one readout or a batch in
+            acquisition order
+        
+        Returns:
+        --------
+        compressed : ndarray
+            complex64 readouts (..., n_virtual, n_kx)
+        """
+        readouts = np.asarray(readouts, dtype=np.complex64)
+        if self.mode == 'global':
+            return self.matrices @ readouts
+        
+        hybrid = _hybrid(readouts)
+        compressed = np.einsum('xvc,...cx->...vx', self.matrices, hybrid)
+        return _kspace(compressed).astype(np.complex64)
+    
+    def stream(self, batches):
+        """
+        Compress a stream of readout batches
+        
+        Parameters:
+        -----------
+        batches : iterable of ndarray
+            Readout batches (n_readouts, n_coils, n_kx)
+        
+        Yields:
+        -------
+        compressed : ndarray
+            Readout batches (n_readouts, n_virtual, n_kx)
+        """
+        for readouts in batches:
+            yield self.apply(readouts)
+    
+    def retained_energy(self, calib):
+        """
+        Fraction of the calibration signal energy kept by the compression
+        
+        Parameters:
+        -----------
+        calib : ndarray
+            Calibration k-space (n_coils, ..., n_kx)
+        
+        Returns:
+        --------
+        fraction : float
+            Energy of the compressed over the uncompressed data
+        """
+        n_coils, n_kx = calib.shape[0], calib.shape[-1]
+        readouts = np.moveaxis(calib.reshape(n_coils, -1, n_kx), 0, 1)
+        return float(np.sum(np.abs(self.apply(readouts))**2) / np.sum(np.abs(calib)**2))
@@ -1,6 +1,54 @@
 import numpy as np
 
-def generate_variable_density_mask(n_phase, n_slice, acceleration_factor, center_fraction=0.04):
+def center_region(n_phase, n_slice, center_fraction=0.04):
+    """
+    Locate the fully sampled center of a sampling mask
+    
+    Parameters:
+    -----------
+    n_phase : int
+        Number of phase encoding steps
+    n_slice : int
+        Number of slice encoding steps
+    center_fraction : float
+        Fraction of k-space center to fully sample
+    
+    Returns:
+    --------
+    region : tuple of slice
+        (phase, slice) index ranges of the center
+    """
+    center_p = int(n_phase * center_fraction)
+    center_s = int(n_slice * center_fraction)
+    p_start = n_phase//2 - center_p//2
+    s_start = n_slice//2 - center_s//2
+    return slice(p_start, p_start + center_p), slice(s_start, s_start + center_s)
+
+def calibration_region(n_phase, n_slice, calib_size=12):
+    """
+    Locate the fully sampled coil calibration region of a sampling mask
+    
+    Parameters:
+    -----------
+    n_phase : int
+        Number of phase encoding steps
+    n_slice : int
+        Number of slice encoding steps
+    calib_size : int
+        Calibration lines along each axis, clipped to the mask size
+    
+    Returns:
+    --------
+    region : tuple of slice
+        (phase, slice) index ranges of the calibration region
+    """
+    size_p = min(calib_size, n_phase)
+    size_s = min(calib_size, n_slice)
+    p_start = n_phase//2 - size_p//2
+    s_start = n_slice//2 - size_s//2
+    return slice(p_start, p_start + size_p), slice(s_start, s_start + size_s)
+
+def generate_variable_density_mask(n_phase, n_slice, acceleration_factor, center_fraction=0.04, calib_size=0):
     """
     Generate a variable-density sampling mask for compressed sensing
     
@@ -14,6 +62,9 @@ def generate_variable_density_mask(n_phase, n_slice, acceleration_factor, center
         Acceleration factor (e.g., 4 for 4x acceleration)
     center_fraction : float
         Fraction of k-space center to fully sample
+    calib_size : int
+        Lines along each axis of a square center region fully sampled for
+        coil calibration, independent of center_fraction; 0 for none
         
     Returns:
     --------
@@ -24,13 +75,9 @@ def generate_variable_density_mask(n_phase, n_slice, acceleration_factor, center
     mask = np.zeros((n_phase, n_slice))
     
     # Fully sample the center of k-space
-    center_p = int(n_phase * center_fraction)
-    center_s = int(n_slice * center_fraction)
-    p_start = n_phase//2 - center_p//2
-    p_end = p_start + center_p
-    s_start = n_slice//2 - center_s//2
-    s_end = s_start + center_s
-    mask[p_start:p_end, s_start:s_end] = 1
+    mask[center_region(n_phase, n_slice, center_fraction)] = 1
+    if calib_size:
+        mask[calibration_region(n_phase, n_slice, calib_size)] = 1
     
     # Calculate number of samples to acquire
     n_center = np.sum(mask)
@@ -56,7 +103,7 @@ def generate_variable_density_mask(n_phase, n_slice, acceleration_factor, center
     
     return mask
 
-def generate_phyllotaxis_sampling(n_phase, n_slice, acceleration_factor, center_fraction=0.04):
+def generate_phyllotaxis_sampling(n_phase, n_slice, acceleration_factor, center_fraction=0.04, calib_size=0):
     """
     Generate a variable-density phyllotaxis sampling pattern for improved CS performance
     
@@ -70,6 +117,9 @@ def generate_phyllotaxis_sampling(n_phase, n_slice, acceleration_factor, center_
         Acceleration factor (e.g., 4 for 4x acceleration)
     center_fraction : float
         Fraction of k-space center to fully sample
+    calib_size : int
+        Lines along each axis of a square center region fully sampled for
+        coil calibration, independent of center_fraction; 0 for none
         
     Returns:
     --------
@@ -110,12 +160,8 @@ def generate_phyllotaxis_sampling(n_phase, n_slice, acceleration_factor, center_
         mask[ky, kx] = 1
     
     # Ensure center of k-space is fully sampled
-    center_p = int(n_phase * center_fraction)
-    center_s = int(n_slice * center_fraction)
-    p_start = n_phase//2 - center_p//2
-    p_end = p_start + center_p
-    s_start = n_slice//2 - center_s//2
-    s_end = s_start + center_s
-    mask[p_start:p_end, s_start:s_end] = 1
+    mask[center_region(n_phase, n_slice, center_fraction)] = 1
+    if calib_size:
+        mask[calibration_region(n_phase, n_slice, calib_size)] = 1
     
     return mask
\ No newline at end of file
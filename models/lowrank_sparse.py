@@ -0,0 +1,140 @@
+import numpy as np
+import scipy.fft
+
+from models.parallel_imaging import SenseOperator, soft_threshold
+from utils.math_utils import randomized_svd
+
+def casorati(images):
+    """
+    View cine images as Casorati matrices
+
+    Parameters:
+    -----------
+    images : ndarray
+        Images (..., n_phases, n_z, n_y, n_x)
+
+    Returns:
+    --------
+    matrix : ndarray
+        (..., n_voxels, n_phases) matrices, one column per cardiac phase
+    """
+    return images.reshape(images.shape[:-4] + (images.shape[-4], -1)).swapaxes(-1, -2)
+
+def singular_value_threshold(matrix, threshold, rank, start=None, n_iter=2, seed=None):
+    """
+    Soft-threshold the singular values of a matrix, truncated to a rank
+
+    The decomposition is a randomized truncated SVD; singular values
+    beyond rank are treated as below the threshold.
+
+    Parameters:
+    -----------
+    matrix : ndarray
+        Matrix or stack of matrices (..., m, n)
+    threshold : float
+        Subtracted from every singular value
+    rank : int
+        Largest rank kept
+    start : ndarray, optional
+        Initial subspace (..., n, p) of the randomized SVD
+    n_iter : int
+        Power iterations of the randomized SVD
+    seed : int, optional
+        Random seed
+
+    Returns:
+    --------
+    low_rank : ndarray
+        Thresholded matrix
+    subspace : ndarray
+        Right singular vectors (..., n, rank), to warm start the next call
+    """
+    u, s, vh = randomized_svd(matrix, rank, n_iter=n_iter, seed=seed, start=start)
+    s = np.maximum(s - threshold, 0)
+    return (u * s[..., None, :].astype(u.dtype)) @ vh, vh.conj().swapaxes(-1, -2)
+
+def lowrank_sparse_recon(kspace, maps, mask, lam_lowrank=0.1, lam_sparse=0.01, rank=8, n_iter=30,
+                         warm_start=True, workers=-1, seed=0):
+    """
+    Reconstruct undersampled cine k-space as low-rank plus sparse (L+S)
+
+    The cine series X = L + S is split into a low-rank part L, the
+    background shared by all cardiac phases, and a part S that is sparse
+    in the temporal Fourier domain, the pulsatile changes. Every
+    iteration (Otazo et al. 2015) thresholds the singular values of the
+    Casorati matrix (voxels x phases) of L, soft-thresholds the temporal
+    spectrum of S and takes a gradient step on the multi-coil data term.
+
+    The singular values come from a randomized truncated SVD instead of a
+    full SVD. As L changes little between iterations, the right singular
+    vectors of the previous iteration warm start the next one, which then
+    needs no power iterations.
+
+    Parameters:
+    -----------
+    kspace : ndarray
+        Zero-filled k-space (..., n_phases, n_coils, n_kz, n_ky, n_kx),
+        e.g. one flow encoding of KSpaceAssembler data moved with
+        np.moveaxis(kspace, -2, -4)
+    maps : ndarray
+        Coil sensitivities (n_coils, n_z, n_y, n_x); np.ones((1, n_z,
+        n_y, n_x)) for single-channel data
+    mask : ndarray
+        Sampling mask per cardiac phase (n_phases, n_kz, n_ky), or one
+        mask (n_kz, n_ky) for all phases
+    lam_lowrank : float
+        Singular value threshold relative to the largest singular value of
+        the zero-filled Casorati matrix
+    lam_sparse : float
+        Temporal Fourier threshold relative to the largest zero-filled
+        coefficient
+    rank : int
+        Largest rank of L
+    n_iter : int
+        Iterations
+    warm_start : bool
+        Start each randomized SVD from the previous singular vectors
+    workers : int
+        FFT worker threads, -1 for all CPUs
+    seed : int, optional
+        Seed of the randomized SVD
+
+    Returns:
+    --------
+    low_rank : ndarray
+        complex64 low-rank part (..., n_phases, n_z, n_y, n_x)
+    sparse : ndarray
+        complex64 sparse part (..., n_phases, n_z, n_y, n_x)
+    """
+    operator = SenseOperator(maps, mask, workers)
+    data = operator.shift(np.asarray(kspace, dtype=np.complex64)) * operator.mask
+    step = 1 / operator.lipschitz
+
+    def temporal(x):
+        return scipy.fft.fft(x, axis=-4, norm='ortho', workers=workers)
+
+    def temporal_inverse(x):
+        return scipy.fft.ifft(x, axis=-4, norm='ortho', workers=workers)
+
+    # Thresholds relative to the zero-filled images, per leading index
+    images = operator.adjoint(data)
+    _, s_max, _ = randomized_svd(casorati(images), 1, seed=seed)
+    threshold_lowrank = lam_lowrank * s_max[..., :1]
+    threshold_sparse = lam_sparse * np.abs(temporal(images)).max(axis=(-4, -3, -2, -1), keepdims=True)
+
+    shape = images.shape
+    low_rank_previous = images
+    sparse = np.zeros_like(images)
+    subspace = None
+    for _ in range(n_iter):
+        start = subspace if warm_start else None
+        matrix, subspace = singular_value_threshold(casorati(images - sparse), threshold_lowrank, rank, start,
+                                                    n_iter=0 if start is not None else 2, seed=seed)
+        low_rank = matrix.swapaxes(-1, -2).reshape(shape)
+        sparse = temporal_inverse(soft_threshold(temporal(images - low_rank_previous), threshold_sparse))
+
+        estimate = low_rank + sparse
+        images = (estimate - step * operator.gradient(estimate, data)).astype(np.complex64)
+        low_rank_previous = low_rank
+    return (operator.unshift(low_rank).astype(np.complex64),
+            operator.unshift(sparse).astype(np.complex64))
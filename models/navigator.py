@@ -0,0 +1,85 @@
+import numpy as np
+
+def navigator_profiles(kspace):
+    """
+    Reconstruct 1D navigator profiles from navigator k-space samples
+    
+    Parameters:
+    -----------
+    kspace : ndarray
+        Navigator samples (..., n_samples), k-space centre at n_samples // 2
+    
+    Returns:
+    --------
+    profiles : ndarray
+        Magnitude profiles (..., n_samples)
+    """
+    kspace = np.asarray(kspace)
+    return np.abs(np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(kspace, axes=-1), axis=-1), axes=-1))
+
+def estimate_displacement(profiles, reference=None, pixel_size=1.0, max_shift=None, window=None):
+    """
+    Estimate the displacement of navigator profiles by FFT cross-correlation
+    
+    The gradient of every profile is cross-correlated with the gradient of
+    the reference in one batched FFT. The profiles are zero-padded to twice their length so the correlation
+    is linear rather than circular, and the correlation peak is refined to
+    sub-pixel precision with a parabola through its neighbours.
+    
+    Parameters:
+    -----------
+    profiles : ndarray
+        Navigator profiles (n_navigators, n_samples)
+    reference : ndarray, optional
+        Reference profile (n_samples); defaults to the first profile
+    pixel_size : float
+        Size of a profile sample, e.g. in meters
+    max_shift : float, optional
+        Largest displacement searched for, in samples
+    window : tuple, optional
+        (start, stop) sample range around the diaphragm; static tissue
+        outside it would bias the estimate towards zero
+    
+    Returns:
+    --------
+    displacement : ndarray
+        Displacement of every profile relative to the reference, in units of
+        pixel_size. Positive values move the profile towards higher sample
+        indices.
+    """
+    profiles = np.atleast_2d(np.asarray(profiles, dtype=float))
+    n_samples = profiles.shape[-1]
+    if reference is None:
+        reference = profiles[0]
+    reference = np.asarray(reference, dtype=float)
+    if window is not None:
+        profiles = profiles[:, window[0]:window[1]]
+        reference = reference[window[0]:window[1]]
+        n_samples = profiles.shape[-1]
+    
+    # Correlate the profile gradients: the diaphragm edge becomes a peak, so
+    # the zero padding does not bias the correlation towards small lags
+    profiles = np.gradient(profiles, axis=-1)
+    reference = np.gradient(reference)
+    
+    n_fft = 2 * n_samples
+    correlation = np.fft.irfft(np.fft.rfft(profiles, n_fft, axis=-1) *
+                               np.conj(np.fft.rfft(reference, n_fft)), n_fft, axis=-1)
+    
+    # Lags in FFT order: 0, 1, ..., n_samples - 1, -n_samples, ..., -1
+    lags = np.fft.fftfreq(n_fft, 1 / n_fft)
+    if max_shift is not None:
+        correlation[:, np.abs(lags) > max_shift] = -np.inf
+    peak = np.argmax(correlation, axis=-1)
+    
+    # Parabolic sub-pixel refinement
+    rows = np.arange(len(peak))
+    left = correlation[rows, (peak - 1) % n_fft]
+    centre = correlation[rows, peak]
+    right = correlation[rows, (peak + 1) % n_fft]
+    curvature = left - 2 * centre + right
+    valid = np.isfinite(curvature) & (curvature < 0)
+    offset = np.zeros(len(peak))
+    offset[valid] = 0.5 * (left[valid] - right[valid]) / curvature[valid]
+    
+    return (lags[peak] + offset) * pixel_size
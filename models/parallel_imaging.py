@@ -0,0 +1,372 @@
+import numpy as np
+import scipy.fft
+
+from models.compressed_sensing import calibration_region
+
+# Working memory of one ESPIRiT chunk in bytes
+CHUNK_BYTES = 64 * 1024**2
+
+def calibration_data(kspace, calib_size=12, calib_width=24, min_size=1):
+    """
+    Extract the fully sampled calibration region of multi-coil data
+
+    Parameters:
+    -----------
+    kspace : ndarray
+        Multi-coil k-space (n_coils, n_kz, n_ky, n_kx)
+    calib_size : int
+        Calibration lines along ky and kz, as passed to the mask generator
+        (SequenceParams.calib_size)
+    calib_width : int
+        Calibration samples kept along the fully sampled kx axis
+    min_size : int
+        Smallest calibration extent along ky and kz
+
+    Returns:
+    --------
+    calib : ndarray
+        Calibration k-space (n_coils, c_z, c_y, c_x)
+
+    Raises:
+    -------
+    ValueError
+        If the calibration region is smaller than min_size along ky or kz,
+        or contains k-space lines that were not sampled
+    """
+    n_kz, n_ky, n_kx = kspace.shape[-3:]
+    phase, partition = calibration_region(n_ky, n_kz, calib_size)
+    size = (phase.stop - phase.start, partition.stop - partition.start)
+    if min(size) < max(min_size, 1):
+        raise ValueError(f"calib_size {calib_size} gives a {size[0]} x {size[1]} calibration region "
+                         f"in a {n_ky} x {n_kz} mask, at least {min_size} x {min_size} is needed")
+    width = min(calib_width, n_kx)
+    start = n_kx // 2 - width // 2
+    calib = kspace[:, partition, phase, start:start + width]
+
+    # A line without signal in every coil was not acquired
+    missing = ~np.any(calib != 0, axis=(0, 3))
+    if np.any(missing):
+        raise ValueError(f"{int(missing.sum())} of the {size[0]} x {size[1]} calibration lines are not "
+                         f"sampled; generate the mask with the same calib_size")
+    return calib
+
+def _row_space(matrix, threshold):
+    """
+    Right singular vectors of a matrix above a relative singular value
+
+    The singular vectors come from the eigendecomposition of the smaller
+    of A^H A and A A^H, which takes about half the time of an SVD of a
+    calibration matrix with many more windows than kernel entries.
+
+    Parameters:
+    -----------
+    matrix : ndarray
+        Matrix A (m x n)
+    threshold : float
+        Singular values kept relative to the largest
+
+    Returns:
+    --------
+    vh : ndarray
+        Conjugated right singular vectors as rows (r x n), by decreasing
+        singular value
+    """
+    matrix = matrix.astype(np.complex128)
+    if matrix.shape[0] >= matrix.shape[1]:
+        eigenvalues, vectors = np.linalg.eigh(matrix.conj().T @ matrix)
+        keep = eigenvalues > threshold**2 * eigenvalues[-1]
+        return vectors[:, keep][:, ::-1].conj().T
+
+    eigenvalues, vectors = np.linalg.eigh(matrix @ matrix.conj().T)
+    keep = eigenvalues > threshold**2 * eigenvalues[-1]
+    vh = vectors[:, keep][:, ::-1].conj().T @ matrix
+    return vh / np.sqrt(eigenvalues[keep][::-1])[:, None]
+
+def espirit_maps(kspace, calib_size=12, kernel_size=6, calib_width=24, threshold=0.02,
+                 crop=0.95, n_iter=30, chunk_bytes=CHUNK_BYTES):
+    """
+    Estimate coil sensitivities with ESPIRiT
+
+    The calibration matrix of sliding kernel windows over the fully
+    sampled calibration region is decomposed with an SVD; in every voxel the
+    sensitivities are the eigenvector of eigenvalue 1 of the Gram matrix
+    of the image-space kernels spanning its row space, found by batched
+    power iterations.
+
+    The Gram matrices are not built from the image-space kernels: their
+    entries are Fourier series of the kernel cross-correlations, evaluated
+    with small separable bases. This costs n_coils^2 * (2 * kernel - 1)
+    per voxel instead of n_coils^2 times the number of kernels, and is
+    done one chunk of x positions at a time so memory stays within
+    chunk_bytes whatever the volume size.
+
+    Parameters:
+    -----------
+    kspace : ndarray
+        Multi-coil k-space (n_coils, n_kz, n_ky, n_kx), at least the
+        calibration region sampled
+    calib_size : int
+        Calibration lines along ky and kz, as passed to the mask generator
+        (SequenceParams.calib_size)
+    kernel_size : int
+        Kernel width, limited to half the calibration size along every
+        axis so the calibration matrix has more windows than kernel
+        entries. The calibration region must span at least kernel_size
+        lines along ky and kz; smaller regions leave too few windows to
+        separate the coil subspace and give zero or wrong sensitivities
+        in parts of the object.
+    calib_width : int
+        Calibration samples kept along kx
+    threshold : float
+        Singular values kept relative to the largest
+    crop : float
+        Voxels with an eigenvalue below crop get zero sensitivity
+    n_iter : int
+        Power iterations
+    chunk_bytes : int
+        Working memory per chunk of x positions
+
+    Returns:
+    --------
+    maps : ndarray
+        complex64 sensitivities (n_coils, n_z, n_y, n_x) of unit norm
+        over the coils inside the support, phase relative to coil 0
+
+    Raises:
+    -------
+    ValueError
+        If the calibration region is smaller than kernel_size along ky or
+        kz, or not fully sampled
+    """
+    calib = calibration_data(kspace, calib_size, calib_width, min_size=kernel_size)
+    n_coils = calib.shape[0]
+    shape = kspace.shape[-3:]
+    kernel = tuple(min(kernel_size, (n + 1) // 2) for n in calib.shape[1:])
+
+    # Calibration matrix: one row per kernel window
+    windows = np.lib.stride_tricks.sliding_window_view(calib, kernel, axis=(1, 2, 3))
+    matrix = windows.transpose(1, 2, 3, 0, 4, 5, 6).reshape(-1, n_coils * np.prod(kernel))
+    kernels = _row_space(matrix, threshold).reshape((-1, n_coils) + kernel)
+
+    # The Gram matrix sum_r k_r(x) k_r(x)^H of the image-space kernels is
+    # the Fourier series of the kernel cross-correlations, which have
+    # 2 * kernel - 1 lags per axis
+    lags = tuple(2 * k - 1 for k in kernel)
+    spectra = scipy.fft.fftn(kernels, lags, axes=(2, 3, 4))
+    correlation = scipy.fft.ifftn(np.einsum('rc...,rd...->cd...', spectra, spectra.conj()), axes=(2, 3, 4))
+    correlation = (correlation / np.prod(kernel)).astype(np.complex64)
+
+    # Lag bases exp(2 pi i lag (x - n // 2) / n), one per axis
+    basis_z, basis_y, basis_x = (np.exp(2j * np.pi * np.outer(np.arange(n) - n // 2, np.fft.fftfreq(lag, 1 / lag))
+                                        / n).astype(np.complex64)
+                                 for n, lag in zip(shape, lags))
+
+    # One chunk of x positions at a time
+    n_z, n_y, n_x = shape
+    voxel_bytes = 16 * n_z * n_y * n_coils**2
+    chunk = int(np.clip(chunk_bytes // voxel_bytes, 1, n_x))
+
+    maps = np.empty((n_coils, n_z, n_y, n_x), dtype=np.complex64)
+    for start in range(0, n_x, chunk):
+        stop = min(start + chunk, n_x)
+        gram = np.tensordot(correlation, basis_x[start:stop], axes=([4], [1]))
+        gram = np.tensordot(gram, basis_y, axes=([3], [1]))
+        gram = np.tensordot(gram, basis_z, axes=([2], [1]))
+        gram = gram.transpose(4, 3, 2, 0, 1).reshape(-1, n_coils, n_coils)
+
+        vectors = np.ones((len(gram), n_coils, 1), dtype=np.complex64)
+        for _ in range(n_iter):
+            vectors = gram @ vectors
+            eigenvalue = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(eigenvalue, np.finfo(np.float32).tiny)
+
+        vectors[eigenvalue[:, 0, 0] < crop] = 0
+        vectors *= np.exp(-1j * np.angle(vectors[:, :1]))
+        maps[..., start:stop] = vectors[..., 0].T.reshape(n_coils, n_z, n_y, stop - start)
+    return maps
+
+def soft_threshold(x, threshold):
+    """
+    Complex soft thresholding, the proximal operator of the l1 norm
+
+    Parameters:
+    -----------
+    x : ndarray
+        Complex values
+    threshold : float or ndarray
+        Threshold
+
+    Returns:
+    --------
+    shrunk : ndarray
+        x with every magnitude reduced by threshold, at least to zero
+    """
+    magnitude = np.abs(x)
+    return x * (np.maximum(magnitude - threshold, 0) / np.maximum(magnitude, np.finfo(np.float32).tiny))
+
+class SenseOperator:
+    """
+    Cartesian multi-coil encoding operator E = M F S
+
+    Sensitivities and mask are moved to the unshifted FFT layout once.
+    Images and k-space passed to forward, adjoint and gradient must be in
+    that layout too (see shift and unshift), so no fftshift copies are
+    made per application. All coils and leading axes of an image go
+    through one batched FFT.
+    """
+    def __init__(self, maps, mask, workers=-1):
+        """
+        Initialize the operator
+
+        Parameters:
+        -----------
+        maps : ndarray
+            Coil sensitivities (n_coils, n_z, n_y, n_x)
+        mask : ndarray
+            Sampling mask (..., n_kz, n_ky); leading axes (e.g. a mask per
+            cardiac phase) broadcast against the leading image axes
+        workers : int
+            FFT worker threads, -1 for all CPUs
+        """
+        self.maps = self.shift(np.asarray(maps, dtype=np.complex64))
+        self.maps_conj = self.maps.conj()
+        self.mask = self.shift(np.asarray(mask, dtype=bool)[..., None, :, :, None])
+        self.workers = workers
+
+    @staticmethod
+    def shift(a):
+        """Move the spatial axes to the unshifted FFT layout"""
+        return np.fft.ifftshift(a, axes=(-3, -2, -1))
+
+    @staticmethod
+    def unshift(a):
+        """Move the spatial axes back to the centred layout"""
+        return np.fft.fftshift(a, axes=(-3, -2, -1))
+
+    @property
+    def lipschitz(self):
+        """Bound of ||E^H E||: largest coil sum of |S|^2"""
+        return max(float(np.max(np.sum(np.abs(self.maps)**2, axis=0))), np.finfo(np.float32).tiny)
+
+    def forward(self, x):
+        """Sampled multi-coil k-space (..., n_coils, n_kz, n_ky, n_kx) of images (..., n_z, n_y, n_x)"""
+        kspace = scipy.fft.fftn(self.maps * x[..., None, :, :, :], axes=(-3, -2, -1), norm='ortho',
+                                workers=self.workers)
+        kspace *= self.mask
+        return kspace
+
+    def adjoint(self, kspace):
+        """Coil-combined images of multi-coil k-space"""
+        coil_images = scipy.fft.ifftn(kspace, axes=(-3, -2, -1), norm='ortho', workers=self.workers)
+        return np.einsum('...czyx,czyx->...zyx', coil_images, self.maps_conj)
+
+    def gradient(self, x, data):
+        """Gradient E^H (E x - data) of the data term"""
+        residual = self.forward(x)
+        residual -= data
+        return self.adjoint(residual)
+
+def sense_cs_recon(kspace, maps, mask, lam=0.01, n_iter=30, transform=None, workers=-1, x0=None, tol=0.0,
+                   residual_tol=0.0, callback=None, return_info=False):
+    """
+    Reconstruct undersampled multi-coil k-space with SENSE and compressed sensing
+
+    FISTA minimizes ||M F S x - y||^2 + lam ||T x||_1 for the coil
+    sensitivities S, sampling mask M and an orthonormal sparsifying
+    transform T. All coils (and leading axes, e.g. encodings and cardiac
+    phases) are transformed by one batched FFT per iteration, see
+    SenseOperator.
+
+    Instead of running all n_iter iterations, the iteration stops early
+    once the relative change ||x_k - x_k-1|| / ||x_k|| drops below tol, or
+    once the relative data residual ||E x - y|| / ||y|| drops below
+    residual_tol (e.g. the noise level, the discrepancy principle). A good
+    start x0, such as the image of the neighbouring cardiac phase, reaches
+    either rule in fewer iterations.
+
+    Parameters:
+    -----------
+    kspace : ndarray
+        Zero-filled k-space (..., n_coils, n_kz, n_ky, n_kx); for data
+        stored as (..., n_kz, n_ky, n_coils, n_kx) pass
+        np.moveaxis(kspace, -2, -4)
+    maps : ndarray
+        Coil sensitivities (n_coils, n_z, n_y, n_x), e.g. from espirit_maps
+    mask : ndarray
+        Sampling mask (..., n_kz, n_ky), i.e. SequenceBuilder.sampling_mask.T
+    lam : float
+        Regularization weight relative to the largest zero-filled SENSE
+        image value
+    n_iter : int
+        FISTA iterations
+    transform : tuple of callable, optional
+        (forward, inverse) orthonormal sparsifying transform; sparsity in
+        the image itself if None
+    workers : int
+        FFT worker threads, -1 for all CPUs
+    x0 : ndarray, optional
+        Initial image (..., n_z, n_y, n_x); the zero-filled SENSE image if
+        None
+    tol : float
+        Relative change below which the iteration stops, 0 to disable
+    residual_tol : float
+        Relative data residual below which the iteration stops, 0 to
+        disable
+    callback : callable, optional
+        Called as callback(iteration, image) after every iteration, e.g.
+        to checkpoint the iterate
+    return_info : bool
+        Also return the convergence history
+
+    Returns:
+    --------
+    image : ndarray
+        complex64 image (..., n_z, n_y, n_x)
+    info : dict
+        Only if return_info:
+        'iterations' : iterations run
+        'stopped' : 'tol', 'residual_tol' or 'n_iter'
+        'relative_change' : relative change per iteration
+        'residual' : relative data residual per iteration, at the
+        extrapolated FISTA point
+    """
+    operator = SenseOperator(maps, mask, workers)
+    data = operator.shift(np.asarray(kspace, dtype=np.complex64)) * operator.mask
+    forward, inverse = transform if transform is not None else (None, None)
+
+    def prox(x, threshold):
+        coefficients = forward(x) if forward is not None else x
+        coefficients = soft_threshold(coefficients, threshold)
+        return inverse(coefficients) if inverse is not None else coefficients
+
+    step = 1 / operator.lipschitz
+    x = operator.adjoint(data)
+    threshold = lam * step * float(np.abs(x).max())
+    if x0 is not None:
+        x = np.broadcast_to(operator.shift(np.asarray(x0, dtype=np.complex64)), x.shape).copy()
+    data_norm = max(float(np.linalg.norm(data)), np.finfo(np.float32).tiny)
+
+    info = {'iterations': 0, 'stopped': 'n_iter', 'relative_change': [], 'residual': []}
+    y, t = x, 1.0
+    for iteration in range(n_iter):
+        residual = operator.forward(y)
+        residual -= data
+        info['residual'].append(float(np.linalg.norm(residual)) / data_norm)
+        x_new = prox(y - step * operator.adjoint(residual), threshold).astype(np.complex64)
+        t_new = (1 + np.sqrt(1 + 4 * t**2)) / 2
+        y = x_new + ((t - 1) / t_new) * (x_new - x)
+        change = float(np.linalg.norm(x_new - x)) / max(float(np.linalg.norm(x_new)), np.finfo(np.float32).tiny)
+        info['relative_change'].append(change)
+        x, t = x_new, t_new
+        info['iterations'] = iteration + 1
+
+        if callback is not None:
+            callback(iteration, operator.unshift(x))
+        if change < tol:
+            info['stopped'] = 'tol'
+            break
+        if info['residual'][-1] < residual_tol:
+            info['stopped'] = 'residual_tol'
+            break
+    image = operator.unshift(x)
+    return (image, info) if return_info else image
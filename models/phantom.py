@@ -0,0 +1,198 @@
+import numpy as np
+
+def flow_phantom(matrix_size, fov, peak_velocity=1.0, vessel_radius=0.2):
+    """
+    Create a numerical flow phantom
+    
+    A static ellipsoid of tissue holds a cylindrical vessel along z with
+    laminar (parabolic) flow.
+    
+    Parameters:
+    -----------
+    matrix_size : tuple
+        Matrix size [x, y, z]
+    fov : tuple
+        Field of view in meters [x, y, z]
+    peak_velocity : float
+        Velocity on the vessel axis in m/s
+    vessel_radius : float
+        Vessel radius as a fraction of the half FOV in y
+    
+    Returns:
+    --------
+    magnitude : ndarray
+        Magnitude image (n_z, n_y, n_x)
+    velocity : ndarray
+        Velocity in m/s (3, n_z, n_y, n_x), components [x, y, z]
+    """
+    n_x, n_y, n_z = matrix_size
+    z, y, x = np.meshgrid(np.linspace(-1, 1, n_z), np.linspace(-1, 1, n_y),
+                          np.linspace(-1, 1, n_x), indexing='ij')
+    
+    tissue = (x / 0.8)**2 + (y / 0.7)**2 + (z / 0.9)**2 <= 1
+    radius = np.hypot(x * fov[0] / fov[1], y) / vessel_radius
+    vessel = tissue & (radius < 1)
+    
+    magnitude = np.where(vessel, 1.0, np.where(tissue, 0.5, 0.0))
+    velocity = np.zeros((3,) + magnitude.shape)
+    velocity[2][vessel] = peak_velocity * (1 - radius[vessel]**2)
+    return magnitude, velocity
+
+def coil_sensitivities(matrix_size, n_coils, radius=1.3, width=1.0):
+    """
+    Create smooth receive coil sensitivities
+    
+    The coils are spread evenly on a ring around the z axis; every coil
+    has a Gaussian magnitude falloff and a phase that varies slowly across
+    the FOV.
+    
+    Parameters:
+    -----------
+    matrix_size : tuple
+        Matrix size [x, y, z]
+    n_coils : int
+        Number of receive coils
+    radius : float
+        Ring radius relative to the half FOV
+    width : float
+        Width of the sensitivity falloff relative to the half FOV
+    
+    Returns:
+    --------
+    sensitivities : ndarray
+        Complex sensitivities (n_coils, n_z, n_y, n_x)
+    """
+    n_x, n_y, n_z = matrix_size
+    z, y, x = np.meshgrid(np.linspace(-1, 1, n_z), np.linspace(-1, 1, n_y),
+                          np.linspace(-1, 1, n_x), indexing='ij')
+    
+    angles = 2 * np.pi * np.arange(n_coils) / n_coils
+    sensitivities = np.empty((n_coils,) + x.shape, dtype=np.complex64)
+    for c, angle in enumerate(angles):
+        distance2 = (x - radius * np.cos(angle))**2 + (y - radius * np.sin(angle))**2 + 0.5 * z**2
+        phase = angle + 0.5 * (x * np.sin(angle) - y * np.cos(angle))
+        sensitivities[c] = np.exp(-distance2 / (2 * width**2) + 1j * phase)
+    return sensitivities
+
+def encoding_phases(flow_encodings, velocity):
+    """
+    Compute the phase every flow encoding gives to moving spins
+    
+    A simple encoding gives phase pi * v / venc on its axis. Hadamard
+    encodings play bipolars of twice the VENC on all axes, giving
+    pi * v / (2 venc) with the sign of each axis.
+    
+    Parameters:
+    -----------
+    flow_encodings : list
+        Flow encodings from models.velocity_encoding.compile_encodings
+    velocity : ndarray
+        Velocity in m/s (3, ...), components [x, y, z]
+    
+    Returns:
+    --------
+    phases : ndarray
+        Phase in radians (n_encodings, ...)
+    """
+    phases = np.zeros((len(flow_encodings),) + velocity.shape[1:])
+    for i, encoding in enumerate(flow_encodings):
+        scale = 0.5 if encoding['name'].startswith('hadamard') else 1.0
+        for axis, sign in encoding['signs'].items():
+            phases[i] += sign * scale * np.pi * velocity['xyz'.index(axis)] / encoding['venc']
+    return phases
+
+def cardiac_waveform(n_phases):
+    """
+    Relative flow velocity of every cardiac phase
+    
+    Parameters:
+    -----------
+    n_phases : int
+        Number of cardiac phases
+    
+    Returns:
+    --------
+    waveform : ndarray
+        Systolic peak of 1 early in the cycle and a low diastolic flow
+    """
+    t = np.arange(n_phases) / n_phases
+    return 0.1 + 0.9 * np.exp(-((t - 0.2) / 0.08)**2)
+
+def image_to_kspace(image, axes=(-3, -2, -1)):
+    """
+    Centred FFT of an image
+    
+    Parameters:
+    -----------
+    image : ndarray
+        Image with the spatial axes given by axes
+    axes : tuple
+        Spatial axes
+    
+    Returns:
+    --------
+    kspace : ndarray
+        k-space with the centre at n // 2 along every axis
+    """
+    return np.fft.fftshift(np.fft.fftn(np.fft.ifftshift(image, axes=axes), axes=axes, norm='ortho'), axes=axes)
+
+def kspace_to_image(kspace, axes=(-3, -2, -1)):
+    """
+    Centred inverse FFT of k-space
+    
+    Parameters:
+    -----------
+    kspace : ndarray
+        k-space with the centre at n // 2 along every axis
+    axes : tuple
+        Spatial axes
+    
+    Returns:
+    --------
+    image : ndarray
+        Complex image
+    """
+    return np.fft.fftshift(np.fft.ifftn(np.fft.ifftshift(kspace, axes=axes), axes=axes, norm='ortho'), axes=axes)
+
+def fourier_basis(n):
+    """
+    Centred inverse Fourier basis of one axis
+    
+    Parameters:
+    -----------
+    n : int
+        Axis length
+    
+    Returns:
+    --------
+    basis : ndarray
+        (n, n) matrix whose column k is the image of a unit sample at
+        k-space index k, matching kspace_to_image
+    """
+    centred = np.arange(n) - n // 2
+    return (np.exp(2j * np.pi * np.outer(centred, centred) / n) / np.sqrt(n)).astype(np.complex64)
+
+def navigator_kspace(displacement, n_samples=64, edge=0.5, width=1.5):
+    """
+    Navigator k-space of a diaphragm edge
+    
+    Parameters:
+    -----------
+    displacement : ndarray
+        Edge displacement of every navigator in samples
+    n_samples : int
+        Samples per navigator readout
+    edge : float
+        Edge position at zero displacement, as a fraction of the profile
+    width : float
+        Edge width in samples
+    
+    Returns:
+    --------
+    kspace : ndarray
+        Navigator readouts (n_navigators, n_samples)
+    """
+    x = np.arange(n_samples)
+    centre = edge * n_samples + np.asarray(displacement, dtype=float)[..., None]
+    profiles = 1 / (1 + np.exp((x - centre) / width))
+    return image_to_kspace(profiles, axes=(-1,))
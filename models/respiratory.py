@@ -0,0 +1,92 @@
+import numpy as np
+
+def synthetic_respiratory_trace(duration, dt=0.01, period=4.0, period_jitter=0.15,
+                                amplitude_jitter=0.1, drift=0.0, n_power=3, seed=None):
+    """
+    Generate a synthetic respiratory trace
+    
+    Every breath follows the cos^(2n) model of Lujan et al., which spends
+    most of the cycle near end-expiration. Periods and amplitudes vary from
+    breath to breath and the baseline may drift linearly.
+    
+    Parameters:
+    -----------
+    duration : float
+        Trace duration in seconds
+    dt : float
+        Sampling interval in seconds
+    period : float
+        Mean breathing period in seconds
+    period_jitter : float
+        Relative standard deviation of the breathing period
+    amplitude_jitter : float
+        Relative standard deviation of the breathing amplitude
+    drift : float
+        Baseline drift in position units per minute
+    n_power : int
+        Exponent n of the cos^(2n) model
+    seed : int, optional
+        Random seed
+    
+    Returns:
+    --------
+    times : ndarray
+        Sample times in seconds
+    positions : ndarray
+        Respiratory position (0 = end-expiration, 1 = end-inspiration)
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(0, duration, dt)
+    
+    # Breath-by-breath periods and amplitudes, enough breaths for the
+    # shortest allowed period
+    n_breaths = int(np.ceil(duration / (0.3 * period))) + 1
+    periods = period * np.clip(1 + period_jitter * rng.standard_normal(n_breaths), 0.3, None)
+    amplitudes = np.clip(1 + amplitude_jitter * rng.standard_normal(n_breaths), 0.1, None)
+    starts = np.concatenate(([0], np.cumsum(periods)))
+    
+    breath = np.searchsorted(starts, times, side='right') - 1
+    phase = (times - starts[breath]) / periods[breath]
+    positions = amplitudes[breath] * (1 - np.cos(np.pi * phase)**(2 * n_power))
+    return times, positions + drift * times / 60
+
+def load_respiratory_trace(filename, time_column=0, position_column=1, time_scale=1.0, normalize=True):
+    """
+    Load a respiratory trace from a CSV file
+    
+    Parameters:
+    -----------
+    filename : str
+        CSV file with one sample per row; a header row is skipped
+    time_column : int
+        Column of the sample times
+    position_column : int
+        Column of the respiratory signal
+    time_scale : float
+        Factor converting the time column to seconds (e.g. 1e-3 for ms)
+    normalize : bool
+        Map the 1st and 99th percentile of the signal to 0 and 1
+    
+    Returns:
+    --------
+    times : ndarray
+        Sample times in seconds, starting at 0
+    positions : ndarray
+        Respiratory position
+    """
+    with open(filename) as f:
+        first = f.readline().split(',')
+    try:
+        [float(value) for value in first]
+        skip_header = 0
+    except ValueError:
+        skip_header = 1
+    
+    data = np.loadtxt(filename, delimiter=',', skiprows=skip_header, ndmin=2,
+                      usecols=(time_column, position_column))
+    times = (data[:, 0] - data[0, 0]) * time_scale
+    positions = data[:, 1]
+    if normalize:
+        low, high = np.percentile(positions, [1, 99])
+        positions = (positions - low) / (high - low)
+    return times, positions
@@ -1,41 +1,224 @@
+import hashlib
+import json
+
+from utils.math_utils import calculate_first_moment, calculate_resolution
+
+# Default value of every parameter, in definition order
+_DEFAULTS = {
+    # Spatial parameters
+    'fov': (280e-3, 280e-3, 140e-3),  # Field of view in meters [x, y, z]
+    'matrix_size': (192, 128, 32),     # Matrix size [x, y, z]
+
+    # Timing parameters
+    'tr': 5.0e-3,         # Repetition time in seconds
+    'te': 2.5e-3,         # Echo time in seconds
+    't_rf': 1.0e-3,       # RF pulse duration in seconds
+    't_readout': 2.0e-3,  # Readout duration in seconds
+
+    # Flow encoding parameters
+    'venc': 150e-2,       # Velocity encoding value in m/s (150 cm/s)
+    'vencs': (),          # Additional VENCs in m/s for multi-VENC encoding
+    'flow_directions': (True, True, True),  # Encode in [x, y, z] directions
+    'encoding_scheme': 'simple',  # 'simple' (reference + 3 directions) or 'hadamard'
+
+    # RF parameters
+    'flip_angle': 8,      # Flip angle in degrees
+
+    # Acceleration parameters
+    'acceleration_factor': 6,  # Acceleration factor for compressed sensing
+    'center_fraction': 0.04,   # Fraction of k-space center to fully sample
+    'calib_size': 12,          # ky x kz lines fully sampled for coil calibration (ESPIRiT)
+
+    # Cardiac parameters
+    'n_cardiac_phases': 20,    # Number of cardiac phases
+
+    # ReCAR parameters
+    'recar_enabled': True,      # Enable ReCAR
+    'navigator_enabled': True,  # Enable navigator echo for respiratory gating
+    'navigator_interval': 0,    # k-space lines between navigators (0: one navigator at the start)
+
+    # Raw data labels
+    'adc_labels': True,  # Label every ADC with LIN/PAR/PHS/SET/NAV
+
+    # Block scheduling
+    'block_fusion': False,  # Overlap the events of a TR in as few blocks as possible
+}
+
+def _freeze(value):
+    """Convert lists, arrays and NumPy scalars to plain immutable values."""
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _canonical(value):
+    """Map numbers to floats so equal parameters hash to the same digest."""
+    if isinstance(value, tuple):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def _matrix_size(value):
+    """Coerce a matrix size to a 3-tuple of positive ints."""
+    if len(value) != 3:
+        raise ValueError(f"matrix_size must have 3 elements [x, y, z], got {value!r}")
+    size = tuple(int(n) for n in value)
+    if size != value or min(size) < 1:
+        raise ValueError(f"matrix_size must be positive integers, got {value!r}")
+    return size
+
+def _validate(fields):
+    """Check and normalize parameter values in place."""
+    fields['matrix_size'] = _matrix_size(fields['matrix_size'])
+    for key in ('venc', 'tr', 'te'):
+        if not fields[key] > 0:
+            raise ValueError(f"{key} must be positive, got {fields[key]!r}")
+    if not all(venc > 0 for venc in fields['vencs']):
+        raise ValueError(f"vencs must be positive, got {fields['vencs']!r}")
+
+def _restore_params(fields):
+    """Recreate SequenceParams when unpickling."""
+    return SequenceParams(**fields)
+
 class SequenceParams:
     """
-    Class to store and manage 4D flow sequence parameters
+    Immutable 4D flow sequence parameters
+
+    Parameters are fixed at construction; use replace() to derive a
+    modified copy. Derived quantities (resolution, delta_k, k_width, m1)
+    are computed on first access and can never go stale. Instances are
+    hashable and content_hash gives a stable digest of all parameters,
+    so a SequenceParams can be used as a cache key.
+
+    Example:
+    --------
+    params = SequenceParams(venc=100e-2)
+    params = params.replace(matrix_size=[160, 96, 24])
     """
-    def __init__(self):
-        # Spatial parameters
-        self.fov = [280e-3, 280e-3, 140e-3]  # Field of view in meters [x, y, z]
-        self.matrix_size = [192, 128, 32]     # Matrix size [x, y, z]
-        self.resolution = [self.fov[i]/self.matrix_size[i] for i in range(3)]  # Resolution in meters
-        
-        # Timing parameters
-        self.tr = 5.0e-3        # Repetition time in seconds
-        self.te = 2.5e-3        # Echo time in seconds
-        self.t_rf = 1.0e-3      # RF pulse duration in seconds
-        self.t_readout = 2.0e-3 # Readout duration in seconds
-        
-        # Flow encoding parameters
-        self.venc = 150e-2      # Velocity encoding value in m/s (150 cm/s)
-        self.flow_directions = [True, True, True]  # Encode in [x, y, z] directions
-        
-        # RF parameters
-        self.flip_angle = 8     # Flip angle in degrees
-        
-        # Acceleration parameters
-        self.acceleration_factor = 6  # Acceleration factor for compressed sensing
-        self.center_fraction = 0.04   # Fraction of k-space center to fully sample
-        
-        # Cardiac parameters
-        self.n_cardiac_phases = 20    # Number of cardiac phases
-        
-        # ReCAR parameters
-        self.recar_enabled = True     # Enable ReCAR
-        self.navigator_enabled = True  # Enable navigator echo for respiratory gating
-        
-    def update(self, **kwargs):
-        """Update parameters with provided values"""
-        for key, value in kwargs.items():
-            if hasattr(self, key):
-                setattr(self, key, value)
-            else:
-                raise AttributeError(f"SequenceParams has no attribute '{key}'")
\ No newline at end of file
+    __slots__ = tuple(_DEFAULTS) + ('_resolution', '_delta_k', '_k_width', '_m1', '_content_hash')
+
+    def __init__(self, **kwargs):
+        """
+        Initialize sequence parameters
+
+        Parameters:
+        -----------
+        **kwargs
+            Parameter values overriding the defaults
+
+        Raises:
+        -------
+        AttributeError
+            If an unknown parameter is given
+        ValueError
+            If matrix_size is not three positive integers or venc, vencs, tr
+            or te is not positive
+        """
+        for key in kwargs:
+            if key not in _DEFAULTS:
+                raise AttributeError(f"SequenceParams has no attribute '{key}'")
+
+        # Lists are stored as tuples so the parameters stay immutable
+        fields = {key: _freeze(kwargs.get(key, default)) for key, default in _DEFAULTS.items()}
+        _validate(fields)
+        for key, value in fields.items():
+            object.__setattr__(self, key, value)
+
+        for key in ('_resolution', '_delta_k', '_k_width', '_m1', '_content_hash'):
+            object.__setattr__(self, key, None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("SequenceParams is immutable, use replace() to change parameters")
+
+    def __delattr__(self, key):
+        raise AttributeError("SequenceParams is immutable, use replace() to change parameters")
+
+    def replace(self, **kwargs):
+        """
+        Return a copy with the provided parameters changed
+
+        Parameters:
+        -----------
+        **kwargs
+            Parameter values to change
+
+        Returns:
+        --------
+        params : SequenceParams
+            New parameters object
+
+        Raises:
+        -------
+        AttributeError, ValueError
+            As for the constructor
+        """
+        fields = self.as_dict()
+        fields.update(kwargs)
+        return SequenceParams(**fields)
+
+    def as_dict(self):
+        """Return the parameters as a dict (derived quantities excluded)"""
+        return {key: getattr(self, key) for key in _DEFAULTS}
+
+    def _values(self):
+        return tuple(getattr(self, key) for key in _DEFAULTS)
+
+    @property
+    def resolution(self):
+        """Resolution in meters [x, y, z]"""
+        if self._resolution is None:
+            object.__setattr__(self, '_resolution', tuple(calculate_resolution(self.fov, self.matrix_size)))
+        return self._resolution
+
+    @property
+    def delta_k(self):
+        """k-space sampling interval in 1/m [x, y, z]"""
+        if self._delta_k is None:
+            object.__setattr__(self, '_delta_k', tuple(1 / f for f in self.fov))
+        return self._delta_k
+
+    @property
+    def k_width(self):
+        """Width of the sampled k-space in 1/m [x, y, z]"""
+        if self._k_width is None:
+            object.__setattr__(self, '_k_width', tuple(n * dk for n, dk in zip(self.matrix_size, self.delta_k)))
+        return self._k_width
+
+    @property
+    def m1(self):
+        """First gradient moment required for the VENC"""
+        if self._m1 is None:
+            object.__setattr__(self, '_m1', float(calculate_first_moment(self.venc)))
+        return self._m1
+
+    @property
+    def content_hash(self):
+        """Stable SHA-256 hex digest of all parameter values"""
+        if self._content_hash is None:
+            fields = {key: _canonical(value) for key, value in self.as_dict().items()}
+            text = json.dumps(fields, sort_keys=True)
+            object.__setattr__(self, '_content_hash', hashlib.sha256(text.encode()).hexdigest())
+        return self._content_hash
+
+    def __eq__(self, other):
+        if not isinstance(other, SequenceParams):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        fields = ', '.join(f'{key}={value!r}' for key, value in self.as_dict().items())
+        return f'SequenceParams({fields})'
+
+    def __reduce__(self):
+        return (_restore_params, (self.as_dict(),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
@@ -1,31 +1,47 @@
+import copy
+
 import numpy as np
 from pypulseq.make_trap_pulse import make_trapezoid
 from pypulseq.opts import Opts
 
-def calculate_venc_moment(venc, system):
+# Balanced four-point (Hadamard) encoding: sign of the first moment of
+# each axis [x, y, z] in each of the four encodings
+HADAMARD_SIGNS = np.array([[-1, -1, -1],
+                           [ 1,  1, -1],
+                           [ 1, -1,  1],
+                           [-1,  1,  1]])
+
+def calculate_venc_moment(venc, system=None):
     """
     Calculate the first moment for the desired venc
     
+    A first moment difference M1 (in the gamma-scaled units of pypulseq,
+    Hz/m * s) gives a phase 2 pi M1 v, which reaches pi at v = venc.
+    
     Parameters:
     -----------
     venc : float
         Velocity encoding value in m/s
-    system : Opts
-        System limits
+    system : Opts, optional
+        System limits (unused)
         
     Returns:
     --------
     m1 : float
-        First moment required for the desired venc
+        First moment difference required for the desired venc in Hz*s^2/m
     """
-    gamma = 42.58e6  # Hz/T
-    m1 = np.pi / (gamma * venc)
+    m1 = 1 / (2 * venc)
     return m1
 
 def make_bipolar_gradient(channel, venc, system, duration=1e-3):
     """
     Create a bipolar gradient for velocity encoding
     
+    Two back-to-back lobes of area +-A, whose centres are one lobe
+    duration T apart, have a first moment of A * T. Each lobe gets
+    A = M1 / T; the lobes are lengthened on the gradient raster until
+    that area fits within the gradient and slew rate limits.
+    
     Parameters:
     -----------
     channel : str
@@ -35,7 +51,7 @@ def make_bipolar_gradient(channel, venc, system, duration=1e-3):
     system : Opts
         System limits
     duration : float
-        Duration of the entire bipolar pulse in seconds
+        Shortest duration of the entire bipolar pulse in seconds
         
     Returns:
     --------
@@ -45,26 +61,56 @@ def make_bipolar_gradient(channel, venc, system, duration=1e-3):
     # Calculate the first moment for the desired venc
     m1 = calculate_venc_moment(venc, system)
     
-    # Calculate area of each lobe
-    area = m1 / 2
-    
-    # Calculate amplitude based on duration
-    amplitude = area / (duration / 2)
+    # Shortest lobe on the gradient raster whose area fits the limits
+    raster = system.grad_raster_time
+    n_raster = max(int(np.ceil(duration / 2 / raster - 1e-9)), 1)
+    while True:
+        lobe_duration = n_raster * raster
+        area = m1 / lobe_duration
+        try:
+            bipolar_pos = make_trapezoid(channel=channel, system=system, 
+                                         area=area, duration=lobe_duration)
+            if abs(bipolar_pos.amplitude) <= system.max_grad:
+                break
+        except ValueError:
+            pass
+        n_raster += 1
     
-    # Check if amplitude exceeds system limits
-    if amplitude > system.max_grad:
-        # Adjust duration if amplitude exceeds system limits
-        duration = 2 * area / system.max_grad
-        amplitude = system.max_grad
-    
-    # Create the bipolar gradients
-    bipolar_pos = make_trapezoid(channel=channel, system=system, 
-                              area=area, duration=duration/2)
     bipolar_neg = make_trapezoid(channel=channel, system=system, 
-                              area=-area, duration=duration/2)
+                                 area=-area, duration=lobe_duration)
     
     return bipolar_pos, bipolar_neg
 
+def make_bipolar_templates(venc, system, axes):
+    """
+    Create the bipolar gradients of one VENC for several axes
+    
+    The lobes are designed once and copied to every axis, as their
+    shape does not depend on the channel.
+    
+    Parameters:
+    -----------
+    venc : float
+        Velocity encoding value in m/s
+    system : Opts
+        System limits
+    axes : iterable of str
+        Gradient channels
+        
+    Returns:
+    --------
+    gradients : dict
+        Mapping of axis to its (bipolar_pos, bipolar_neg) pair
+    """
+    lobes = make_bipolar_gradient('x', venc, system)
+    gradients = {}
+    for axis in axes:
+        pair = tuple(copy.copy(lobe) for lobe in lobes)
+        for lobe in pair:
+            lobe.channel = axis
+        gradients[axis] = pair
+    return gradients
+
 def create_flow_encoding_gradients(venc, system, flow_directions):
     """
     Create flow encoding gradients for all specified directions
@@ -81,33 +127,36 @@ def create_flow_encoding_gradients(venc, system, flow_directions):
     Returns:
     --------
     encoding_schemes : list
-        List of dictionaries containing gradient combinations for each encoding
+        List of dictionaries containing gradient combinations for each
+        encoding. 'gradients' maps each encoded axis to its (first lobe,
+        second lobe) pair and 'signs' to the sign of its first moment.
     """
     # Create bipolar gradients for each direction if needed
-    gradients = {}
-    if flow_directions[0]:  # X direction
-        gradients['x'] = make_bipolar_gradient('x', venc, system)
-    if flow_directions[1]:  # Y direction
-        gradients['y'] = make_bipolar_gradient('y', venc, system)
-    if flow_directions[2]:  # Z direction
-        gradients['z'] = make_bipolar_gradient('z', venc, system)
+    axes = [axis for axis, enabled in zip('xyz', flow_directions) if enabled]
+    gradients = make_bipolar_templates(venc, system, axes)
     
     # Create 4-point encoding scheme (reference + 3 directions)
     encoding_schemes = [
-        {'name': 'reference', 'gradients': {}},  # Reference (no encoding)
+        {'name': 'reference', 'gradients': {}, 'signs': {}},  # Reference (no encoding)
     ]
     
     # Add encoding for each direction
     for direction, bipolar in gradients.items():
-        scheme = {'name': f'{direction}_encoding', 'gradients': {}}
+        scheme = {'name': f'{direction}_encoding', 'gradients': {}, 'signs': {}}
         scheme['gradients'][direction] = bipolar
+        scheme['signs'][direction] = 1
         encoding_schemes.append(scheme)
     
     return encoding_schemes
 
 def create_hadamard_encoding(venc, system, flow_directions):
     """
-    Create Hadamard-encoded velocity encoding gradients for improved SNR
+    Create balanced four-point (Hadamard) velocity encoding gradients
+    
+    Every encoding encodes all three axes with a first moment of +-M1/2,
+    so the bipolars of all axes are played at the same time and each
+    velocity component is the difference of two pairs of encodings
+    (see HADAMARD_SIGNS).
     
     Parameters:
     -----------
@@ -121,48 +170,118 @@ def create_hadamard_encoding(venc, system, flow_directions):
     Returns:
     --------
     encoding_schemes : list
-        List of dictionaries containing gradient combinations for Hadamard encoding
+        List of dictionaries containing gradient combinations for Hadamard
+        encoding, in the format of create_flow_encoding_gradients
+        
+    Raises:
+    -------
+    ValueError
+        If not all three directions are encoded
     """
-    # Create bipolar gradients for each direction if needed
-    gradients = {}
-    if flow_directions[0]:  # X direction
-        gradients['x'] = make_bipolar_gradient('x', venc, system)
-    if flow_directions[1]:  # Y direction
-        gradients['y'] = make_bipolar_gradient('y', venc, system)
-    if flow_directions[2]:  # Z direction
-        gradients['z'] = make_bipolar_gradient('z', venc, system)
-    
-    # Create Hadamard encoding schemes
-    # [1  1  1  1]
-    # [1  1 -1 -1]
-    # [1 -1  1 -1]
-    # [1 -1 -1  1]
+    if not all(flow_directions):
+        raise ValueError("Hadamard encoding requires all three flow directions")
     
-    encoding_schemes = [
-        {'name': 'hadamard_1', 'gradients': {}},  # Reference (no encoding)
-    ]
+    # Half the first moment per encoding: twice the VENC
+    gradients = make_bipolar_templates(2 * venc, system, 'xyz')
+    
+    encoding_schemes = []
+    for i, signs in enumerate(HADAMARD_SIGNS):
+        scheme = {'name': f'hadamard_{i + 1}', 'gradients': {}, 'signs': {}}
+        for axis, sign in zip('xyz', signs):
+            bipolar_pos, bipolar_neg = gradients[axis]
+            # Swapping the lobes inverts the first moment
+            scheme['gradients'][axis] = (bipolar_pos, bipolar_neg) if sign > 0 else (bipolar_neg, bipolar_pos)
+            scheme['signs'][axis] = int(sign)
+        encoding_schemes.append(scheme)
+    
+    return encoding_schemes
+
+# Encoding scheme name -> function creating its encodings
+ENCODING_SCHEMES = {
+    'simple': create_flow_encoding_gradients,
+    'hadamard': create_hadamard_encoding,
+}
+
+def create_encoding_scheme(scheme, venc, system, flow_directions):
+    """
+    Create the flow encodings of a named encoding scheme
+    
+    Parameters:
+    -----------
+    scheme : str
+        Encoding scheme, 'simple' (reference + one encoding per direction)
+        or 'hadamard' (balanced four-point)
+    venc : float
+        Velocity encoding value in m/s
+    system : Opts
+        System limits
+    flow_directions : list
+        List of booleans indicating which directions to encode [x, y, z]
+        
+    Returns:
+    --------
+    encoding_schemes : list
+        List of dictionaries containing gradient combinations
+        
+    Raises:
+    -------
+    ValueError
+        If the scheme is unknown
+    """
+    if scheme not in ENCODING_SCHEMES:
+        raise ValueError(f"Unknown encoding scheme '{scheme}', expected one of {sorted(ENCODING_SCHEMES)}")
+    return ENCODING_SCHEMES[scheme](venc, system, flow_directions)
+
+def compile_encodings(scheme, vencs, system, flow_directions):
+    """
+    Compile N VENCs x M directions into the list of flow encodings
     
-    # Add Hadamard encoding schemes
-    if all(flow_directions):  # Only if all 3 directions are enabled
-        # Scheme 2: [1, 1, -1]
-        scheme2 = {'name': 'hadamard_2', 'gradients': {}}
-        scheme2['gradients']['x'] = gradients['x'][0]  # Positive x
-        scheme2['gradients']['y'] = gradients['y'][0]  # Positive y
-        scheme2['gradients']['z'] = gradients['z'][1]  # Negative z
-        encoding_schemes.append(scheme2)
+    With the simple scheme all VENCs share one reference, so N VENCs need
+    1 + N * M encodings instead of N * (1 + M). The Hadamard scheme needs
+    its own balanced set of four encodings per VENC. The bipolar lobes of
+    each VENC are designed once and reused on every axis. For a single
+    VENC the encodings are those of create_encoding_scheme; with several
+    VENCs the encoded names get a '_venc<i>' suffix (1-based, in the
+    order given).
+    
+    Parameters:
+    -----------
+    scheme : str
+        Encoding scheme, 'simple' or 'hadamard'
+    vencs : float or sequence of float
+        Velocity encoding values in m/s
+    system : Opts
+        System limits
+    flow_directions : list
+        List of booleans indicating which directions to encode [x, y, z]
         
-        # Scheme 3: [1, -1, 1]
-        scheme3 = {'name': 'hadamard_3', 'gradients': {}}
-        scheme3['gradients']['x'] = gradients['x'][0]  # Positive x
-        scheme3['gradients']['y'] = gradients['y'][1]  # Negative y
-        scheme3['gradients']['z'] = gradients['z'][0]  # Positive z
-        encoding_schemes.append(scheme3)
+    Returns:
+    --------
+    encoding_schemes : list
+        List of dictionaries containing gradient combinations, with the
+        'venc' of every encoding (None for the shared reference)
         
-        # Scheme 4: [1, -1, -1]
-        scheme4 = {'name': 'hadamard_4', 'gradients': {}}
-        scheme4['gradients']['x'] = gradients['x'][0]  # Positive x
-        scheme4['gradients']['y'] = gradients['y'][1]  # Negative y
-        scheme4['gradients']['z'] = gradients['z'][1]  # Negative z
-        encoding_schemes.append(scheme4)
-    
-    return encoding_schemes
\ No newline at end of file
+    Raises:
+    -------
+    ValueError
+        If the scheme is unknown or no VENC is given
+    """
+    vencs = [float(venc) for venc in np.atleast_1d(vencs)]
+    if not vencs:
+        raise ValueError("At least one VENC is required")
+    
+    encoding_schemes = []
+    for i, venc in enumerate(vencs):
+        for encoding in create_encoding_scheme(scheme, venc, system, flow_directions):
+            if not encoding['gradients']:
+                # One reference serves every VENC
+                if i > 0:
+                    continue
+                encoding['venc'] = None
+            else:
+                encoding['venc'] = venc
+                if len(vencs) > 1:
+                    encoding['name'] = f"{encoding['name']}_venc{i + 1}"
+            encoding_schemes.append(encoding)
+    
+    return encoding_schemes
@@ -0,0 +1,306 @@
+import time
+
+import numpy as np
+
+WAVELETS = ('haar', 'db4')
+
+SQRT2 = np.sqrt(2)
+SQRT3 = np.sqrt(3)
+
+# Analysis filters of the convolution reference: s[n] = sum_k h[k] x[2n + k]
+# and d[n] = sum_k g[k] x[2n + k + offset], periodic
+_DB4_H = np.array([1 + SQRT3, 3 + SQRT3, 3 - SQRT3, 1 - SQRT3]) / (4 * SQRT2)
+FILTERS = {
+    'haar': (np.array([1, 1]) / SQRT2, np.array([-1, 1]) / SQRT2, 0),
+    'db4': (_DB4_H, np.array([-_DB4_H[3], _DB4_H[2], -_DB4_H[1], _DB4_H[0]]), -2),
+}
+
+def _along(axis, index):
+    """Index tuple selecting index along axis"""
+    return (slice(None),) * axis + (index,)
+
+def wavelet_schedule(shape, axes, levels=None, min_length=2):
+    """
+    Plan a separable multi-level decomposition
+
+    Every level transforms the low-pass region along every axis whose
+    current length is even and at least min_length, then halves it.
+
+    Parameters:
+    -----------
+    shape : tuple
+        Array shape
+    axes : tuple
+        Transformed axes (non-negative)
+    levels : int, optional
+        Largest number of levels; as many as possible if None
+    min_length : int
+        Shortest axis length a level is applied to
+
+    Returns:
+    --------
+    schedule : list
+        (region shape, transformed axes) of every level
+    """
+    region = list(shape)
+    schedule = []
+    while levels is None or len(schedule) < levels:
+        level_axes = tuple(a for a in axes if region[a] % 2 == 0 and region[a] >= min_length)
+        if not level_axes:
+            break
+        schedule.append((tuple(region), level_axes))
+        for a in level_axes:
+            region[a] //= 2
+    return schedule
+
+class LiftingWavelet:
+    """
+    Orthonormal wavelet transform by lifting, in place
+
+    Haar and Daubechies-4 wavelets are factored into lifting steps
+    (Daubechies & Sweldens) with periodic boundaries. Each step updates the
+    even or odd samples of the array in place through strided views; the
+    shifted terms and the final split into low- and high-pass halves go
+    through scratch buffers allocated once per array shape, so repeated
+    transforms (e.g. in every iteration of a CS reconstruction) allocate
+    nothing.
+
+    The coefficients are stored in the usual separable layout: the
+    low-pass region of every level occupies the start of each transformed
+    axis. The transform is orthonormal, so inverse is its adjoint and
+    (forward, inverse) can be used as the sparsifying transform of
+    models.parallel_imaging.sense_cs_recon.
+    """
+    def __init__(self, name='db4', axes=(-3, -2, -1), levels=None):
+        """
+        Initialize a wavelet transform
+
+        Parameters:
+        -----------
+        name : str
+            'haar' or 'db4'
+        axes : tuple
+            Transformed axes, e.g. (kz, ky, kx, t) axes of a 4D volume
+        levels : int, optional
+            Largest number of decomposition levels; as many as the axis
+            lengths allow if None
+        """
+        if name not in WAVELETS:
+            raise ValueError(f"Unknown wavelet '{name}', expected one of {WAVELETS}")
+        self.name = name
+        self.axes = tuple(axes)
+        self.levels = levels
+        self._scratch_shape = None
+        self._buffer = None
+        self._temp = None
+
+    def _prepare(self, x):
+        """Return the non-negative axes and level schedule, allocate scratch buffers"""
+        axes = tuple(sorted(a % x.ndim for a in self.axes))
+        if self._scratch_shape != (x.shape, x.dtype):
+            self._scratch_shape = (x.shape, x.dtype)
+            self._buffer = np.empty(x.size, dtype=x.dtype)
+            self._temp = np.empty(x.size // 2 + 1, dtype=x.dtype)
+        min_length = 4 if self.name == 'db4' else 2
+        return wavelet_schedule(x.shape, axes, self.levels, min_length)
+
+    def _views(self, region, axis):
+        """Scratch views: the whole region and its even samples along axis"""
+        buffer = self._buffer[:region.size].reshape(region.shape)
+        half = region.shape[:axis] + (region.shape[axis] // 2,) + region.shape[axis + 1:]
+        temp = self._temp[:int(np.prod(half))].reshape(half)
+        return buffer, temp
+
+    def forward(self, x):
+        """
+        Transform in place
+
+        Parameters:
+        -----------
+        x : ndarray
+            Array to transform, e.g. complex64
+
+        Returns:
+        --------
+        x : ndarray
+            The same array holding the wavelet coefficients
+        """
+        for region_shape, axes in self._prepare(x):
+            region = x[tuple(slice(0, n) for n in region_shape)]
+            for axis in axes:
+                self._forward_axis(region, axis)
+        return x
+
+    def inverse(self, x):
+        """
+        Inverse transform in place
+
+        Parameters:
+        -----------
+        x : ndarray
+            Wavelet coefficients
+
+        Returns:
+        --------
+        x : ndarray
+            The same array holding the reconstructed signal
+        """
+        for region_shape, axes in reversed(self._prepare(x)):
+            region = x[tuple(slice(0, n) for n in region_shape)]
+            for axis in reversed(axes):
+                self._inverse_axis(region, axis)
+        return x
+
+    def _forward_axis(self, region, axis):
+        buffer, temp = self._views(region, axis)
+        even = region[_along(axis, slice(0, None, 2))]
+        odd = region[_along(axis, slice(1, None, 2))]
+        first, last = _along(axis, slice(1, None)), _along(axis, slice(None, -1))
+        wrap_first, wrap_last = _along(axis, slice(0, 1)), _along(axis, slice(-1, None))
+
+        if self.name == 'haar':
+            odd -= even
+            np.multiply(odd, 0.5, out=temp)
+            even += temp
+            even *= SQRT2
+            odd /= SQRT2
+        else:
+            np.multiply(odd, SQRT3, out=temp)
+            even += temp
+            np.multiply(even, SQRT3 / 4, out=temp)
+            odd -= temp
+            np.multiply(even, (SQRT3 - 2) / 4, out=temp)
+            odd[first] -= temp[last]
+            odd[wrap_first] -= temp[wrap_last]
+            even[last] -= odd[first]
+            even[wrap_last] -= odd[wrap_first]
+            even *= (SQRT3 - 1) / SQRT2
+            odd *= (SQRT3 + 1) / SQRT2
+
+        # Low-pass half first, then high-pass
+        half = region.shape[axis] // 2
+        buffer[_along(axis, slice(0, half))] = even
+        buffer[_along(axis, slice(half, None))] = odd
+        region[...] = buffer
+
+    def _inverse_axis(self, region, axis):
+        buffer, temp = self._views(region, axis)
+        half = region.shape[axis] // 2
+        buffer[...] = region
+        even = region[_along(axis, slice(0, None, 2))]
+        odd = region[_along(axis, slice(1, None, 2))]
+        even[...] = buffer[_along(axis, slice(0, half))]
+        odd[...] = buffer[_along(axis, slice(half, None))]
+        first, last = _along(axis, slice(1, None)), _along(axis, slice(None, -1))
+        wrap_first, wrap_last = _along(axis, slice(0, 1)), _along(axis, slice(-1, None))
+
+        if self.name == 'haar':
+            odd *= SQRT2
+            even /= SQRT2
+            np.multiply(odd, 0.5, out=temp)
+            even -= temp
+            odd += even
+        else:
+            even *= SQRT2 / (SQRT3 - 1)
+            odd *= SQRT2 / (SQRT3 + 1)
+            even[last] += odd[first]
+            even[wrap_last] += odd[wrap_first]
+            np.multiply(even, (SQRT3 - 2) / 4, out=temp)
+            odd[first] += temp[last]
+            odd[wrap_first] += temp[wrap_last]
+            np.multiply(even, SQRT3 / 4, out=temp)
+            odd += temp
+            np.multiply(odd, SQRT3, out=temp)
+            even -= temp
+
+def convolution_dwt(x, name='db4', axes=(-3, -2, -1), levels=None):
+    """
+    Reference wavelet transform by periodic convolution and downsampling
+
+    Straightforward filter bank with np.roll, giving the same coefficients
+    as LiftingWavelet.forward; used to check and benchmark the lifting
+    implementation.
+
+    Parameters:
+    -----------
+    x : ndarray
+        Array to transform
+    name : str
+        'haar' or 'db4'
+    axes : tuple
+        Transformed axes
+    levels : int, optional
+        Largest number of decomposition levels
+
+    Returns:
+    --------
+    coefficients : ndarray
+        New array of wavelet coefficients
+    """
+    h, g, offset = FILTERS[name]
+    axes = tuple(sorted(a % x.ndim for a in axes))
+    coefficients = x.copy()
+    for region_shape, level_axes in wavelet_schedule(x.shape, axes, levels, 4 if name == 'db4' else 2):
+        index = tuple(slice(0, n) for n in region_shape)
+        region = coefficients[index]
+        for axis in level_axes:
+            low = sum(c * np.roll(region, -k, axis=axis) for k, c in enumerate(h))
+            high = sum(c * np.roll(region, -(k + offset), axis=axis) for k, c in enumerate(g))
+            decimate = _along(axis, slice(0, None, 2))
+            region = np.concatenate([low[decimate], high[decimate]], axis=axis).astype(x.dtype)
+        coefficients[index] = region
+    return coefficients
+
+def benchmark(shape, name='db4', axes=None, levels=None, repeats=3, seed=0):
+    """
+    Time the lifting transform against the convolution reference
+
+    Parameters:
+    -----------
+    shape : tuple
+        Shape of the complex64 test volume, e.g. (n_kz, n_ky, n_kx, n_phases)
+    name : str
+        'haar' or 'db4'
+    axes : tuple, optional
+        Transformed axes; all axes if None
+    levels : int, optional
+        Largest number of decomposition levels
+    repeats : int
+        Runs per implementation; the best time is reported
+    seed : int
+        Random seed of the test volume
+
+    Returns:
+    --------
+    result : dict
+        'lifting', 'convolution' : best forward transform time [s]
+        'inverse' : best lifting inverse transform time [s]
+        'speedup' : convolution over lifting time
+        'max_error' : largest difference between the two coefficient sets
+        'reconstruction_error' : largest error of inverse(forward(x))
+    """
+    rng = np.random.default_rng(seed)
+    x = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+    axes = tuple(range(len(shape))) if axes is None else axes
+    wavelet = LiftingWavelet(name, axes, levels)
+
+    def best(function, data):
+        times = []
+        for _ in range(repeats):
+            work = data.copy()
+            t_start = time.perf_counter()
+            result = function(work)
+            times.append(time.perf_counter() - t_start)
+        return min(times), result
+
+    t_lifting, coefficients = best(wavelet.forward, x)
+    t_convolution, reference = best(lambda a: convolution_dwt(a, name, axes, levels), x)
+    t_inverse, restored = best(wavelet.inverse, coefficients)
+    return {
+        'lifting': t_lifting,
+        'convolution': t_convolution,
+        'inverse': t_inverse,
+        'speedup': t_convolution / t_lifting,
+        'max_error': float(np.abs(coefficients - reference).max()),
+        'reconstruction_error': float(np.abs(restored - x).max()),
+    }
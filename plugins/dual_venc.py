@@ -40,57 +40,31 @@ def create_dual_venc_sequence(seq, system, fov, n_readout, n_phase, n_slice,
     seq : Sequence
         Completed sequence object
     """
-    # Generate sampling mask for compressed sensing
-    mask = generate_variable_density_mask(n_phase, n_slice, acceleration_factor)
+    from models.sequence_params import SequenceParams
+    from controllers.sequence_builder import SequenceBuilder
     
-    # Generate k-space sampling order using ReCAR
-    sampling_order = recar_reordering(mask, n_cardiac_phases)
+    # One shared reference plus three flow encodings per VENC (7 TRs per
+    # k-space point), compiled by the multi-VENC encoding engine
+    params = SequenceParams(
+        fov=[fov, fov, n_slice * slice_thickness],
+        matrix_size=[n_readout, n_phase, n_slice],
+        tr=tr,
+        te=te,
+        venc=venc_high,
+        vencs=[venc_low],
+        flip_angle=flip_angle,
+        acceleration_factor=acceleration_factor,
+        n_cardiac_phases=n_cardiac_phases,
+        navigator_enabled=False
+    )
     
-    # Add sequence blocks for each point in the sampling order
-    for p_idx, s_idx, c_phase in sampling_order:
-        # For each k-space point, we need 8 acquisitions (reference + 3 flow encodings for each VENC)
-        
-        # High VENC acquisitions
-        # Reference scan (no flow encoding)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'ref')
-        
-        # X flow encoding (high VENC)
-        make_bipolar_gradient_with_venc(seq, 'x', venc_high, system)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'x')
-        
-        # Y flow encoding (high VENC)
-        make_bipolar_gradient_with_venc(seq, 'y', venc_high, system)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'y')
-        
-        # Z flow encoding (high VENC)
-        make_bipolar_gradient_with_venc(seq, 'z', venc_high, system)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'z')
-        
-        # Low VENC acquisitions (for improved SNR in low-velocity regions)
-        # X flow encoding (low VENC)
-        make_bipolar_gradient_with_venc(seq, 'x', venc_low, system)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'x')
-        
-        # Y flow encoding (low VENC)
-        make_bipolar_gradient_with_venc(seq, 'y', venc_low, system)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'y')
-        
-        # Z flow encoding (low VENC)
-        make_bipolar_gradient_with_venc(seq, 'z', venc_low, system)
-        make_gre_module(seq, fov, n_readout, slice_thickness, flip_angle, 
-                       system, te, tr, p_idx, s_idx, 'z')
+    builder = SequenceBuilder(params, system)
+    builder.seq = seq
+    builder.build_sequence()
     
     # Set sequence parameters
-    seq.set_definition('FOV', [fov, fov, n_slice*slice_thickness])
     seq.set_definition('Name', '4D_flow_dual_venc_CS_ReCAR')
-    seq.set_definition('VoxelSize', [fov/n_readout, fov/n_phase, slice_thickness])
     seq.set_definition('VENC_HIGH', venc_high)
     seq.set_definition('VENC_LOW', venc_low)
     
-    return seq
\ No newline at end of file
+    return seq
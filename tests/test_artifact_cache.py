@@ -0,0 +1,74 @@
+"""Unit tests for the artifact cache."""
+
+import os
+import tempfile
+import time
+import unittest
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from controllers.sequence_builder import SequenceBuilder
+from controllers.artifact_cache import ArtifactCache, artifact_key
+
+class TestArtifactCache(unittest.TestCase):
+    """Test artifact cache functions."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.system = SystemConfig().get_opts()
+        self.params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=1)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        
+    def tearDown(self):
+        """Remove the cache directory."""
+        self.tmpdir.cleanup()
+        
+    def test_artifact_key(self):
+        """Test that the key follows parameters and mask seed."""
+        key = artifact_key(self.params, self.system)
+        self.assertEqual(key, artifact_key(SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=1), self.system))
+        self.assertNotEqual(key, artifact_key(self.params.replace(venc=1.0), self.system))
+        self.assertNotEqual(key, artifact_key(self.params, self.system, mask_seed=1))
+        
+    def test_put_get_evict(self):
+        """Test storing, retrieving and evicting entries."""
+        cache = ArtifactCache(self.tmpdir.name)
+        key = artifact_key(self.params, self.system)
+        self.assertIsNone(cache.get(key))
+        
+        builder = SequenceBuilder(self.params, self.system)
+        seq = builder.build_sequence()
+        order = builder.recar.get_sampling_order()
+        entry = cache.put(key, seq, builder.sampling_mask, order, meta={'duration': 1.0})
+        
+        self.assertTrue(os.path.exists(entry['seq']))
+        self.assertEqual(entry['order'].shape, (len(order), 3))
+        self.assertEqual(entry['meta']['duration'], 1.0)
+        
+        # A cache too small for two entries keeps only the newest one
+        cache.max_size = cache.size() + 1
+        other = artifact_key(self.params.replace(venc=1.0), self.system)
+        cache.put(other, seq, builder.sampling_mask, order)
+        self.assertIsNone(cache.get(key))
+        self.assertIsNotNone(cache.get(other))
+        
+    def test_evict_stale_tmp_dirs(self):
+        """Test that directories left by an interrupted put are counted and removed."""
+        cache = ArtifactCache(self.tmpdir.name, tmp_max_age=60)
+        stale = os.path.join(self.tmpdir.name, '.tmp-stale-1')
+        fresh = os.path.join(self.tmpdir.name, '.tmp-fresh-2')
+        for directory in (stale, fresh):
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'sequence.seq'), 'wb') as f:
+                f.write(b'x' * 100)
+        old = time.time() - 120
+        os.utime(stale, (old, old))
+        
+        self.assertEqual(cache.size(), 200)
+        cache.evict()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(cache.size(), 100)
+
+if __name__ == '__main__':
+    unittest.main()
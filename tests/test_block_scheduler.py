@@ -0,0 +1,77 @@
+"""Unit tests for the TR block-fusion scheduler."""
+
+import unittest
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from controllers.block_scheduler import event_channels
+from controllers.report_controller import effective_venc, flow_moments
+from controllers.sequence_builder import SequenceBuilder
+
+class TestBlockScheduler(unittest.TestCase):
+    """Test block fusion."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.system = SystemConfig().get_opts()
+        self.params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2, tr=1e-3)
+        
+    def test_fused_layout(self):
+        """Test that fused TRs use fewer blocks without channel conflicts."""
+        serial = SequenceBuilder(self.params, self.system)
+        fused = SequenceBuilder(self.params.replace(block_fusion=True), self.system)
+        
+        for serial_blocks, fused_blocks in zip(serial.tr_layout(), fused.tr_layout()):
+            self.assertLessEqual(len(fused_blocks), len(serial_blocks))
+            self.assertLessEqual(sum(d for _, _, d in fused_blocks), sum(d for _, _, d in serial_blocks))
+            for _, events, _ in fused_blocks:
+                channels = [channel for event in events for channel in event_channels(event)]
+                self.assertEqual(len(channels), len(set(channels)))
+                
+        # The rephaser overlaps the x bipolar, shortening the x encoded TR
+        self.assertLess(fused.plan()['n_blocks'], serial.plan()['n_blocks'])
+        serial_tr = serial.plan()['tr_durations']
+        fused_tr = fused.plan()['tr_durations']
+        self.assertLess(fused_tr['x_encoding'], serial_tr['x_encoding'])
+        
+    def test_te_and_tr(self):
+        """Test that the readout respects TE and the TR is padded."""
+        params = self.params.replace(block_fusion=True, tr=10e-3, te=6e-3)
+        builder = SequenceBuilder(params, self.system)
+        
+        for blocks in builder.tr_layout():
+            t_start = 0
+            for role, events, duration in blocks:
+                if 'readout' in role:
+                    adc = [event for event in events if event.type == 'adc'][0]
+                    echo = t_start + adc.delay + adc.num_samples * adc.dwell / 2
+                    self.assertAlmostEqual(echo, params.te, places=6)
+                t_start += duration
+            self.assertAlmostEqual(t_start, params.tr, places=6)
+            
+    def test_fused_flow_moments(self):
+        """Test that fusion keeps the VENC, with and without a TE delay."""
+        for params in (self.params, self.params.replace(tr=20e-3, te=6e-3)):
+            builder = SequenceBuilder(params.replace(block_fusion=True), self.system)
+            venc = effective_venc(flow_moments(builder))
+            for axis in 'xyz':
+                for other in 'xyz':
+                    expected = params.venc if other == axis else np.inf
+                    self.assertAlmostEqual(venc[f'{axis}_encoding'][other], expected)
+            
+    def test_fused_build(self):
+        """Test that the fused sequence passes the timing check and matches the plan."""
+        builder = SequenceBuilder(self.params.replace(block_fusion=True), self.system)
+        plan = builder.plan()
+        seq = builder.build_sequence()
+        
+        ok, _ = seq.check_timing()
+        duration, n_blocks, _ = seq.duration()
+        self.assertTrue(ok)
+        self.assertEqual(plan['n_blocks'], n_blocks)
+        self.assertAlmostEqual(plan['duration'], duration, places=6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Unit tests for the incremental build graph."""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from controllers.build_graph import BuildGraph
+from controllers.sequence_builder import SequenceBuilder
+from utils.pulseq_utils import pypulseq_internals_supported
+
+def block_signature(seq, block_index):
+    """Describe a block by the data of its events rather than library IDs."""
+    libraries = [seq.delay_library, seq.rf_library, seq.grad_library,
+                 seq.grad_library, seq.grad_library, seq.adc_library]
+    event_ids = seq.dict_block_events[block_index]
+    return [None if event_ids[i] == 0 else tuple(np.round(libraries[i].data[event_ids[i]], 6))
+            for i in range(len(libraries))]
+
+class TestBuildGraph(unittest.TestCase):
+    """Test incremental builds."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.system = SystemConfig().get_opts()
+        self.params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2)
+        
+    def test_invalidated(self):
+        """Test which stages a parameter change invalidates."""
+        graph = BuildGraph(self.system)
+        graph.build(self.params)
+        
+        self.assertEqual(graph.invalidated(self.params), [])
+        self.assertEqual(graph.invalidated(self.params.replace(venc=1.0)), ['templates', 'blocks', 'export'])
+        self.assertEqual(graph.invalidated(self.params.replace(n_cardiac_phases=3)), ['order', 'blocks', 'export'])
+        
+    @unittest.skipUnless(pypulseq_internals_supported(), "block table patching needs the pinned pypulseq")
+    def test_patch_matches_full_build(self):
+        """Test that a patched block table equals a fresh build."""
+        graph = BuildGraph(self.system)
+        graph.build(self.params)
+        
+        # A VENC of 1.45 m/s keeps the bipolar lobe duration of 1.5 m/s
+        params = self.params.replace(venc=1.45, flip_angle=12)
+        seq = graph.build(params)
+        self.assertIn('blocks (patched)', graph.last_run)
+        
+        reference = SequenceBuilder(params, self.system).build_sequence()
+        self.assertEqual(len(seq.dict_block_events), len(reference.dict_block_events))
+        for block_index in range(1, len(seq.dict_block_events) + 1):
+            self.assertEqual(block_signature(seq, block_index), block_signature(reference, block_index))
+            
+    def test_rebuild_without_pinned_pypulseq(self):
+        """Test that other pypulseq releases rebuild instead of patching."""
+        with mock.patch('controllers.build_graph.pypulseq_internals_supported', return_value=False):
+            graph = BuildGraph(self.system)
+            graph.build(self.params)
+            graph.build(self.params.replace(venc=1.45))
+        
+        self.assertIn('blocks', graph.last_run)
+        self.assertNotIn('blocks (patched)', graph.last_run)
+
+    def test_patch_with_periodic_navigators(self):
+        """Test patching a block table with interleaved navigators."""
+        params = self.params.replace(navigator_interval=7)
+        graph = BuildGraph(self.system)
+        graph.build(params)
+        
+        params = params.replace(venc=1.45)
+        seq = graph.build(params)
+        self.assertIn('blocks (patched)', graph.last_run)
+        
+        reference = SequenceBuilder(params, self.system).build_sequence()
+        for block_index in range(1, len(reference.dict_block_events) + 1):
+            self.assertEqual(block_signature(seq, block_index), block_signature(reference, block_index))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Unit tests for retrospective cardiac binning."""
+
+import unittest
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from controllers.sequence_builder import SequenceBuilder
+from models.cardiac_binning import synthetic_r_peaks, accepted_beats, bin_readouts, assembly_indices
+from models.sequence_params import SequenceParams
+from utils.pulseq_utils import adc_times
+
+class TestCardiacBinning(unittest.TestCase):
+    """Test retrospective ECG binning."""
+    
+    def test_arrhythmia_rejection(self):
+        """Test that premature beats and their pauses are rejected."""
+        r_peaks = np.arange(1, 21, dtype=float)
+        r_peaks[10:] -= 0.4  # Premature beat 10, compensatory pause after it
+        r_peaks[11:] += 0.4
+        rr, accepted = accepted_beats(r_peaks)
+        
+        self.assertEqual(np.nonzero(~accepted)[0].tolist(), [9, 10])
+        
+    def test_variable_rr(self):
+        """Test that phases are stretched to every beat."""
+        r_peaks = np.array([0.0, 0.8, 1.8, 2.6])
+        times = np.array([-0.1, 0.05, 0.75, 0.85, 1.7, 2.0, 2.7])
+        binning = bin_readouts(times, r_peaks, n_phases=4, tolerance=1.0)
+        
+        self.assertEqual(binning['phase'].tolist(), [-1, 0, 3, 0, 3, 0, -1])
+        self.assertEqual(binning['beat'].tolist(), [-1, 0, 0, 1, 1, 2, -1])
+        
+    def test_assembly_indices(self):
+        """Test binning the readouts of a built sequence."""
+        params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2, navigator_interval=3)
+        builder = SequenceBuilder(params, SystemConfig().get_opts())
+        readouts = builder.readout_order()
+        times = adc_times(builder.build_sequence())
+        self.assertEqual(len(times), len(readouts['line']))
+        
+        r_peaks = synthetic_r_peaks(times[-1] + 2, rr=0.1, ectopic_rate=0.1, seed=0) - 0.05
+        binning = bin_readouts(times, r_peaks, n_phases=4)
+        indices = assembly_indices(binning, readouts)
+        
+        self.assertFalse(readouts['navigator'][indices['readout']].any())
+        self.assertTrue(np.all(binning['phase'][indices['readout']] >= 0))
+        self.assertTrue(np.all((indices['phase'] >= 0) & (indices['phase'] < 4)))
+        self.assertTrue(np.all(indices['encoding'] < len(builder.flow_encodings)))
+        
+        # Indices address an (encoding, phase, kz, ky) k-space array
+        kspace = np.zeros((len(builder.flow_encodings), 4, 8, 16), dtype=int)
+        np.add.at(kspace, (indices['encoding'], indices['phase'], indices['kz'], indices['ky']), 1)
+        self.assertEqual(kspace.sum(), len(indices['readout']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Unit tests for warm-started, checkpointed cine reconstruction."""
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from controllers.cine_recon import ReconCheckpoint, reconstruct_cine
+from models.compressed_sensing import generate_phyllotaxis_sampling
+from models.parallel_imaging import sense_cs_recon
+from models.phantom import cardiac_waveform, coil_sensitivities, flow_phantom, image_to_kspace
+
+class TestCineRecon(unittest.TestCase):
+    """Test early stopping, warm starts and checkpoints."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Simulate a reference and a flow-encoded cine series."""
+        matrix_size = (32, 32, 16)
+        magnitude, velocity = flow_phantom(matrix_size, (0.28, 0.28, 0.14))
+        waveform = cardiac_waveform(8)
+        cls.images = np.stack([[magnitude * np.exp(1j * np.pi * w * e * velocity[2]) for w in waveform]
+                               for e in (0, 1)])
+        sensitivities = coil_sensitivities(matrix_size, 4)
+        cls.maps = (sensitivities / np.linalg.norm(sensitivities, axis=0)).astype(np.complex64)
+        cls.mask = generate_phyllotaxis_sampling(32, 16, 3, 0.15).T.astype(bool)
+        kspace = image_to_kspace(cls.maps * cls.images[:, :, None]).astype(np.complex64)
+        cls.kspace = kspace * cls.mask[:, :, None]
+    
+    def setUp(self):
+        """Create a checkpoint directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        """Remove the checkpoint directory."""
+        self.tmpdir.cleanup()
+    
+    def error(self, images):
+        return np.linalg.norm(images - self.images) / np.linalg.norm(self.images)
+    
+    def test_early_stopping(self):
+        """Test the relative change and data residual stopping rules."""
+        frame = self.kspace[1, 2]
+        _, info = sense_cs_recon(frame, self.maps, self.mask, n_iter=200, tol=1e-2, return_info=True)
+        self.assertEqual(info['stopped'], 'tol')
+        self.assertLess(info['iterations'], 200)
+        self.assertLess(info['relative_change'][-1], 1e-2)
+        
+        _, info = sense_cs_recon(frame, self.maps, self.mask, n_iter=200, residual_tol=0.05, return_info=True)
+        self.assertEqual(info['stopped'], 'residual_tol')
+        self.assertLess(info['residual'][-1], 0.05)
+    
+    def test_warm_start(self):
+        """Test that warm starts converge in fewer iterations to the same error."""
+        cold, cold_info = reconstruct_cine(self.kspace, self.maps, self.mask, warm_start=None)
+        for mode in ('phase', 'encoding'):
+            warm, warm_info = reconstruct_cine(self.kspace, self.maps, self.mask, warm_start=mode)
+            self.assertLess(warm_info['iterations'].mean(), 0.5 * cold_info['iterations'].mean())
+            self.assertLess(self.error(warm), 1.1 * self.error(cold))
+        with self.assertRaises(ValueError):
+            reconstruct_cine(self.kspace, self.maps, self.mask, warm_start='slice')
+    
+    def test_checkpoint_resume(self):
+        """Test that an interrupted reconstruction resumes from its checkpoint."""
+        directory = os.path.join(self.tmpdir.name, 'recon')
+        images, info = reconstruct_cine(self.kspace, self.maps, self.mask, checkpoint_dir=directory)
+        self.assertFalse(info['resumed'].any())
+        
+        # Interrupted in the middle of frame (1, 2)
+        for phase in range(2, 8):
+            os.remove(os.path.join(directory, f'frame-1-{phase}.npz'))
+        with open(os.path.join(directory, 'meta.json')) as f:
+            checkpoint = ReconCheckpoint(directory, json.load(f)['fingerprint'])
+        checkpoint.save_iterate(1, 2, images[1, 2], 3)
+        
+        resumed, info = reconstruct_cine(self.kspace, self.maps, self.mask, checkpoint_dir=directory)
+        self.assertEqual(info['resumed'].sum(), 10)
+        self.assertGreaterEqual(info['iterations'][1, 2], 4)
+        np.testing.assert_allclose(resumed[0], images[0])
+        self.assertLess(np.linalg.norm(resumed[1] - images[1]) / np.linalg.norm(images[1]), 0.01)
+        self.assertFalse(os.path.exists(os.path.join(directory, 'iterate-1-2.npz')))
+        
+        # Other settings, coil sensitivities or a custom transform never resume
+        with self.assertRaises(ValueError):
+            reconstruct_cine(self.kspace, self.maps, self.mask, lam=0.02, checkpoint_dir=directory)
+        with self.assertRaises(ValueError):
+            reconstruct_cine(self.kspace, np.roll(self.maps, 1, axis=0), self.mask, checkpoint_dir=directory)
+        with self.assertRaises(ValueError):
+            reconstruct_cine(self.kspace, self.maps, self.mask, transform=(np.copy, np.copy),
+                             checkpoint_dir=os.path.join(self.tmpdir.name, 'transform'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Unit tests for coil compression."""
+
+import unittest
+
+import numpy as np
+
+from models.coil_compression import CoilCompressor, align_compression
+from models.parallel_imaging import calibration_data
+from models.phantom import coil_sensitivities, flow_phantom, image_to_kspace
+from utils.math_utils import randomized_svd
+
+class TestCoilCompression(unittest.TestCase):
+    """Test SVD coil compression."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Simulate noisy multi-coil k-space."""
+        matrix_size = (48, 32, 8)
+        magnitude, _ = flow_phantom(matrix_size, (0.28, 0.28, 0.14))
+        sensitivities = coil_sensitivities(matrix_size, 16, width=0.6)
+        rng = np.random.default_rng(0)
+        kspace = image_to_kspace(sensitivities * magnitude)
+        kspace += 0.01 * (rng.standard_normal(kspace.shape) + 1j * rng.standard_normal(kspace.shape))
+        cls.kspace = kspace.astype(np.complex64)
+        cls.calib = calibration_data(cls.kspace, 16, calib_width=matrix_size[0])
+        cls.readouts = np.moveaxis(cls.kspace, 0, 2).reshape(-1, 16, matrix_size[0])
+    
+    def test_randomized_svd(self):
+        """Test the randomized SVD of a stack of low-rank matrices."""
+        rng = np.random.default_rng(1)
+        matrix = rng.standard_normal((3, 40, 5)) @ rng.standard_normal((3, 5, 60))
+        u, s, vh = randomized_svd(matrix, 5, seed=0)
+        self.assertEqual(u.shape, (3, 40, 5))
+        self.assertEqual(vh.shape, (3, 5, 60))
+        np.testing.assert_allclose(s, np.linalg.svd(matrix, compute_uv=False)[:, :5], rtol=1e-8)
+        np.testing.assert_allclose((u * s[:, None, :]) @ vh, matrix, atol=1e-8)
+    
+    def test_retained_energy(self):
+        """Test that few virtual coils keep most of the signal."""
+        energy = {}
+        for mode in ('global', 'geometric'):
+            compressor = CoilCompressor.from_calibration(self.calib, 6, mode, seed=0)
+            self.assertEqual(compressor.n_virtual, 6)
+            energy[mode] = compressor.retained_energy(self.calib)
+            self.assertLessEqual(energy[mode], 1 + 1e-5)
+        self.assertGreater(energy['global'], 0.95)
+        self.assertGreater(energy['geometric'], energy['global'])
+    
+    def test_geometric_alignment(self):
+        """Test that alignment removes arbitrary rotations between x positions."""
+        rng = np.random.default_rng(2)
+        base = rng.standard_normal((4, 16)) + 1j * rng.standard_normal((4, 16))
+        drift = rng.standard_normal((4, 16)) + 1j * rng.standard_normal((4, 16))
+        smooth = np.stack([np.linalg.qr((base + 0.02 * x * drift).T)[0].T for x in range(20)])
+        rotations = np.linalg.qr(rng.standard_normal((20, 4, 4)) + 1j * rng.standard_normal((20, 4, 4)))[0]
+        
+        aligned = align_compression(rotations @ smooth)
+        steps = np.linalg.norm(np.diff(aligned, axis=0), axis=(1, 2))
+        smooth_steps = np.linalg.norm(np.diff(smooth, axis=0), axis=(1, 2))
+        self.assertLess(steps.max(), 2 * smooth_steps.max())
+        
+        # Alignment only rotates within the subspace of every position
+        np.testing.assert_allclose(aligned.conj().swapaxes(-1, -2) @ aligned,
+                                   smooth.conj().swapaxes(-1, -2) @ smooth, atol=1e-10)
+    
+    def test_streaming(self):
+        """Test that single readouts and batches compress identically."""
+        for mode in ('global', 'geometric'):
+            compressor = CoilCompressor.from_calibration(self.calib, 4, mode, seed=0)
+            batches = np.array_split(self.readouts, 7)
+            streamed = np.concatenate(list(compressor.stream(batches)))
+            self.assertEqual(streamed.shape, (len(self.readouts), 4, 48))
+            self.assertEqual(streamed.dtype, np.complex64)
+            np.testing.assert_allclose(compressor.apply(self.readouts[10]), streamed[10], atol=1e-5)
+    
+    def test_invalid_arguments(self):
+        """Test errors for invalid coil counts and modes."""
+        with self.assertRaises(ValueError):
+            CoilCompressor.from_calibration(self.calib, 17)
+        with self.assertRaises(ValueError):
+            CoilCompressor(np.eye(4), mode='pca')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Unit tests for the respiratory gating simulator."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from controllers.gating_simulator import simulate_gating
+from controllers.recar_controller import RecarController
+from models.compressed_sensing import generate_phyllotaxis_sampling
+from models.respiratory import synthetic_respiratory_trace, load_respiratory_trace
+
+class TestGatingSimulator(unittest.TestCase):
+    """Test gating efficiency simulation."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        mask = generate_phyllotaxis_sampling(32, 16, 4, 0.1)
+        self.recar = RecarController(mask, 2)
+        self.n_lines = len(self.recar.get_sampling_order())
+        self.times, self.positions = synthetic_respiratory_trace(1800, seed=0)
+        
+    def test_synthetic_trace(self):
+        """Test the range and breathing rate of a synthetic trace."""
+        self.assertEqual(self.times.shape, self.positions.shape)
+        self.assertAlmostEqual(self.positions.min(), 0, places=3)
+        
+        # One end-expiration per breath of about 4 s
+        n_breaths = np.count_nonzero(np.diff((self.positions > 0.5).astype(int)) == 1)
+        self.assertAlmostEqual(n_breaths, 1800 / 4, delta=30)
+        
+    def test_full_window_acquires_every_slot(self):
+        """Test that an all-accepting window gives 100% efficiency."""
+        result = simulate_gating(self.times, self.positions, self.recar, 0.02, (-1, 10))
+        
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['efficiency'], 1.0)
+        self.assertAlmostEqual(result['scan_time'], self.n_lines * 0.02)
+        
+    def test_recar_versus_gating(self):
+        """Test that ReCAR is faster and acquires the k-space centre at end-expiration."""
+        gating = simulate_gating(self.times, self.positions, self.recar, 0.02, (0, 0.25), 'gating',
+                                 nav_duration=4e-3, navigator_interval=5)
+        recar = simulate_gating(self.times, self.positions, self.recar, 0.02, (0, 0.6), 'recar',
+                                nav_duration=4e-3, navigator_interval=5)
+        
+        self.assertTrue(gating['complete'] and recar['complete'])
+        self.assertLess(recar['scan_time'], gating['scan_time'])
+        self.assertGreater(recar['efficiency'], gating['efficiency'])
+        self.assertEqual(recar['bin_lines'].sum(), self.n_lines)
+        self.assertTrue(np.all(np.diff(recar['bin_radius']) > 0))
+        
+        with self.assertRaises(ValueError):
+            simulate_gating(self.times, self.positions, self.recar, 0.02, (0, 1), 'triggered')
+        
+    def test_load_respiratory_trace(self):
+        """Test loading a CSV trace with a header and times in ms."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'trace.csv')
+            with open(filename, 'w') as f:
+                f.write('time_ms,bellows\n')
+                for t, p in zip(self.times[:1000] * 1e3 + 500, self.positions[:1000] * 40 + 100):
+                    f.write(f'{t},{p}\n')
+            times, positions = load_respiratory_trace(filename, time_scale=1e-3, normalize=False)
+            
+        np.testing.assert_allclose(times, self.times[:1000])
+        np.testing.assert_allclose(positions, self.positions[:1000] * 40 + 100)
+
+if __name__ == '__main__':
+    unittest.main()
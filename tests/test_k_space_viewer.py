@@ -0,0 +1,67 @@
+"""Unit tests for the k-space viewer."""
+
+import os
+import tempfile
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from views.k_space_viewer import (_kt_points, acquisition_frames, decimate_points,
+                                  plot_acquisition_order, plot_3d_sampling_pattern)
+
+class TestKSpaceViewer(unittest.TestCase):
+    """Test k-space viewer functions."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        rng = np.random.default_rng(0)
+        self.mask = (rng.random((16, 8)) < 0.3).astype(int)
+        
+    def test_kt_points(self):
+        """Test that a 2D mask matches the equivalent k-t mask."""
+        kt_mask = np.broadcast_to(self.mask, (3,) + self.mask.shape)
+        
+        points_2d = np.stack(_kt_points(self.mask, 3))
+        points_3d = np.stack(_kt_points(kt_mask))
+        
+        np.testing.assert_array_equal(points_2d, points_3d)
+        self.assertEqual(points_2d.shape[1], 3 * self.mask.sum())
+        
+    def test_decimate_points(self):
+        """Test point decimation."""
+        self.assertEqual(len(decimate_points(100, 200)), 100)
+        
+        indices = decimate_points(1000000, 1000)
+        self.assertEqual(len(indices), 1000)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 999999)
+        
+    def test_acquisition_frames(self):
+        """Test that the last frame counts every acquisition."""
+        p, s = np.nonzero(self.mask)
+        order = [(pi, si, c) for c in range(2) for pi, si in zip(p, s)]
+        
+        frames = acquisition_frames(order, self.mask.shape, n_frames=4)
+        
+        self.assertEqual(frames.shape, (4,) + self.mask.shape)
+        np.testing.assert_array_equal(frames[-1], 2 * self.mask)
+        self.assertTrue(np.all(np.diff(frames, axis=0) >= 0))
+        
+    def test_plots(self):
+        """Test that the plots are written to files."""
+        p, s = np.nonzero(self.mask)
+        order = [(pi, si, 0) for pi, si in zip(p, s)]
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'kt.png')
+            plot_3d_sampling_pattern(self.mask, 4, filename, max_points=50)
+            self.assertTrue(os.path.exists(filename))
+            
+            filename = os.path.join(tmp_dir, 'order.gif')
+            plot_acquisition_order(order, self.mask.shape, filename, n_frames=3, animate=True)
+            self.assertTrue(os.path.exists(filename))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Unit tests for the memory-mapped k-space assembler."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from controllers.kspace_assembler import KSpaceAssembler, open_kspace
+from controllers.sequence_builder import SequenceBuilder
+from models.sequence_params import SequenceParams
+
+class TestKSpaceAssembler(unittest.TestCase):
+    """Test k-space assembly."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'kspace.npy')
+        params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2, navigator_interval=5)
+        self.builder = SequenceBuilder(params, SystemConfig().get_opts())
+        
+        readouts = self.builder.readout_order()
+        image = ~readouts['navigator']
+        self.index = tuple(readouts[key][image] for key in ('encoding', 'cardiac_phase', 'kz', 'ky'))
+        rng = np.random.default_rng(0)
+        shape = (int(image.sum()), 3, 32)
+        self.data = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+        
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp_dir.cleanup()
+        
+    def test_assemble_stream(self):
+        """Test assembling readout batches in acquisition order."""
+        assembler = KSpaceAssembler.for_builder(self.filename, self.builder, n_coils=3)
+        kspace = assembler.consume(np.array_split(self.data, 7))
+        
+        self.assertTrue(assembler.complete)
+        self.assertEqual(kspace.shape, (4, 2, 8, 16, 3, 32))
+        np.testing.assert_array_equal(kspace[self.index], self.data)
+        self.assertEqual(np.count_nonzero(kspace[..., 0, 0]), len(self.data))
+        
+        del kspace, assembler
+        np.testing.assert_array_equal(open_kspace(self.filename, (4, 2, 8, 16, 3, 32))[self.index], self.data)
+        
+    def test_retrospective_phases(self):
+        """Test discarding readouts with a negative cardiac phase."""
+        discard = np.arange(len(self.data)) % 3 == 0
+        phases = np.where(discard, -1, self.index[1])
+        assembler = KSpaceAssembler.for_builder(self.filename, self.builder, phases=phases)
+        kspace = assembler.consume([self.data[:, 0]])
+        
+        kept = tuple(index[~discard] for index in self.index)
+        rejected = tuple(index[discard] for index in self.index)
+        np.testing.assert_array_equal(kspace[kept], self.data[~discard, 0])
+        self.assertFalse(kspace[rejected].any())
+        self.assertEqual(np.count_nonzero(kspace[..., 0]), np.count_nonzero(~discard))
+        
+        with self.assertRaises(ValueError):
+            assembler.add(self.data[:1, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Unit tests for navigator displacement estimation."""
+
+import unittest
+
+import numpy as np
+
+from models.navigator import navigator_profiles, estimate_displacement
+
+class TestNavigator(unittest.TestCase):
+    """Test navigator processing."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        rng = np.random.default_rng(0)
+        self.n_samples = 64
+        self.shifts = rng.uniform(-8, 8, 2000)
+        
+        # Diaphragm-like edge: liver signal below, lung above
+        x = np.arange(self.n_samples)
+        edge = 32 + self.shifts[:, None]
+        self.profiles = 1 / (1 + np.exp((x - edge) / 1.5)) + 0.2 * np.exp(-((x - 10) / 4)**2)
+        self.reference = 1 / (1 + np.exp((x - 32) / 1.5)) + 0.2 * np.exp(-((x - 10) / 4)**2)
+        
+    def test_estimate_displacement(self):
+        """Test batched sub-pixel displacement estimates."""
+        displacement = estimate_displacement(self.profiles, self.reference, pixel_size=2.0,
+                                             max_shift=16, window=(20, 48))
+        
+        self.assertEqual(displacement.shape, self.shifts.shape)
+        np.testing.assert_allclose(displacement / 2.0, self.shifts, atol=0.05)
+        
+    def test_navigator_profiles(self):
+        """Test that profiles reconstructed from k-space keep their shift."""
+        kspace = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(self.profiles[:10], axes=-1), axis=-1), axes=-1)
+        profiles = navigator_profiles(kspace)
+        
+        np.testing.assert_allclose(profiles, self.profiles[:10], atol=1e-9)
+        np.testing.assert_allclose(estimate_displacement(profiles), estimate_displacement(self.profiles[:10]), atol=1e-9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Unit tests for the incremental preview reconstruction."""
+
+import unittest
+
+import numpy as np
+
+from controllers.preview import PreviewReconstructor
+from models.phantom import kspace_to_image
+
+class TestPreviewReconstructor(unittest.TestCase):
+    """Test the live preview."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.shape = (2, 6, 8, 16)
+        self.rng = np.random.default_rng(0)
+    
+    def random_lines(self, n):
+        """Draw random line positions and data."""
+        index = [self.rng.integers(0, size, n) for size in self.shape[:3]]
+        data = (self.rng.standard_normal((n, self.shape[3])) +
+                1j * self.rng.standard_normal((n, self.shape[3]))).astype(np.complex64)
+        return index, data
+    
+    def check_updates(self, full_fft_planes):
+        """Compare the preview with a zero-filled recon after every frame."""
+        preview = PreviewReconstructor(self.shape, fps=np.inf, full_fft_planes=full_fft_planes)
+        kspace = np.zeros(self.shape, dtype=np.complex64)
+        for n_lines in (1, 5, 20, 40):
+            (encoding, kz, ky), data = self.random_lines(n_lines)
+            preview.add(encoding, kz, ky, data)
+            for i in range(n_lines):
+                kspace[encoding[i], kz[i], ky[i]] = data[i]
+            image = preview.frame()
+            np.testing.assert_allclose(image, kspace_to_image(kspace), atol=1e-5)
+        np.testing.assert_array_equal(preview.sampled, np.any(kspace != 0, axis=-1))
+    
+    def test_rank_one_updates(self):
+        """Test line-by-line updates against a full FFT."""
+        self.check_updates(full_fft_planes=10**6)
+    
+    def test_full_fft_fallback(self):
+        """Test that the full FFT path gives the same image."""
+        self.check_updates(full_fft_planes=1)
+    
+    def test_throttling(self):
+        """Test that frames are only computed at the frame rate."""
+        now = [0.0]
+        preview = PreviewReconstructor(self.shape, fps=10, clock=lambda: now[0])
+        (encoding, kz, ky), data = self.random_lines(3)
+        
+        preview.add(encoding[0], kz[0], ky[0], data[0])
+        self.assertIsNotNone(preview.frame())
+        now[0] = 0.05
+        preview.add(encoding[1], kz[1], ky[1], data[1])
+        self.assertIsNone(preview.frame())
+        now[0] = 0.1
+        self.assertIsNotNone(preview.frame())
+        self.assertEqual(preview.n_frames, 2)
+        self.assertEqual(preview.sampled.sum(), len(set(zip(encoding[:2], kz[:2], ky[:2]))))
+        
+        preview.add(encoding[2], kz[2], ky[2], data[2])
+        self.assertIsNotNone(preview.frame(force=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Unit tests for the HDF5 raw-data container."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from controllers.raw_data import RawDataFile
+from controllers.sequence_builder import SequenceBuilder
+from models.sequence_params import SequenceParams
+
+class TestRawData(unittest.TestCase):
+    """Test the raw-data container."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'raw.h5')
+        self.params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2)
+        self.builder = SequenceBuilder(self.params, SystemConfig().get_opts())
+        
+        readouts = self.builder.readout_order()
+        image = ~readouts['navigator']
+        self.index = tuple(readouts[key][image] for key in ('encoding', 'cardiac_phase', 'kz', 'ky'))
+        rng = np.random.default_rng(0)
+        shape = (int(image.sum()), 2, 32)
+        self.data = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+        
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp_dir.cleanup()
+        
+    def test_append_as_acquired(self):
+        """Test streaming readouts and reading them back with the metadata."""
+        with RawDataFile.for_builder(self.filename, self.builder, n_coils=2) as raw:
+            for i in range(len(self.data)):
+                raw.append(*(index[i] for index in self.index), self.data[i])
+                
+        with RawDataFile(self.filename) as raw:
+            self.assertEqual(raw.shape, (4, 2, 8, 16, 2, 32))
+            self.assertEqual(raw.params, self.params)
+            self.assertEqual(raw.encodings[0], 'reference')
+            np.testing.assert_array_equal(raw.mask, self.builder.sampling_mask)
+            np.testing.assert_array_equal(raw.order, self.builder.recar.get_sampling_order())
+            np.testing.assert_array_equal(raw.read()[self.index], self.data)
+            self.assertEqual(raw.sampled().sum(), len(self.data))
+            
+    def test_partial_read(self):
+        """Test reading one encoding or phase and overwriting a line."""
+        with RawDataFile.for_builder(self.filename, self.builder, n_coils=2) as raw:
+            raw.append(*self.index, self.data)
+            raw.append(1, 0, 3, 5, np.ones((2, 32)))
+            raw.append(1, 0, 3, 5, np.full((2, 32), 2))
+            
+        with RawDataFile(self.filename) as raw:
+            full = raw.read()
+            np.testing.assert_array_equal(raw.read(encoding=2), full[2])
+            np.testing.assert_array_equal(raw.read(phase=1), full[:, 1])
+            np.testing.assert_array_equal(raw.read(encoding=1, phase=0)[3, 5], np.full((2, 32), 2))
+            self.assertGreaterEqual(raw.sampled(encoding=1, phase=0)[3, 5], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Unit tests for the protocol report generator."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from pypulseq.make_trap_pulse import make_trapezoid
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from models.velocity_encoding import HADAMARD_SIGNS
+from controllers.sequence_builder import SequenceBuilder
+from controllers.report_controller import effective_venc, flow_moments, generate_reports
+from utils.pulseq_utils import trapezoid_moments
+
+class TestReportController(unittest.TestCase):
+    """Test protocol report functions."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.system = SystemConfig().get_opts()
+        self.params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2)
+        
+    def test_trapezoid_moments(self):
+        """Test trapezoid moments against numerical integration."""
+        grad = make_trapezoid(channel='x', system=self.system, amplitude=1e5,
+                              rise_time=1e-4, flat_time=5e-4, delay=2e-4)
+        t = np.linspace(0, 2e-3, 200001)
+        g = np.interp(t, 1e-3 + grad.delay + np.cumsum([0, grad.rise_time, grad.flat_time, grad.fall_time]),
+                      [0, grad.amplitude, grad.amplitude, 0])
+        
+        m0, m1 = trapezoid_moments(grad, t_start=1e-3)
+        
+        self.assertAlmostEqual(m0, np.trapz(g, t), delta=1e-3 * abs(m0))
+        self.assertAlmostEqual(m1, np.trapz(g * t, t), delta=1e-3 * abs(m1))
+        
+    def test_flow_moments(self):
+        """Test the moments at the echo and the effective VENC."""
+        # The default TE is too short for a TE delay; the longer TR and TE
+        # add one
+        for params in (self.params, self.params.replace(tr=20e-3, te=6e-3)):
+            with self.subTest(tr=params.tr, te=params.te):
+                builder = SequenceBuilder(params, self.system)
+                moments = flow_moments(builder)
+                venc = effective_venc(moments)
+                
+                # The k-space centre line is refocused at the echo
+                for axes in moments.values():
+                    for m0, _ in axes.values():
+                        self.assertAlmostEqual(m0, 0, places=6)
+                
+                # Each encoding reaches the VENC on its own axis only
+                for axis in 'xyz':
+                    for other in 'xyz':
+                        expected = params.venc if other == axis else np.inf
+                        self.assertAlmostEqual(venc[f'{axis}_encoding'][other], expected)
+        
+    def test_hadamard_flow_moments(self):
+        """Test the effective VENC of Hadamard encodings against the first one."""
+        builder = SequenceBuilder(self.params.replace(encoding_scheme='hadamard'), self.system)
+        venc = effective_venc(flow_moments(builder))
+        
+        # Axes whose sign differs from hadamard_1 are encoded at the VENC
+        for i, signs in enumerate(HADAMARD_SIGNS):
+            for axis, sign, first in zip('xyz', signs, HADAMARD_SIGNS[0]):
+                expected = self.params.venc if sign != first else np.inf
+                self.assertAlmostEqual(venc[f'hadamard_{i + 1}'][axis], expected)
+        
+    def test_generate_reports(self):
+        """Test that every protocol variant gets a self-contained report."""
+        params_list = [self.params, self.params.replace(venc=1.0)]
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reports = generate_reports(params_list, self.system, os.path.join(tmp_dir, 'reports'),
+                                       n_workers=1, dpi=50, cache_dir=os.path.join(tmp_dir, 'cache'))
+            
+            self.assertEqual(len(reports), 2)
+            for report in reports:
+                with open(report) as f:
+                    text = f.read()
+                self.assertEqual(text.count('data:image/png;base64,'), 4)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'reports', 'index.html')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Unit tests for the asyncio scanner emulator."""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from controllers.kspace_assembler import KSpaceAssembler
+from controllers.scanner_emulator import ScanSource, ScannerClient, ScannerEmulator, simulate_scan
+from controllers.sequence_builder import SequenceBuilder
+from models.sequence_params import SequenceParams
+
+class TestScannerEmulator(unittest.TestCase):
+    """Test streaming emulated readouts."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Build a small protocol once."""
+        params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2, navigator_interval=5)
+        cls.builder = SequenceBuilder(params, SystemConfig().get_opts())
+        cls.source = ScanSource(cls.builder, seed=0)
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        """Clean up test environment."""
+        self.tmp_dir.cleanup()
+    
+    def test_stream_assembles_phantom_kspace(self):
+        """Test that streamed readouts assemble to the phantom k-space."""
+        assembler = KSpaceAssembler.for_builder(os.path.join(self.tmp_dir.name, 'kspace.npy'), self.builder)
+        stats = asyncio.run(simulate_scan(self.source, assembler, speed=float('inf'), batch_size=16))
+        
+        readouts = self.source.readouts
+        self.assertTrue(assembler.complete)
+        self.assertEqual(stats['n_readouts'], len(readouts['navigator']))
+        self.assertEqual(stats['n_navigators'], int(readouts['navigator'].sum()))
+        
+        for phase in range(self.builder.params.n_cardiac_phases):
+            expected = self.source._phase_kspace(phase)
+            sampled = self.builder.sampling_mask.T.astype(bool)
+            np.testing.assert_array_equal(assembler.kspace[:, phase][:, sampled], expected[:, sampled])
+        
+        # Navigator displacements relative to the first navigator
+        truth = self.source.displacement - self.source.displacement[0]
+        np.testing.assert_allclose(stats['displacement'], truth, atol=0.05)
+    
+    def test_unix_socket_and_pacing(self):
+        """Test streaming over a Unix socket at accelerated real time."""
+        path = os.path.join(self.tmp_dir.name, 'scanner.sock')
+        speed = 5.0
+        
+        async def receive():
+            emulator = ScannerEmulator(self.source, speed)
+            await emulator.start(path=path)
+            client = ScannerClient()
+            await client.connect(path)
+            received = [(header['index'], header['scan_time'], header['acquired'])
+                        async for header, _ in client.readouts()]
+            await client.close()
+            await emulator.close()
+            return received
+        
+        index, scan_time, acquired = np.array(asyncio.run(receive())).T
+        np.testing.assert_array_equal(index, np.arange(len(self.source)))
+        np.testing.assert_array_equal(scan_time, self.source.times)
+        
+        # Readouts leave at their ADC time divided by the speed
+        lag = (acquired - acquired[0]) - (scan_time - scan_time[0]) / speed
+        self.assertLess(np.ptp(lag), 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""Unit tests for the sequence builder."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from pypulseq.Sequence.sequence import Sequence
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from controllers.sequence_builder import SequenceBuilder
+from utils.pulseq_utils import adc_labels, pypulseq_internals_supported
+
+class TestSequenceBuilder(unittest.TestCase):
+    """Test sequence builder functions."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.system = SystemConfig().get_opts()
+        self.params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2)
+        
+    def test_plan_matches_build(self):
+        """Test that the dry-run plan matches the built sequence."""
+        builder = SequenceBuilder(self.params, self.system)
+        plan = builder.plan()
+        
+        seq = builder.build_sequence()
+        duration, n_blocks, _ = seq.duration()
+        
+        self.assertEqual(plan['n_blocks'], n_blocks)
+        self.assertAlmostEqual(plan['duration'], duration, places=6)
+        self.assertEqual(len(builder.seq.dict_block_events), plan['n_blocks'])
+        
+    def test_plan_does_not_build(self):
+        """Test that planning leaves the sequence empty."""
+        builder = SequenceBuilder(self.params, self.system)
+        plan = builder.plan()
+        
+        self.assertEqual(len(builder.seq.dict_block_events), 0)
+        self.assertEqual(plan['n_trs'], 
+                         int(builder.sampling_mask.sum()) * 2 * len(builder.flow_encodings))
+        
+    def test_plan_flags_timing(self):
+        """Test that the plan flags a TR and TE the protocol cannot reach."""
+        plan = SequenceBuilder(self.params, self.system).plan()
+        
+        self.assertGreater(plan['tr_durations']['x_encoding'], self.params.tr)
+        self.assertTrue(any("TR of 'x_encoding'" in warning for warning in plan['warnings']))
+        self.assertTrue(any("TE of 'reference'" in warning for warning in plan['warnings']))
+        
+        self.params = self.params.replace(tr=20e-3, te=6e-3)
+        plan = SequenceBuilder(self.params, self.system).plan()
+        
+        self.assertEqual(plan['warnings'], [])
+        for name in plan['tr_durations']:
+            self.assertAlmostEqual(plan['tr_durations'][name], 20e-3, places=9)
+            self.assertAlmostEqual(plan['echo_times'][name], 6e-3, places=9)
+        
+    def test_seq_file_size_estimate(self):
+        """Test the estimated file size against an exported sequence."""
+        builder = SequenceBuilder(self.params, self.system)
+        plan = builder.plan()
+        seq = builder.build_sequence()
+        
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.seq')
+            seq.write(filename)
+            size = os.path.getsize(filename)
+        
+        self.assertLess(abs(plan['seq_file_size'] - size), 0.1 * size)
+
+    def test_hadamard_bipolars_in_one_block(self):
+        """Test that Hadamard encoding plays the bipolars of all axes together."""
+        simple = SequenceBuilder(self.params, self.system)
+        hadamard = SequenceBuilder(self.params.replace(encoding_scheme='hadamard'), self.system)
+        
+        for blocks in hadamard.tr_layout():
+            bipolars = [events for role, events, _ in blocks if role.startswith('bipolar')]
+            self.assertEqual(len(bipolars), 2)
+            self.assertEqual(sorted(event.channel for event in bipolars[0]), ['x', 'y', 'z'])
+            
+        # Encoded TRs are no longer than a single-axis encoded TR: each
+        # Hadamard encoding needs only half the first moment
+        tr_durations = set(hadamard.plan()['tr_durations'].values())
+        self.assertEqual(len(tr_durations), 1)
+        self.assertLessEqual(tr_durations.pop(), simple.plan()['tr_durations']['x_encoding'])
+        
+    @unittest.skipUnless(pypulseq_internals_supported(), "cached block rows need the pinned pypulseq")
+    def test_block_rows_match_add_block(self):
+        """Test that cached block rows give the same sequence as add_block."""
+        params = self.params.replace(vencs=[0.5])
+        cached = SequenceBuilder(params, self.system).build_sequence()
+        
+        builder = SequenceBuilder(params, self.system)
+        builder._add_block = lambda events: builder.seq.add_block(*events)
+        reference = builder.build_sequence()
+        
+        self.assertEqual(len(cached.dict_block_events), len(reference.dict_block_events))
+        for index, row in reference.dict_block_events.items():
+            self.assertEqual(list(cached.dict_block_events[index]), list(row))
+        self.assertEqual(cached.arr_block_durations, reference.arr_block_durations)
+        self.assertEqual(cached.grad_library.data.keys(), reference.grad_library.data.keys())
+        for key, data in reference.grad_library.data.items():
+            self.assertTrue(np.array_equal(cached.grad_library.data[key], data))
+        
+    def test_periodic_navigators(self):
+        """Test that navigators are interleaved every navigator_interval lines."""
+        params = self.params.replace(navigator_interval=10)
+        builder = SequenceBuilder(params, self.system)
+        plan = builder.plan()
+        seq = builder.build_sequence()
+        
+        n_lines = len(builder.recar.get_sampling_order())
+        nav_rf = seq.dict_block_events[1][1]
+        nav_starts = [index for index, row in seq.dict_block_events.items() if row[1] == nav_rf]
+        self.assertEqual(len(nav_starts), -(-n_lines // 10))
+        self.assertEqual(np.diff(nav_starts).tolist(),
+                         [2 + 10 * sum(len(blocks) for blocks in builder.tr_layout())] * (len(nav_starts) - 1))
+        self.assertEqual(plan['n_blocks'], len(seq.dict_block_events))
+        self.assertAlmostEqual(plan['duration'], seq.duration()[0], places=6)
+        
+    def test_adc_labels(self):
+        """Test that the exported ADC labels give the k-space position of every readout."""
+        params = self.params.replace(navigator_interval=4)
+        # Other pypulseq releases label the blocks through add_block
+        for pinned in (True, False):
+            with self.subTest(pinned=pinned), \
+                    mock.patch('controllers.sequence_builder.pypulseq_internals_supported', return_value=pinned):
+                builder = SequenceBuilder(params, self.system)
+                readouts = builder.readout_order()
+                seq = builder.build_sequence()
+                
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    filename = os.path.join(tmp_dir, 'labels.seq')
+                    seq.write(filename)
+                    exported = Sequence(self.system)
+                    exported.read(filename)
+                labels = adc_labels(exported)
+                
+                image = ~readouts['navigator']
+                np.testing.assert_array_equal(labels['NAV'], readouts['navigator'])
+                for name, key in (('LIN', 'ky'), ('PAR', 'kz'), ('PHS', 'cardiac_phase'), ('SET', 'encoding')):
+                    np.testing.assert_array_equal(labels[name][image], readouts[key][image])
+        
+if __name__ == '__main__':
+    unittest.main()
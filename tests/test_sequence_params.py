@@ -0,0 +1,67 @@
+"""Unit tests for sequence parameters."""
+
+import pickle
+import unittest
+
+from models.sequence_params import SequenceParams
+
+class TestSequenceParams(unittest.TestCase):
+    """Test sequence parameters."""
+    
+    def test_immutable(self):
+        """Test that parameters cannot be modified in place."""
+        params = SequenceParams()
+        with self.assertRaises(AttributeError):
+            params.venc = 1.0
+        with self.assertRaises(AttributeError):
+            SequenceParams(unknown=1)
+            
+    def test_replace_updates_derived(self):
+        """Test that derived quantities follow replaced parameters."""
+        params = SequenceParams()
+        self.assertAlmostEqual(params.resolution[0], 280e-3 / 192)
+        
+        params2 = params.replace(fov=[200e-3, 200e-3, 100e-3], matrix_size=[100, 100, 50])
+        self.assertAlmostEqual(params2.resolution[0], 2e-3)
+        self.assertAlmostEqual(params2.k_width[2], 500)
+        self.assertAlmostEqual(params.resolution[0], 280e-3 / 192)
+        
+    def test_hash(self):
+        """Test equality, hashing and the content hash."""
+        params = SequenceParams(matrix_size=[192, 128, 32])
+        same = SequenceParams(matrix_size=(192.0, 128, 32))
+        other = params.replace(venc=1.0)
+        
+        self.assertEqual(params, same)
+        self.assertEqual(hash(params), hash(same))
+        self.assertEqual(params.content_hash, same.content_hash)
+        self.assertNotEqual(params.content_hash, other.content_hash)
+        self.assertEqual(len({params, same, other}), 2)
+        
+    def test_pickle(self):
+        """Test that parameters survive pickling."""
+        params = SequenceParams(venc=1.0)
+        restored = pickle.loads(pickle.dumps(params))
+        self.assertEqual(restored, params)
+        self.assertEqual(restored.content_hash, params.content_hash)
+        
+    def test_validation(self):
+        """Test that invalid parameters are coerced or rejected."""
+        params = SequenceParams(matrix_size=(192.0, 128, 32))
+        self.assertEqual(params.matrix_size, (192, 128, 32))
+        self.assertIsInstance(params.matrix_size[0], int)
+        
+        with self.assertRaises(ValueError):
+            SequenceParams(matrix_size=(192.5, 128, 32))
+        with self.assertRaises(ValueError):
+            SequenceParams(matrix_size=(192, 128))
+        with self.assertRaises(ValueError):
+            SequenceParams(matrix_size=(192, 0, 32))
+        for key in ('venc', 'tr', 'te'):
+            with self.assertRaises(ValueError):
+                params.replace(**{key: -1})
+        with self.assertRaises(ValueError):
+            params.replace(vencs=[0.5, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Unit tests for the sequence plot."""
+
+import os
+import tempfile
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from controllers.sequence_builder import SequenceBuilder
+from views.sequence_plot import GAMMA, plot_sequence, sequence_envelopes
+
+class TestSequencePlot(unittest.TestCase):
+    """Test sequence plot functions."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Build a small sequence once."""
+        params = SequenceParams(matrix_size=[32, 16, 8], n_cardiac_phases=2)
+        cls.builder = SequenceBuilder(params, SystemConfig().get_opts())
+        cls.seq = cls.builder.build_sequence()
+        
+    def test_envelope_peaks(self):
+        """Test that the envelopes keep the waveform peaks."""
+        envelopes = sequence_envelopes(self.seq, n_pixels=500)
+        
+        self.assertEqual(len(envelopes['edges']), 501)
+        self.assertAlmostEqual(envelopes['edges'][-1], self.seq.duration()[0])
+        
+        peak = max(abs(data[0]) for data in self.seq.grad_library.data.values())
+        envelope_peak = max(np.abs(envelopes[channel]).max() for channel in ('Gx', 'Gy', 'Gz'))
+        self.assertAlmostEqual(envelope_peak, peak / GAMMA * 1e3)
+        lo, hi = envelopes['ADC']
+        self.assertEqual(hi.max(), 1)
+        self.assertEqual(lo.min(), 0)
+        
+    def test_time_range(self):
+        """Test that a window outside the ADC events has an empty ADC envelope."""
+        rf = self.builder.templates['rf']
+        envelopes = sequence_envelopes(self.seq, time_range=(0, rf.delay / 2), n_pixels=100)
+        
+        self.assertTrue(np.all(envelopes['ADC'][1] == 0))
+        self.assertTrue(np.all(envelopes['RF'][1] == 0))
+        
+    def test_plot_sequence(self):
+        """Test that the sequence diagram is written to a file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'sequence.png')
+            plot_sequence(self.seq, filename, time_range=(0, 0.02))
+            self.assertTrue(os.path.exists(filename))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Unit tests for the parameter sweep controller."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from config.system_config import SystemConfig
+from models.sequence_params import SequenceParams
+from controllers.sweep_controller import expand_grid, run_parameter_sweep, save_sweep_csv
+
+class TestSweepController(unittest.TestCase):
+    """Test parameter sweep functions."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.system = SystemConfig().get_opts()
+        self.params = SequenceParams()
+        self.grid = {
+            'venc': [1.0, 1.5],
+            'matrix_size': [[32, 16, 8], [48, 24, 8]],
+            'n_cardiac_phases': [2, 4],
+        }
+        
+    def test_expand_grid(self):
+        """Test expansion of a parameter grid."""
+        points = expand_grid(self.grid)
+        self.assertEqual(len(points), 8)
+        self.assertEqual(points[1], {'venc': 1.0, 'matrix_size': [32, 16, 8], 'n_cardiac_phases': 4})
+        
+    def test_run_parameter_sweep(self):
+        """Test a serial sweep and its CSV export."""
+        results = run_parameter_sweep(self.grid, self.params, self.system, n_workers=1)
+        
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results['matrix_size'].shape, (8, 3))
+        # Doubling the cardiac phases doubles the number of TRs
+        self.assertEqual(results['n_trs'][1], 2 * results['n_trs'][0])
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'sweep.csv')
+            save_sweep_csv(results, filename)
+            with open(filename) as f:
+                lines = f.read().splitlines()
+        
+        self.assertEqual(len(lines), 9)
+        self.assertTrue(lines[0].startswith('venc,matrix_size_0,matrix_size_1,matrix_size_2'))
+        
+    def test_parallel_sweep_matches_serial(self):
+        """Test that a process-pool sweep returns the serial results in order."""
+        serial = run_parameter_sweep(self.grid, self.params, self.system, n_workers=1)
+        parallel = run_parameter_sweep(self.grid, self.params, self.system, n_workers=2, chunksize=1)
+        
+        self.assertEqual(parallel.dtype, serial.dtype)
+        for name in serial.dtype.names:
+            if name == 'build_time':
+                continue
+            np.testing.assert_array_equal(parallel[name], serial[name], err_msg=name)
+
+if __name__ == '__main__':
+    unittest.main()
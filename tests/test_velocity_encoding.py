@@ -6,6 +6,14 @@ from pypulseq.opts import Opts
 
 from models.velocity_encoding import calculate_venc_moment, make_bipolar_gradient
 from models.velocity_encoding import create_flow_encoding_gradients, create_hadamard_encoding
+from models.velocity_encoding import create_encoding_scheme, compile_encodings
+from utils.pulseq_utils import trapezoid_moments
+
+def first_moment(pair):
+    """First moment of two lobes played back to back"""
+    first, second = pair
+    duration = first.delay + first.rise_time + first.flat_time + first.fall_time
+    return trapezoid_moments(first)[1] + trapezoid_moments(second, duration)[1]
 
 class TestVelocityEncoding(unittest.TestCase):
     """Test velocity encoding functions."""
@@ -21,7 +29,7 @@ class TestVelocityEncoding(unittest.TestCase):
     def test_calculate_venc_moment(self):
         """Test calculation of first moment for velocity encoding."""
         m1 = calculate_venc_moment(self.venc)
-        self.assertGreater(m1, 0)
+        self.assertAlmostEqual(m1, 1 / (2 * self.venc))
         
     def test_make_bipolar_gradient(self):
         """Test creation of bipolar gradient."""
@@ -30,6 +38,13 @@ class TestVelocityEncoding(unittest.TestCase):
         # Check that gradients have opposite areas
         self.assertAlmostEqual(bipolar_pos.area, -bipolar_neg.area)
         
+        # The pair has the first moment of its VENC, also when the lobes
+        # must be lengthened to fit the gradient limits
+        for venc in (self.venc, 0.5, 0.1):
+            pair = make_bipolar_gradient('x', venc, self.system)
+            self.assertAlmostEqual(abs(first_moment(pair)), calculate_venc_moment(venc))
+            self.assertLessEqual(abs(pair[0].amplitude), self.system.max_grad)
+        
     def test_create_flow_encoding_gradients(self):
         """Test creation of flow encoding gradients."""
         flow_directions = [True, True, True]
@@ -48,6 +63,63 @@ class TestVelocityEncoding(unittest.TestCase):
         
         # Should have 4 encoding schemes
         self.assertEqual(len(encoding_schemes), 4)
+        
+        # Every encoding encodes all axes, each axis twice with each sign
+        signs = np.array([[scheme['signs'][axis] for axis in 'xyz'] for scheme in encoding_schemes])
+        np.testing.assert_array_equal(signs.sum(axis=0), 0)
+        for scheme in encoding_schemes:
+            self.assertEqual(sorted(scheme['gradients']), ['x', 'y', 'z'])
+            
+        # Lobes are swapped for a negative sign
+        first_lobe = encoding_schemes[0]['gradients']['x'][0]
+        self.assertLess(first_lobe.area, 0)
+        
+        # Every pair of encodings differs by the VENC moment where the signs differ
+        for i, first in enumerate(encoding_schemes):
+            for second in encoding_schemes[i + 1:]:
+                for axis in 'xyz':
+                    delta_m1 = abs(first_moment(first['gradients'][axis]) - first_moment(second['gradients'][axis]))
+                    if first['signs'][axis] != second['signs'][axis]:
+                        self.assertAlmostEqual(1 / (2 * delta_m1), self.venc)
+                    else:
+                        self.assertAlmostEqual(delta_m1, 0)
+        
+        with self.assertRaises(ValueError):
+            create_hadamard_encoding(self.venc, self.system, [True, True, False])
+            
+    def test_create_encoding_scheme(self):
+        """Test selection of the encoding scheme by name."""
+        flow_directions = [True, True, True]
+        encoding_schemes = create_encoding_scheme('hadamard', self.venc, self.system, flow_directions)
+        self.assertEqual(encoding_schemes[0]['name'], 'hadamard_1')
+        
+        with self.assertRaises(ValueError):
+            create_encoding_scheme('unknown', self.venc, self.system, flow_directions)
 
+    def test_compile_encodings(self):
+        """Test that multi-VENC simple encodings share one reference."""
+        flow_directions = [True, True, True]
+        single = compile_encodings('simple', self.venc, self.system, flow_directions)
+        self.assertEqual([e['name'] for e in single],
+                         [e['name'] for e in create_flow_encoding_gradients(self.venc, self.system, flow_directions)])
+        
+        encodings = compile_encodings('simple', [1.5, 0.5], self.system, flow_directions)
+        self.assertEqual(len(encodings), 1 + 2 * 3)
+        self.assertEqual([e['venc'] for e in encodings], [None, 1.5, 1.5, 1.5, 0.5, 0.5, 0.5])
+        self.assertEqual(encodings[4]['name'], 'x_encoding_venc2')
+        
+        # Every encoding reaches its VENC against the reference
+        for encoding in encodings[1:]:
+            for pair in encoding['gradients'].values():
+                self.assertAlmostEqual(1 / (2 * abs(first_moment(pair))), encoding['venc'])
+        
+        encodings = compile_encodings('hadamard', [1.5, 0.5], self.system, flow_directions)
+        self.assertEqual(len(encodings), 2 * 4)
+        
+        # Opposite Hadamard signs differ by the first moment of the VENC
+        for first, second in ((encodings[0], encodings[1]), (encodings[4], encodings[5])):
+            delta_m1 = first_moment(first['gradients']['x']) - first_moment(second['gradients']['x'])
+            self.assertAlmostEqual(1 / (2 * abs(delta_m1)), first['venc'])
+        
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
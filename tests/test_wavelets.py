@@ -0,0 +1,62 @@
+"""Unit tests for the lifting wavelet library."""
+
+import unittest
+
+import numpy as np
+
+from models.wavelets import LiftingWavelet, benchmark, convolution_dwt, wavelet_schedule
+
+class TestWavelets(unittest.TestCase):
+    """Test lifting wavelet transforms."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        rng = np.random.default_rng(0)
+        shape = (4, 8, 12, 6)
+        self.x = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+    
+    def test_matches_convolution(self):
+        """Test that lifting gives the filter bank coefficients."""
+        for name in ('haar', 'db4'):
+            for axes in ((0, 1, 2, 3), (-1,), (1, 3)):
+                coefficients = LiftingWavelet(name, axes).forward(self.x.copy())
+                reference = convolution_dwt(self.x, name, axes)
+                np.testing.assert_allclose(coefficients, reference, atol=1e-5)
+    
+    def test_perfect_reconstruction(self):
+        """Test that the transform is orthonormal and invertible in place."""
+        for name in ('haar', 'db4'):
+            wavelet = LiftingWavelet(name, axes=(0, 1, 2, 3), levels=2)
+            work = self.x.copy()
+            coefficients = wavelet.forward(work)
+            self.assertIs(coefficients, work)
+            self.assertEqual(coefficients.dtype, np.complex64)
+            self.assertAlmostEqual(np.linalg.norm(coefficients), np.linalg.norm(self.x), places=3)
+            np.testing.assert_allclose(wavelet.inverse(work), self.x, atol=1e-5)
+    
+    def test_scratch_buffers_reused(self):
+        """Test that repeated transforms do not reallocate scratch buffers."""
+        wavelet = LiftingWavelet('db4')
+        wavelet.forward(self.x.copy())
+        buffer, temp = wavelet._buffer, wavelet._temp
+        wavelet.inverse(wavelet.forward(self.x.copy()))
+        self.assertIs(wavelet._buffer, buffer)
+        self.assertIs(wavelet._temp, temp)
+    
+    def test_schedule(self):
+        """Test that levels stop at odd or short axes."""
+        schedule = wavelet_schedule((20, 8), (0, 1), min_length=4)
+        self.assertEqual(schedule, [((20, 8), (0, 1)), ((10, 4), (0, 1))])
+        self.assertEqual(len(wavelet_schedule((16, 16), (0, 1), levels=1)), 1)
+        with self.assertRaises(ValueError):
+            LiftingWavelet('db8')
+    
+    def test_benchmark(self):
+        """Test the benchmark report."""
+        result = benchmark((4, 8, 8, 4), 'db4', repeats=1)
+        self.assertLess(result['max_error'], 1e-5)
+        self.assertLess(result['reconstruction_error'], 1e-5)
+        self.assertGreater(result['lifting'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
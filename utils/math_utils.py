@@ -95,4 +95,61 @@ def generate_golden_angle_sequence(n):
     golden_angle = np.pi * (3 - np.sqrt(5))
     angles = np.array([(i * golden_angle) % (2 * np.pi) for i in range(n)])
     
-    return angles
\ No newline at end of file
+    return angles
+
+def randomized_svd(matrix, rank, n_oversamples=10, n_iter=2, seed=None, start=None):
+    """
+    Truncated SVD by randomized range finding.
+    
+    The range of the matrix is sampled with rank + n_oversamples random
+    vectors, refined by power iterations, and the SVD is taken of the
+    small projected matrix. Stacks of matrices are decomposed together.
+    
+    When a sequence of similar matrices is decomposed (e.g. in an
+    iterative reconstruction), the right singular vectors of the previous
+    one are a good start: pass them as start, together with n_iter=0 or 1.
+    
+    Parameters:
+    -----------
+    matrix : ndarray
+        Matrix (m x n) or stack of matrices (..., m, n)
+    rank : int
+        Number of singular values to keep
+    n_oversamples : int
+        Extra random vectors improving the accuracy
+    n_iter : int
+        Power iterations, needed when the singular values decay slowly
+    seed : int, optional
+        Random seed
+    start : ndarray, optional
+        Initial subspace (..., n, p), e.g. vh.conj().swapaxes(-1, -2) of
+        the previous matrix; n_oversamples random vectors are added to it
+        
+    Returns:
+    --------
+    u : ndarray
+        Left singular vectors (..., m, rank)
+    s : ndarray
+        Singular values (..., rank), decreasing
+    vh : ndarray
+        Conjugated right singular vectors (..., rank, n)
+    """
+    rng = np.random.default_rng(seed)
+    m, n = matrix.shape[-2:]
+    n_start = 0 if start is None else start.shape[-1]
+    k = min(max(rank, n_start) + n_oversamples, m, n)
+    test = rng.standard_normal(matrix.shape[:-2] + (n, k - min(n_start, k)))
+    if np.iscomplexobj(matrix):
+        test = test + 1j * rng.standard_normal(test.shape)
+    if start is not None:
+        start = np.broadcast_to(start, matrix.shape[:-2] + start.shape[-2:])[..., :k]
+        test = np.concatenate([start, test], axis=-1)
+    
+    adjoint = np.conj(np.swapaxes(matrix, -1, -2))
+    q, _ = np.linalg.qr(matrix @ test.astype(matrix.dtype))
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(adjoint @ q)
+        q, _ = np.linalg.qr(matrix @ q)
+    
+    u, s, vh = np.linalg.svd(np.conj(np.swapaxes(q, -1, -2)) @ matrix, full_matrices=False)
+    return (q @ u)[..., :rank], s[..., :rank], vh[..., :rank, :]
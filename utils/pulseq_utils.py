@@ -19,6 +19,9 @@
 #     ok, error_report = seq.check_timing()
 #     return ok, error_report 
 
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+
 import numpy as np
 from pypulseq.Sequence.sequence import Sequence
 from pypulseq.calc_duration import calc_duration
@@ -120,4 +123,378 @@ def calculate_block_duration(events, system):
     block_duration_raster = system.block_duration_raster
     duration_in_raster = np.ceil(max_duration / block_duration_raster)
     
-    return duration_in_raster * block_duration_raster
\ No newline at end of file
+    return duration_in_raster * block_duration_raster
+
+# pypulseq release whose private block table and event libraries
+# (dict_block_events, arr_block_durations, ...) the fast paths below write
+# to directly. requirements.txt pins it; other releases lay these out
+# differently, so callers fall back to Sequence.add_block.
+PYPULSEQ_INTERNALS_VERSION = '1.3.1'
+
+@lru_cache(maxsize=1)
+def pypulseq_internals_supported():
+    """
+    Check that the installed pypulseq matches PYPULSEQ_INTERNALS_VERSION.
+    
+    Returns:
+    --------
+    supported : bool
+        True if the private sequence state may be written directly
+    """
+    try:
+        installed = version('pypulseq')
+    except PackageNotFoundError:
+        return False
+    return installed == PYPULSEQ_INTERNALS_VERSION or installed.startswith(PYPULSEQ_INTERNALS_VERSION + '.post')
+
+def register_block_events(seq, *events):
+    """
+    Register events in the sequence libraries without adding a block.
+    
+    The events are added as a temporary block at the end of the sequence,
+    which is removed again, leaving only the library entries. Only valid
+    if pypulseq_internals_supported().
+    
+    Parameters:
+    -----------
+    seq : Sequence
+        Sequence object
+    events : SimpleNamespace
+        Events of one block
+        
+    Returns:
+    --------
+    event_ids : ndarray
+        Library IDs of the block events, in block table order
+    """
+    from pypulseq.Sequence import block
+    
+    probe_index = len(seq.dict_block_events) + 1
+    block.add_block(seq, probe_index, *events)
+    event_ids = seq.dict_block_events.pop(probe_index)
+    seq.arr_block_durations.pop()
+    
+    return event_ids
+
+def event_signature(event):
+    """
+    Return a hashable description of an event that determines its library entries.
+    
+    RF pulses and arbitrary gradients are identified by their waveform
+    object, so copies of one template share a signature.
+    
+    Parameters:
+    -----------
+    event : SimpleNamespace
+        Sequence event
+        
+    Returns:
+    --------
+    signature : tuple or None
+        None for events without a known signature
+    """
+    if event.type == 'trap':
+        return ('trap', event.channel, event.amplitude, event.rise_time, event.flat_time,
+                event.fall_time, event.delay)
+    if event.type == 'rf':
+        return ('rf', id(event.signal), event.delay, event.freq_offset, event.phase_offset)
+    if event.type == 'grad':
+        return ('grad', event.channel, id(event.waveform), event.delay)
+    if event.type == 'adc':
+        return ('adc', event.num_samples, event.dwell, event.delay, event.freq_offset, event.phase_offset)
+    if event.type == 'delay':
+        return ('delay', event.delay)
+    if event.type in ('labelset', 'labelinc'):
+        return (event.type, event.label, event.value)
+    return None
+
+def register_label_extensions(seq, labels, cache):
+    """
+    Register label events as the extension chain of a block.
+    
+    Creates the same library entries and returns the same chain head as
+    pypulseq's add_block, but looks the chain nodes up in a dict. Every
+    miss in EventLibrary.find scans all keys for a new ID, which makes
+    labelling every readout quadratic in the number of readouts. Only
+    valid if pypulseq_internals_supported().
+    
+    Parameters:
+    -----------
+    seq : Sequence
+        Sequence object
+    labels : list
+        Label events (labelset or labelinc) of one block
+    cache : dict
+        Lookup tables of this sequence, shared between calls; pass an empty
+        dict for a new sequence
+        
+    Returns:
+    --------
+    extension_id : int
+        ID of the head of the extension chain, 0 without labels
+    """
+    from pypulseq.supported_labels import get_supported_labels
+    
+    if not labels:
+        return 0
+    if not cache:
+        cache['nodes'] = {tuple(data.tolist()): key for key, data in seq.extensions_library.data.items()}
+        cache['next'] = max(seq.extensions_library.keys, default=0) + 1
+        cache['refs'] = {}
+    
+    extensions = []
+    for label in labels:
+        key = (label.type, label.label, label.value)
+        ref = cache['refs'].get(key)
+        if ref is None:
+            library = seq.label_set_library if label.type == 'labelset' else seq.label_inc_library
+            data = [label.value, get_supported_labels().index(label.label) + 1]
+            ref, found = library.find(data)
+            if not found:
+                library.insert(ref, data)
+            cache['refs'][key] = ref
+        extensions.append((seq.get_extension_type_ID(label.type.upper()), ref))
+    
+    # Chain sorted by reference, the first node ends the chain
+    extension_id = 0
+    for ext_type, ref in sorted(extensions, key=lambda extension: extension[1]):
+        node = (ext_type, ref, extension_id)
+        extension_id = cache['nodes'].get(node)
+        if extension_id is None:
+            extension_id = cache['next']
+            cache['next'] += 1
+            seq.extensions_library.insert(extension_id, list(node))
+            cache['nodes'][node] = extension_id
+    return extension_id
+
+def adc_labels(seq, names=('LIN', 'PAR', 'PHS', 'SET', 'NAV')):
+    """
+    Read the label values in effect at every ADC event.
+    
+    Parameters:
+    -----------
+    seq : Sequence
+        Sequence object
+    names : tuple of str
+        Labels to read
+        
+    Returns:
+    --------
+    labels : dict
+        Array of the value of every label at every ADC, in acquisition order
+    """
+    from pypulseq.supported_labels import get_supported_labels
+    
+    supported = get_supported_labels()
+    state = dict.fromkeys(names, 0)
+    values = {name: [] for name in names}
+    for index in range(1, len(seq.dict_block_events) + 1):
+        row = seq.dict_block_events[index]
+        extension_id = row[6]
+        while extension_id:
+            ext_type, ref, extension_id = seq.extensions_library.data[extension_id].tolist()
+            ext_string = seq.get_extension_type_string(ext_type)
+            if ext_string in ('LABELSET', 'LABELINC'):
+                library = seq.label_set_library if ext_string == 'LABELSET' else seq.label_inc_library
+                value, label_id = library.data[ref].tolist()
+                name = supported[int(label_id) - 1]
+                if name in state:
+                    state[name] = value if ext_string == 'LABELSET' else state[name] + value
+        if row[5]:
+            for name in names:
+                values[name].append(state[name])
+    return {name: np.asarray(value, dtype=int) for name, value in values.items()}
+
+# Approximate sizes used by the dry-run planner. The .seq block table
+# writes one fixed-width line per block (id plus seven event ids), the
+# header, definitions and RF/gradient shape libraries are roughly constant,
+# and each trapezoid library entry is one line. Labelled ADCs add about two
+# extension lines each, as label chains share their tails.
+SEQ_HEADER_BYTES = 10000
+SEQ_BLOCK_LINE_BYTES = 25
+SEQ_GRADIENT_LINE_BYTES = 50
+SEQ_LABELLED_ADC_BYTES = 25
+
+# Slack allowed between a planned and a requested TR/TE, in seconds
+TIMING_TOLERANCE = 1e-6
+
+# pypulseq keeps a 7-element event array, a dict entry and a duration per
+# block; the ReCAR order keeps one tuple per acquired line.
+BLOCK_MEMORY_BYTES = 300
+ORDER_ENTRY_BYTES = 80
+
+def estimate_seq_file_size(n_blocks, n_gradients, n_labelled_adcs=0):
+    """
+    Estimate the size of an exported .seq file.
+    
+    Parameters:
+    -----------
+    n_blocks : int
+        Number of sequence blocks
+    n_gradients : int
+        Number of distinct gradient events
+    n_labelled_adcs : int, optional
+        Number of ADC blocks that carry labels
+        
+    Returns:
+    --------
+    size : int
+        Estimated file size in bytes
+    """
+    id_width = len(str(n_blocks))
+    block_table = n_blocks * (id_width + SEQ_BLOCK_LINE_BYTES)
+    
+    return (SEQ_HEADER_BYTES + block_table + n_gradients * SEQ_GRADIENT_LINE_BYTES
+            + n_labelled_adcs * SEQ_LABELLED_ADC_BYTES)
+
+def estimate_build_memory(n_blocks, n_lines):
+    """
+    Estimate the peak memory needed to build a sequence.
+    
+    Parameters:
+    -----------
+    n_blocks : int
+        Number of sequence blocks
+    n_lines : int
+        Number of entries in the sampling order
+        
+    Returns:
+    --------
+    memory : int
+        Estimated memory in bytes
+    """
+    return n_blocks * BLOCK_MEMORY_BYTES + n_lines * ORDER_ENTRY_BYTES
+
+def echo_time(blocks):
+    """
+    Calculate the echo time of one TR from its blocks.
+    
+    Parameters:
+    -----------
+    blocks : list
+        Event tuples of the TR in playout order, starting with the excitation
+        
+    Returns:
+    --------
+    te : float
+        Time from the start of the TR to the centre of the first ADC in seconds
+    """
+    start = 0
+    for events in blocks:
+        for event in events:
+            if getattr(event, 'type', None) == 'adc':
+                return start + event.delay + event.num_samples * event.dwell / 2
+        start += calc_duration(*events)
+    
+    raise ValueError("TR has no ADC event")
+
+def trapezoid_moments(grad, t_start=0):
+    """
+    Calculate the zeroth and first moment of a trapezoid gradient.
+    
+    Parameters:
+    -----------
+    grad : SimpleNamespace
+        Trapezoid gradient event
+    t_start : float
+        Start time of the block holding the gradient in seconds
+        
+    Returns:
+    --------
+    m0 : float
+        Zeroth moment (area) in Hz/m*s
+    m1 : float
+        First moment about t = 0 in Hz/m*s^2
+    """
+    t0 = t_start + grad.delay
+    rise, flat, fall = grad.rise_time, grad.flat_time, grad.fall_time
+    
+    # Rise ramp, flat top and fall ramp with their centroids
+    areas = np.array([rise / 2, flat, fall / 2]) * grad.amplitude
+    centroids = t0 + np.array([2 * rise / 3, rise + flat / 2, rise + flat + fall / 3])
+    
+    return areas.sum(), (areas * centroids).sum()
+
+def _segment_moments(times, amplitudes, t_start, t_end):
+    """Zeroth and first moment of a piecewise-linear waveform between two times."""
+    t = np.unique(np.clip(np.concatenate([times, [t_start, t_end]]), t_start, t_end))
+    g = np.interp(t, times, amplitudes, left=0, right=0)
+    t0, t1, g0, g1 = t[:-1], t[1:], g[:-1], g[1:]
+    dt = t1 - t0
+    
+    m0 = np.sum((g0 + g1) / 2 * dt)
+    m1 = np.sum(dt * (g0 * (2 * t0 + t1) + g1 * (t0 + 2 * t1)) / 6)
+    return m0, m1
+
+def echo_moments(blocks):
+    """
+    Calculate the gradient moments of one TR at the echo.
+    
+    Every trapezoid is integrated from the centre of the excitation pulse
+    to the centre of the first ADC, so the result includes the slice
+    rephaser, the flow encoding, the phase encodes and the first half of
+    the readout, each at its actual position in the TR.
+    
+    Parameters:
+    -----------
+    blocks : list
+        Event tuples of the TR in playout order, starting with the excitation
+        
+    Returns:
+    --------
+    moments : dict
+        {axis: (m0, m1)} in Hz/m*s and Hz/m*s^2, with times measured from
+        the centre of the RF pulse
+    """
+    from pypulseq.calc_rf_center import calc_rf_center
+    
+    t_rf = None
+    start = 0
+    waveforms = []
+    for events in blocks:
+        for event in events:
+            event_type = getattr(event, 'type', None)
+            if event_type == 'rf' and t_rf is None:
+                t_rf = start + event.delay + calc_rf_center(event)[0]
+            elif event_type == 'trap':
+                times = start + event.delay + np.cumsum([0, event.rise_time, event.flat_time, event.fall_time])
+                waveforms.append((event.channel, times, [0, event.amplitude, event.amplitude, 0]))
+        start += calc_duration(*events)
+    
+    if t_rf is None:
+        raise ValueError("TR has no RF event")
+    t_echo = echo_time(blocks)
+    
+    moments = {axis: np.zeros(2) for axis in 'xyz'}
+    for channel, times, amplitudes in waveforms:
+        moments[channel] += _segment_moments(times - t_rf, amplitudes, 0, t_echo - t_rf)
+    return {axis: (float(m0), float(m1)) for axis, (m0, m1) in moments.items()}
+
+def adc_times(seq):
+    """
+    Calculate the time of the echo centre of every ADC event.
+    
+    Parameters:
+    -----------
+    seq : Sequence
+        Sequence object
+        
+    Returns:
+    --------
+    times : ndarray
+        Time of the centre of every ADC window in seconds from the start of
+        the sequence, in acquisition order
+    """
+    if not seq.dict_block_events:
+        return np.zeros(0)
+    rows = np.array([seq.dict_block_events[index] for index in range(1, len(seq.dict_block_events) + 1)])
+    durations = np.asarray(seq.arr_block_durations, dtype=float)
+    block_starts = np.cumsum(durations) - durations
+    
+    blocks = np.nonzero(rows[:, 5])[0]
+    adc_ids = rows[blocks, 5]
+    # ADC library rows: num_samples, dwell, delay, ...
+    library = {adc_id: seq.adc_library.data[adc_id] for adc_id in np.unique(adc_ids).tolist()}
+    offsets = np.array([library[adc_id][2] + library[adc_id][0] * library[adc_id][1] / 2
+                        for adc_id in adc_ids.tolist()])
+    return block_starts[blocks] + offsets
@@ -25,7 +25,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
-def plot_sampling_pattern(mask, filename=None):
+def plot_sampling_pattern(mask, filename=None, dpi=300):
     """
     Plot the k-space sampling pattern.
     
@@ -35,6 +35,8 @@ def plot_sampling_pattern(mask, filename=None):
         K-space sampling mask
     filename : str, optional
         Filename for saving the plot
+    dpi : int, optional
+        Resolution of the saved figure
         
     Returns:
     --------
@@ -52,7 +54,7 @@ def plot_sampling_pattern(mask, filename=None):
     
     # Save or show the plot
     if filename:
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
+        plt.savefig(filename, dpi=dpi, bbox_inches='tight')
         plt.close()
     else:
         plt.tight_layout()
@@ -60,18 +62,70 @@ def plot_sampling_pattern(mask, filename=None):
         
     return fig
 
-def plot_3d_sampling_pattern(mask, n_cardiac_phases=1, filename=None):
+def _kt_points(mask, n_cardiac_phases=1):
+    """
+    Coordinates of the sampled k-t points.
+    
+    Parameters:
+    -----------
+    mask : ndarray
+        Sampling mask, either 2D (n_phase x n_slice) shared by every
+        cardiac phase or 3D (n_cardiac_phases x n_phase x n_slice) k-t mask
+    n_cardiac_phases : int, optional
+        Number of cardiac phases, used with a 2D mask
+        
+    Returns:
+    --------
+    t, y, x : ndarray
+        Cardiac phase, phase encoding and slice encoding index of every
+        sampled point, ordered by cardiac phase
+    """
+    mask = np.asarray(mask)
+    if mask.ndim == 2:
+        y, x = np.nonzero(mask == 1)
+        t = np.repeat(np.arange(n_cardiac_phases), len(y))
+        return t, np.tile(y, n_cardiac_phases), np.tile(x, n_cardiac_phases)
+    return np.nonzero(mask == 1)
+
+def decimate_points(n_points, max_points):
+    """
+    Select an evenly spaced subset of point indices.
+    
+    Parameters:
+    -----------
+    n_points : int
+        Number of points
+    max_points : int
+        Maximum number of points to keep
+        
+    Returns:
+    --------
+    indices : ndarray
+        Indices of the kept points (all points if n_points <= max_points)
+    """
+    if n_points <= max_points:
+        return np.arange(n_points)
+    return np.linspace(0, n_points - 1, max_points).astype(int)
+
+def plot_3d_sampling_pattern(mask, n_cardiac_phases=1, filename=None, max_points=20000):
     """
     Plot the 3D k-space sampling pattern.
     
+    Points are generated without Python loops. When there are more than
+    max_points sampled points, an evenly spaced subset is drawn so large
+    protocols stay responsive.
+    
     Parameters:
     -----------
     mask : ndarray
-        K-space sampling mask (2D)
+        K-space sampling mask, 2D (shared by every cardiac phase) or 3D
+        (n_cardiac_phases x n_phase x n_slice)
     n_cardiac_phases : int, optional
-        Number of cardiac phases
+        Number of cardiac phases, used with a 2D mask
     filename : str, optional
         Filename for saving the plot
+    max_points : int, optional
+        Maximum number of points to draw
         
     Returns:
     --------
@@ -81,27 +135,24 @@ def plot_3d_sampling_pattern(mask, n_cardiac_phases=1, filename=None):
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
     
-    # Get coordinates of sampled points
-    y_indices, x_indices = np.where(mask == 1)
+    # Get coordinates of sampled points for all cardiac phases
+    mask = np.asarray(mask)
+    t, y, x = _kt_points(mask, n_cardiac_phases)
+    n_total = len(t)
+    keep = decimate_points(n_total, max_points)
+    t, y, x = t[keep], y[keep], x[keep]
     
     # Center coordinates
-    y_indices = y_indices - mask.shape[0] / 2
-    x_indices = x_indices - mask.shape[1] / 2
-    
-    # Create points for all cardiac phases
-    all_points = []
-    for t in range(n_cardiac_phases):
-        for y, x in zip(y_indices, x_indices):
-            all_points.append((x, y, t))
-    
-    # Convert to numpy array
-    all_points = np.array(all_points)
+    y = y - mask.shape[-2] / 2
+    x = x - mask.shape[-1] / 2
     
     # Plot points
-    ax.scatter(all_points[:, 0], all_points[:, 1], all_points[:, 2], 
-               c=all_points[:, 2], cmap='viridis', marker='o', s=10)
+    ax.scatter(x, y, t, c=t, cmap='viridis', marker='o', s=10, rasterized=True)
     
-    ax.set_title('3D K-Space Sampling Pattern (with Cardiac Phases)')
+    title = '3D K-Space Sampling Pattern (with Cardiac Phases)'
+    if len(keep) < n_total:
+        title += f'\n{len(keep)} of {n_total} points shown'
+    ax.set_title(title)
     ax.set_xlabel('Slice Encoding')
     ax.set_ylabel('Phase Encoding')
     ax.set_zlabel('Cardiac Phase')
@@ -115,3 +166,96 @@ def plot_3d_sampling_pattern(mask, n_cardiac_phases=1, filename=None):
         plt.show()
         
     return fig
+
+def acquisition_frames(sampling_order, shape, n_frames=10):
+    """
+    Render the acquisition order as an image stack.
+    
+    Parameters:
+    -----------
+    sampling_order : list or ndarray
+        (phase_idx, slice_idx, cardiac_phase) tuples in acquisition order
+    shape : tuple
+        Shape of the sampling mask (n_phase, n_slice)
+    n_frames : int, optional
+        Number of frames, evenly spaced in acquisition time
+        
+    Returns:
+    --------
+    frames : ndarray
+        (n_frames x n_phase x n_slice) number of acquisitions of every
+        k-space point up to the end of each frame
+    """
+    order = np.asarray(sampling_order, dtype=int).reshape(-1, 3)
+    frame = np.arange(len(order)) * n_frames // max(len(order), 1)
+    
+    counts = np.zeros((n_frames,) + tuple(shape), dtype=np.int32)
+    np.add.at(counts, (frame, order[:, 0], order[:, 1]), 1)
+    return np.cumsum(counts, axis=0)
+
+def plot_acquisition_order(sampling_order, shape, filename=None, n_frames=10, animate=False, dpi=150):
+    """
+    Plot the acquisition order over time.
+    
+    Parameters:
+    -----------
+    sampling_order : list or ndarray
+        (phase_idx, slice_idx, cardiac_phase) tuples in acquisition order
+    shape : tuple
+        Shape of the sampling mask (n_phase, n_slice)
+    filename : str, optional
+        Filename for saving the plot; an animation is saved as a GIF
+    n_frames : int, optional
+        Number of frames
+    animate : bool, optional
+        Return an animation instead of a grid of frames
+    dpi : int, optional
+        Resolution of the saved figure
+        
+    Returns:
+    --------
+    fig : Figure or FuncAnimation
+        Matplotlib figure, or the animation if animate is set
+    """
+    frames = acquisition_frames(sampling_order, shape, n_frames)
+    vmax = max(int(frames[-1].max()), 1)
+    
+    if animate:
+        from matplotlib.animation import FuncAnimation, PillowWriter
+        
+        fig, ax = plt.subplots(figsize=(8, 6))
+        im = ax.imshow(frames[0], cmap='viridis', origin='lower', vmin=0, vmax=vmax)
+        plt.colorbar(im, ax=ax, label='Acquisitions')
+        ax.set_xlabel('Slice Encoding')
+        ax.set_ylabel('Phase Encoding')
+        
+        def update(i):
+            im.set_data(frames[i])
+            ax.set_title(f'Acquisition Order ({i + 1}/{n_frames})')
+            return [im]
+        
+        anim = FuncAnimation(fig, update, frames=n_frames, interval=200, blit=False)
+        if filename:
+            anim.save(filename, writer=PillowWriter(fps=5))
+            plt.close(fig)
+        return anim
+    
+    n_cols = int(np.ceil(np.sqrt(n_frames)))
+    n_rows = int(np.ceil(n_frames / n_cols))
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(3 * n_cols, 3 * n_rows), squeeze=False)
+    for i, ax in enumerate(axes.flat):
+        if i < n_frames:
+            im = ax.imshow(frames[i], cmap='viridis', origin='lower', vmin=0, vmax=vmax)
+            ax.set_title(f'{(i + 1) * 100 // n_frames}% acquired')
+        ax.axis('off')
+    fig.colorbar(im, ax=axes, label='Acquisitions')
+    fig.suptitle('Acquisition Order')
+    
+    # Save or show the plot
+    if filename:
+        plt.savefig(filename, dpi=dpi, bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
+        
+    return fig
@@ -24,12 +24,191 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 
-def plot_sequence(seq, filename=None, time_range=None, plot_type='full'):
+GAMMA = 42.576e6  # Gyromagnetic ratio [Hz/T]
+
+def _block_durations(seq):
+    """Return the block durations of a sequence as an array."""
+    if hasattr(seq, 'block_durations'):
+        return np.asarray(seq.block_durations, dtype=float)
+    return np.asarray(seq.arr_block_durations, dtype=float)
+
+def _shape(seq, shape_id):
+    """Decompress a shape from the sequence shape library."""
+    from types import SimpleNamespace
+    from pypulseq.decompress_shape import decompress_shape
+    
+    data = np.asarray(seq.shape_library.data[shape_id], dtype=float)
+    return decompress_shape(SimpleNamespace(num_samples=data[0], data=data[1:]))
+
+def _minmax_envelope(t, v, t_start, t_end, n_pixels):
+    """
+    Per-pixel minimum and maximum of a piecewise-linear waveform.
+    
+    Between consecutive points the waveform is linear, so its extremes in
+    a pixel are reached either at a point inside the pixel or at a pixel
+    edge. Both are evaluated vectorized.
+    
+    Parameters:
+    -----------
+    t, v : ndarray
+        Time-sorted waveform points
+    t_start, t_end : float
+        Time window in seconds
+    n_pixels : int
+        Number of horizontal pixels
+        
+    Returns:
+    --------
+    edges : ndarray
+        Pixel edges in seconds (n_pixels + 1)
+    lo, hi : ndarray
+        Minimum and maximum of the waveform in every pixel
+    """
+    edges = np.linspace(t_start, t_end, n_pixels + 1)
+    if len(t) == 0:
+        zeros = np.zeros(n_pixels)
+        return edges, zeros, zeros
+    
+    edge_values = np.interp(edges, t, v, left=0, right=0)
+    lo = np.minimum(edge_values[:-1], edge_values[1:])
+    hi = np.maximum(edge_values[:-1], edge_values[1:])
+    
+    inside = (t >= t_start) & (t < t_end)
+    t, v = t[inside], v[inside]
+    if len(t):
+        pixel = np.minimum(((t - t_start) / (t_end - t_start) * n_pixels).astype(int), n_pixels - 1)
+        # Points are time-sorted, so every pixel is one contiguous segment
+        starts = np.flatnonzero(np.r_[True, pixel[1:] != pixel[:-1]])
+        segment_pixels = pixel[starts]
+        lo[segment_pixels] = np.minimum(lo[segment_pixels], np.minimum.reduceat(v, starts))
+        hi[segment_pixels] = np.maximum(hi[segment_pixels], np.maximum.reduceat(v, starts))
+    
+    return edges, lo, hi
+
+def _gradient_points(seq, block_starts, grad_ids):
+    """Waveform points of one gradient channel in Hz/m."""
+    t_parts, v_parts = [], []
+    for grad_id in np.unique(grad_ids):
+        starts = block_starts[grad_ids == grad_id]
+        data = seq.grad_library.data[grad_id]
+        if seq.grad_library.type[grad_id] == 't':
+            amplitude, rise, flat, fall, delay = data[:5]
+            t_shape = np.array([0, rise, rise + flat, rise + flat + fall]) + delay
+            v_shape = np.array([0, amplitude, amplitude, 0])
+        else:
+            amplitude, shape_id, delay = data[:3]
+            v_shape = amplitude * _shape(seq, int(shape_id))
+            t_shape = delay + (np.arange(len(v_shape)) + 0.5) * seq.grad_raster_time
+        t_parts.append((starts[:, None] + t_shape[None, :]).ravel())
+        v_parts.append(np.broadcast_to(v_shape, (len(starts), len(v_shape))).ravel())
+    return t_parts, v_parts
+
+def _rf_points(seq, block_starts, rf_ids, n_pixels, window):
+    """Waveform points of the RF magnitude in Hz."""
+    t_parts, v_parts = [], []
+    for rf_id in np.unique(rf_ids):
+        starts = block_starts[rf_ids == rf_id]
+        amplitude, mag_id, _, delay = seq.rf_library.data[rf_id][:4]
+        magnitude = amplitude * _shape(seq, int(mag_id))
+        duration = len(magnitude) * seq.rf_raster_time
+        if duration * n_pixels < window:
+            # Pulse narrower than a pixel: its support with the peak value
+            t_shape = np.array([0, 0, duration, duration]) + delay
+            v_shape = np.array([0, magnitude.max(), magnitude.max(), 0])
+        else:
+            t_shape = delay + (np.arange(len(magnitude)) + 0.5) * seq.rf_raster_time
+            v_shape = magnitude
+        t_parts.append((starts[:, None] + t_shape[None, :]).ravel())
+        v_parts.append(np.broadcast_to(v_shape, (len(starts), len(v_shape))).ravel())
+    return t_parts, v_parts
+
+def _adc_points(seq, block_starts, adc_ids):
+    """Sampling windows of the ADC as unit boxes."""
+    t_parts, v_parts = [], []
+    for adc_id in np.unique(adc_ids):
+        starts = block_starts[adc_ids == adc_id]
+        num_samples, dwell, delay = seq.adc_library.data[adc_id][:3]
+        t_shape = np.array([0, 0, num_samples * dwell, num_samples * dwell]) + delay
+        t_parts.append((starts[:, None] + t_shape[None, :]).ravel())
+        v_parts.append(np.tile([0, 1, 1, 0], len(starts)).astype(float))
+    return t_parts, v_parts
+
+def sequence_envelopes(seq, time_range=None, n_pixels=2000):
+    """
+    Compute decimated waveforms of a sequence.
+    
+    Only the blocks overlapping the time range are read from the block
+    table, and every channel is reduced to a per-pixel minimum and
+    maximum, so the cost scales with the number of events in the window
+    and the plotted size with n_pixels.
+    
+    Parameters:
+    -----------
+    seq : Sequence
+        Sequence object
+    time_range : tuple, optional
+        Time range (start, end) in seconds, whole sequence by default
+    n_pixels : int, optional
+        Number of horizontal pixels
+        
+    Returns:
+    --------
+    envelopes : dict
+        'edges' : pixel edges in seconds, and for 'RF' [uT], 'Gx', 'Gy',
+        'Gz' [mT/m] and 'ADC' a (lo, hi) tuple of per-pixel arrays
+    """
+    durations = _block_durations(seq)
+    block_edges = np.concatenate([[0], np.cumsum(durations)])
+    
+    if time_range is None:
+        t_start, t_end = 0, block_edges[-1]
+    else:
+        t_start, t_end = time_range
+    
+    # Blocks overlapping the window
+    first = max(np.searchsorted(block_edges, t_start, side='right') - 1, 0)
+    last = np.searchsorted(block_edges, t_end, side='left')
+    block_starts = block_edges[first:last]
+    if last > first:
+        events = np.stack([seq.dict_block_events[i + 1] for i in range(first, last)])
+    else:
+        events = np.zeros((0, 7), dtype=int)
+    
+    envelopes = {}
+    channels = [('RF', 1, 1e6 / GAMMA), ('Gx', 2, 1e3 / GAMMA), ('Gy', 3, 1e3 / GAMMA),
+                ('Gz', 4, 1e3 / GAMMA), ('ADC', 5, 1)]
+    for name, column, scale in channels:
+        ids = events[:, column]
+        used = ids > 0
+        if name == 'RF':
+            t_parts, v_parts = _rf_points(seq, block_starts[used], ids[used], n_pixels, t_end - t_start)
+        elif name == 'ADC':
+            t_parts, v_parts = _adc_points(seq, block_starts[used], ids[used])
+        else:
+            t_parts, v_parts = _gradient_points(seq, block_starts[used], ids[used])
+        
+        if t_parts:
+            t = np.concatenate(t_parts)
+            v = np.concatenate(v_parts) * scale
+            order = np.argsort(t, kind='stable')
+            t, v = t[order], v[order]
+        else:
+            t = v = np.zeros(0)
+        
+        edges, lo, hi = _minmax_envelope(t, v, t_start, t_end, n_pixels)
+        envelopes[name] = (lo, hi)
+    envelopes['edges'] = edges
+    
+    return envelopes
+
+def plot_sequence(seq, filename=None, time_range=None, plot_type='full', n_pixels=2000, dpi=300):
     """
     Plot the sequence diagram.
     
+    Waveforms are drawn as per-pixel min/max envelopes (see
+    sequence_envelopes), so any window renders in roughly constant time.
+    
     Parameters:
     -----------
     seq : Sequence
@@ -40,29 +219,18 @@ def plot_sequence(seq, filename=None, time_range=None, plot_type='full'):
         Time range to plot (start, end) in seconds
     plot_type : str, optional
         Type of plot ('full', 'compact', or 'kspace')
+    n_pixels : int, optional
+        Horizontal resolution of the decimated waveforms
+    dpi : int, optional
+        Resolution of the saved figure
         
     Returns:
     --------
     fig : Figure
         Matplotlib figure object
     """
-    # Get sequence timing
-    if hasattr(seq, 'block_durations'):
-        block_durations = seq.block_durations
-    else:
-        block_durations = []
-        for block in seq.blocks:
-            block_durations.append(block.block_duration)
-    
-    # Calculate cumulative durations
-    cum_durations = np.cumsum([0] + block_durations)
-    
-    # Set time range
-    if time_range is None:
-        t_start = 0
-        t_end = cum_durations[-1]
-    else:
-        t_start, t_end = time_range
+    envelopes = sequence_envelopes(seq, time_range, n_pixels)
+    edges = envelopes['edges']
     
     # Create figure
     fig, axes = plt.subplots(5, 1, figsize=(12, 8), sharex=True)
@@ -70,18 +238,17 @@ def plot_sequence(seq, filename=None, time_range=None, plot_type='full'):
     
     # Plot RF, Gx, Gy, Gz, ADC
     labels = ['RF', 'Gx', 'Gy', 'Gz', 'ADC']
+    units = ['RF (uT)', 'Gx (mT/m)', 'Gy (mT/m)', 'Gz (mT/m)', 'ADC']
     
-    for i, ax in enumerate(axes):
-        ax.set_ylabel(labels[i])
+    for ax, label, unit in zip(axes, labels, units):
+        lo, hi = envelopes[label]
+        # Both ends of every pixel so single-pixel events stay visible
+        ax.fill_between(edges, np.r_[lo, lo[-1]], np.r_[hi, hi[-1]], step='post', linewidth=0.5)
+        ax.set_ylabel(unit)
         ax.grid(True)
-        
-        if i < 4:  # RF and gradients
-            ax.set_ylim(-1.1, 1.1)
-        else:  # ADC
-            ax.set_ylim(-0.1, 1.1)
             
     # Set x-axis limits
-    axes[-1].set_xlim(t_start, t_end)
+    axes[-1].set_xlim(edges[0], edges[-1])
     axes[-1].set_xlabel('Time (s)')
     
     # Add title
@@ -89,7 +256,7 @@ def plot_sequence(seq, filename=None, time_range=None, plot_type='full'):
     
     # Save or show the plot
     if filename:
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
+        plt.savefig(filename, dpi=dpi, bbox_inches='tight')
         plt.close()
     else:
         plt.tight_layout()